@@ -0,0 +1,52 @@
+import os
+
+from decoding_policy import get_decoding_policy
+
+# Penjadwalan batch OCR: crop baris dikelompokkan (bucket) menurut budget
+# token dari DecodingPolicy (turunan rasio lebar/tinggi) sebelum dipotong
+# per batch, supaya kata pendek tidak satu batch dengan kalimat selebar
+# halaman. Decoder satu batch berjalan sampai anggota terpanjang selesai,
+# jadi batch campuran membuang langkah decode untuk token padding.
+# Set OCR_BUCKETING=0 untuk batch urut input seperti sebelumnya.
+OCR_BUCKETING = os.getenv("OCR_BUCKETING", "1") != "0"
+# Lebar satu bucket dalam satuan token budget
+OCR_BUCKET_TOKENS = int(os.getenv("OCR_BUCKET_TOKENS", "4"))
+
+def aspect_ratio(size):
+    width, height = size
+    return width / max(1, height)
+
+def bucket_of(size, policy=None, bucket_tokens=OCR_BUCKET_TOKENS):
+    """Nomor bucket crop berukuran `size` = `(width, height)`."""
+    policy = policy or get_decoding_policy()
+    return policy.token_budget(*size) // max(1, bucket_tokens)
+
+def plan_batches(sizes, batch_size, policy=None, bucketing=OCR_BUCKETING, bucket_tokens=OCR_BUCKET_TOKENS):
+    """
+    Membagi crop berukuran `sizes` (list `(width, height)`) menjadi batch
+    berisi paling banyak `batch_size` indeks. Crop diurutkan menurut bucket
+    budget token lalu rasio lebar/tinggi, dan batch baru dimulai saat
+    bucket berganti. Batch yang belum setengah penuh tetap diisi dari
+    bucket berikutnya supaya jumlah panggilan model tidak membengkak.
+
+    Tanpa `bucketing`, batch mengikuti urutan input.
+    """
+    indices = list(range(len(sizes)))
+    if not bucketing:
+        return [indices[start:start + batch_size] for start in range(0, len(indices), batch_size)]
+
+    policy = policy or get_decoding_policy()
+    buckets = [bucket_of(size, policy, bucket_tokens) for size in sizes]
+    indices.sort(key=lambda i: (buckets[i], aspect_ratio(sizes[i])))
+
+    batches = []
+    current = []
+    for i in indices:
+        if current and (len(current) >= batch_size
+                        or (buckets[i] != buckets[current[-1]] and len(current) * 2 >= batch_size)):
+            batches.append(current)
+            current = []
+        current.append(i)
+    if current:
+        batches.append(current)
+    return batches
@@ -0,0 +1,120 @@
+"""
+Micro-benchmark `segment_lines_with_contours` versi vektor vs versi lama
+(per-kontur, kuadratik) pada halaman sintetis yang berisik, plus cek hasil
+identik pada sampel PDF di `files/`.
+
+    python bench_line_segmentation.py
+    python bench_line_segmentation.py --pdf-dir files --repeat 20
+"""
+import argparse
+import glob
+import os
+import time
+import cv2
+import numpy as np
+
+from ocr_processing import segment_lines_with_contours, remove_horizontal_lines_morphological, deskew_image_hough
+
+
+def segment_lines_legacy(binary_image, min_w=5, min_h=5):
+    """Implementasi lama, disimpan hanya sebagai referensi benchmark."""
+    contours, _ = cv2.findContours(binary_image.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    initial_boxes = sorted(
+        [cv2.boundingRect(c) for c in contours if cv2.boundingRect(c)[2] > min_w and cv2.boundingRect(c)[3] > min_h],
+        key=lambda b: b[1]
+    )
+    if not initial_boxes:
+        return []
+
+    lines = []
+    current_line_group = [initial_boxes[0]]
+    for box in initial_boxes[1:]:
+        min_y_in_group = min(b[1] for b in current_line_group)
+        max_y_in_group = max(b[1] + b[3] for b in current_line_group)
+        current_box_center_y = box[1] + box[3] / 2
+        if min_y_in_group <= current_box_center_y <= max_y_in_group:
+            current_line_group.append(box)
+        else:
+            lines.append(current_line_group)
+            current_line_group = [box]
+    lines.append(current_line_group)
+
+    final_line_rois = []
+    for line_group in lines:
+        min_x = min(b[0] for b in line_group)
+        min_y = min(b[1] for b in line_group)
+        max_x = max(b[0] + b[2] for b in line_group)
+        max_y = max(b[1] + b[3] for b in line_group)
+        width = max_x - min_x
+        if len(line_group) >= 2 or width >= 40:
+            final_line_rois.append((min_x, min_y, width, max_y - min_y))
+    final_line_rois.sort(key=lambda r: r[1])
+    return final_line_rois
+
+
+def noisy_page(height=2400, width=2000, n_specks=20000, n_lines=40, seed=0):
+    """Halaman biner sintetis: baris 'tulisan' + bintik noise acak."""
+    rng = np.random.default_rng(seed)
+    page = np.zeros((height, width), np.uint8)
+    line_h = height // (n_lines + 1)
+    for i in range(n_lines):
+        y = (i + 1) * line_h
+        x = 50
+        while x < width - 100:
+            w, h = rng.integers(8, 40), rng.integers(15, line_h // 2)
+            cv2.rectangle(page, (int(x), int(y - h)), (int(x + w), int(y)), 255, -1)
+            x += w + rng.integers(4, 30)
+    ys, xs = rng.integers(0, height, n_specks), rng.integers(0, width, n_specks)
+    sizes = rng.integers(2, 9, n_specks)
+    for x, y, s in zip(xs, ys, sizes):
+        page[y:y + s, x:x + s] = 255
+    return page
+
+
+def timeit(fn, arg, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(arg)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def pdf_binaries(pdf_dir):
+    from image_processing import correct_perspective, detect_answer_boxes
+    from pdf_processing import iter_pdf_pages
+
+    for pdf_path in sorted(glob.glob(os.path.join(pdf_dir, "*.pdf"))):
+        for page_number, image in iter_pdf_pages(pdf_path):
+            for box_idx, crop in enumerate(detect_answer_boxes(correct_perspective(image), max_boxes=2)):
+                name = f"{os.path.basename(pdf_path)} p{page_number+1} box{box_idx}"
+                yield name, remove_horizontal_lines_morphological(deskew_image_hough(crop))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf-dir", default="files")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--specks", type=int, nargs="+", default=[2000, 10000, 40000])
+    args = parser.parse_args()
+
+    print(f"{'specks':>8} {'boxes':>7} {'legacy (ms)':>12} {'vector (ms)':>12} {'speedup':>8}")
+    for n_specks in args.specks:
+        page = noisy_page(n_specks=n_specks)
+        assert segment_lines_with_contours(page) == segment_lines_legacy(page), "hasil berbeda!"
+        n_boxes = len(cv2.findContours(page, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[0])
+        legacy = timeit(segment_lines_legacy, page, args.repeat)
+        vector = timeit(segment_lines_with_contours, page, args.repeat)
+        print(f"{n_specks:>8} {n_boxes:>7} {legacy*1000:>12.1f} {vector*1000:>12.1f} {legacy/vector:>7.1f}x")
+
+    if os.path.isdir(args.pdf_dir):
+        mismatches = 0
+        for name, binary in pdf_binaries(args.pdf_dir):
+            if segment_lines_with_contours(binary) != segment_lines_legacy(binary):
+                mismatches += 1
+                print(f"❌ Hasil berbeda pada {name}")
+        print(f"✅ Sampel PDF: {mismatches} perbedaan" if not mismatches else f"⚠️ Sampel PDF: {mismatches} perbedaan")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""
+Benchmark pipeline OCR end-to-end (alur `main.process_pdf`) pada sampel PDF:
+wall time per tahap (rasterize, perspective, boxes, deskew, line_removal,
+segmentation, ocr), counter (kontur, kotak, baris, panggilan model, token),
+pages/sec, lines/sec, peak RSS, dan CER jika ground truth `<nama_pdf>.txt`
+ada di folder yang sama.
+
+Hasil dicetak sebagai tabel dan bisa disimpan sebagai JSON; dengan
+`--baseline`, hasil dibandingkan dengan JSON dari versi/engine sebelumnya
+dan exit code 1 jika ada tahap yang melambat melebihi `--tolerance`.
+
+    python bench_ocr_pipeline.py --json bench.json
+    python bench_ocr_pipeline.py files/test6.pdf --engine onnx --fast-layout
+    python bench_ocr_pipeline.py --no-ocr --baseline bench.json
+
+Dengan `--memory`, peak memori (buffer numpy/OpenCV, via tracemalloc) per
+tahap ikut diukur; `--memory-limit` menguji batas OCR_JOB_MEMORY_MB dan
+`--low-memory` menjalankan mode OCR_LOW_MEMORY.
+
+    python bench_ocr_pipeline.py --no-ocr --memory --low-memory
+
+Efisiensi batch OCR dilaporkan sebagai token per batch dan padding waste
+(fraksi langkah decode untuk token padding); `--no-bucketing` mematikan
+bucket rasio/budget token (OCR_BUCKETING=0) sebagai pembanding.
+
+    python bench_ocr_pipeline.py --json bucketed.json
+    python bench_ocr_pipeline.py --no-bucketing --baseline bucketed.json
+
+Cache OCR dimatikan kecuali `--use-cache`. Waktu "rasterize" termasuk render
+di thread prefetch, yang berjalan paralel dengan tahap lain; sisa waktu yang
+tidak masuk tahap mana pun dilaporkan sebagai "other". Peak RSS adalah
+puncak proses sejauh ini (kumulatif antar PDF dalam satu run).
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+
+def peak_rss_mb():
+    """Peak RSS proses ini sejauh ini (MiB)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 if sys.platform != "darwin" else peak / (1024 * 1024)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__)), text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def collect_pdf_paths(paths):
+    pdf_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            pdf_paths.extend(sorted(glob.glob(os.path.join(path, "*.pdf"))))
+        else:
+            pdf_paths.append(path)
+    return pdf_paths
+
+
+def preprocess_pdf(pdf_path, layout_dpi=None, template=None):
+    """Seperti `process_pdf` tanpa OCR: mengembalikan `(jumlah halaman, jumlah baris)`."""
+    from main import iter_page_sources
+    from ocr_processing import extract_line_crops
+    from text_layer import iter_text_layer_pages, text_layer_pages
+
+    n_pages = n_lines = 0
+    text_pages = text_layer_pages(pdf_path)
+    for _, boxes_lines in iter_text_layer_pages(pdf_path, text_pages, max_boxes=2, template=template):
+        n_pages += 1
+        n_lines += sum(len(lines) for lines in boxes_lines)
+    for _, _, find_boxes in iter_page_sources(pdf_path, max_boxes=2, layout_dpi=layout_dpi, template=template,
+                                              skip_pages=text_pages):
+        crops, skew_angle = find_boxes()
+        n_pages += 1
+        n_lines += sum(len(extract_line_crops(crop, page_angle=skew_angle) or []) for crop in crops)
+    return n_pages, n_lines
+
+
+def bench_pdf(pdf_path, args, template=None):
+    from main import process_pdf
+    from pdf_processing import LAYOUT_DPI
+    from instrumentation import STAGES, batch_stats, trace
+    from text_metrics import character_error_rate
+
+    layout_dpi = LAYOUT_DPI if args.fast_layout else None
+    text = None
+    start = time.perf_counter()
+    with trace(memory=args.memory, memory_limit_mb=args.memory_limit, pdf=pdf_path) as job_trace:
+        if args.no_ocr:
+            n_pages, n_lines = preprocess_pdf(pdf_path, layout_dpi=layout_dpi, template=template)
+        else:
+            page_meta = []
+            text = process_pdf(pdf_path, layout_dpi=layout_dpi, engine=args.engine, model_name=args.model,
+                               page_meta=page_meta, template=template)
+            n_pages, n_lines = len(page_meta), sum(meta["lines"] for meta in page_meta)
+    wall = time.perf_counter() - start
+
+    recorded = job_trace.as_dict()
+    stage_s = {name: round(recorded["stages"].get(name, {}).get("s", 0.0), 4) for name in STAGES}
+    result = {
+        "pdf": pdf_path,
+        "pages": n_pages,
+        "lines": n_lines,
+        "wall_s": round(wall, 4),
+        "pages_per_s": round(n_pages / wall, 3) if wall else None,
+        "lines_per_s": round(n_lines / wall, 3) if wall else None,
+        "stages_s": stage_s,
+        # Render prefetch berjalan paralel, jadi tidak dikurangkan dari sisa waktu
+        "other_s": round(max(0.0, wall - sum(v for k, v in stage_s.items() if k != "rasterize")), 4),
+        "counters": recorded["counters"],
+        "batching": batch_stats(recorded["counters"]),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "memory": recorded.get("memory"),
+        "cer": None,
+    }
+
+    truth_path = os.path.splitext(pdf_path)[0] + ".txt"
+    if text is not None and os.path.exists(truth_path):
+        with open(truth_path, encoding="utf-8") as f:
+            result["cer"] = round(character_error_rate(text, f.read()), 4)
+    return result
+
+
+def summarize(results, stage_names):
+    from instrumentation import batch_stats
+
+    counters = {name: sum(r["counters"].get(name, 0) for r in results)
+                for name in sorted({name for r in results for name in r["counters"]})}
+    wall = sum(r["wall_s"] for r in results)
+    pages = sum(r["pages"] for r in results)
+    lines = sum(r["lines"] for r in results)
+    cers = [r["cer"] for r in results if r["cer"] is not None]
+    return {
+        "pdfs": len(results),
+        "pages": pages,
+        "lines": lines,
+        "wall_s": round(wall, 4),
+        "pages_per_s": round(pages / wall, 3) if wall else None,
+        "lines_per_s": round(lines / wall, 3) if wall else None,
+        "stages_s": {name: round(sum(r["stages_s"][name] for r in results), 4) for name in stage_names},
+        "other_s": round(sum(r["other_s"] for r in results), 4),
+        "counters": counters,
+        "batching": batch_stats(counters),
+        "peak_rss_mb": max((r["peak_rss_mb"] for r in results), default=None),
+        "memory": summarize_memory([r["memory"] for r in results if r.get("memory")]),
+        "cer": round(sum(cers) / len(cers), 4) if cers else None,
+    }
+
+
+def summarize_memory(memories):
+    """Peak memori terbesar (job dan per tahap) dari beberapa PDF."""
+    if not memories:
+        return None
+    names = sorted({name for memory in memories for name in memory["stages"]})
+    return {
+        "limit_mb": memories[0]["limit_mb"],
+        "peak_mb": max(memory["peak_mb"] for memory in memories),
+        "stages": {name: max(memory["stages"].get(name, 0.0) for memory in memories) for name in names},
+    }
+
+
+def compare_with_baseline(report, baseline, tolerance):
+    """Mencetak perbandingan dengan baseline; mengembalikan daftar regresi."""
+    regressions = []
+    current, previous = report["total"], baseline["total"]
+    if sorted(r["pdf"] for r in report["pdfs"]) != sorted(r["pdf"] for r in baseline["pdfs"]):
+        print("⚠️ Daftar PDF berbeda dengan baseline; perbandingan total tidak sebanding.")
+    if report["config"] != baseline["config"]:
+        changed = sorted(k for k in report["config"] if report["config"][k] != baseline["config"].get(k))
+        print(f"[INFO] Konfigurasi berbeda dengan baseline: {', '.join(changed)}")
+    rows = [(f"stage:{name}", current["stages_s"].get(name), previous["stages_s"].get(name))
+            for name in current["stages_s"]]
+    rows += [("wall_s", current["wall_s"], previous["wall_s"]), ("peak_rss_mb", current["peak_rss_mb"], previous["peak_rss_mb"])]
+    if current.get("memory") and previous.get("memory"):
+        rows.append(("peak_mem_mb", current["memory"]["peak_mb"], previous["memory"]["peak_mb"]))
+    if current.get("batching") and previous.get("batching"):
+        rows.append(("padding_waste", current["batching"]["padding_waste"], previous["batching"]["padding_waste"]))
+
+    print(f"\n{'metrik':<22} {'baseline':>10} {'sekarang':>10} {'rasio':>7}")
+    for name, now, before in rows:
+        if not now or not before:
+            continue
+        ratio = now / before
+        flag = ""
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+            flag = "  ⚠️"
+        print(f"{name:<22} {before:>10} {now:>10} {ratio:>6.2f}x{flag}")
+
+    if current.get("cer") is not None and previous.get("cer") is not None:
+        print(f"{'cer':<22} {previous['cer']:>10} {current['cer']:>10}")
+        if current["cer"] > previous["cer"] + 0.005:
+            regressions.append("cer")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", default=["files"], help="file PDF atau folder berisi PDF")
+    parser.add_argument("--engine", choices=["torch", "onnx"], default=None)
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--fast-layout", action="store_true", help="analisis layout di LAYOUT_DPI")
+    parser.add_argument("--template", metavar="PATH", default=None, help="template lembar jawaban (.npz)")
+    parser.add_argument("--no-ocr", action="store_true", help="hanya preprocessing (tanpa model OCR)")
+    parser.add_argument("--use-cache", action="store_true", help="jangan matikan cache OCR (OCR_CACHE_DIR)")
+    parser.add_argument("--memory", action="store_true", help="ukur peak memori per tahap (tracemalloc)")
+    parser.add_argument("--memory-limit", type=int, default=0, metavar="MB",
+                        help="batas memori per PDF seperti OCR_JOB_MEMORY_MB (mengaktifkan --memory)")
+    parser.add_argument("--low-memory", action="store_true", help="mode hemat memori (OCR_LOW_MEMORY=1)")
+    parser.add_argument("--no-bucketing", action="store_true", help="batch OCR urut input (OCR_BUCKETING=0)")
+    parser.add_argument("--json", default=None, help="simpan hasil benchmark ke file JSON")
+    parser.add_argument("--baseline", default=None, help="JSON hasil benchmark sebelumnya untuk dibandingkan")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="batas perlambatan relatif sebelum dianggap regresi (default 0.2 = 20%%)")
+    args = parser.parse_args()
+
+    if not args.use_cache:
+        os.environ["OCR_CACHE_DIR"] = ""  # harus sebelum ocr_cache di-import
+    if args.low_memory:
+        os.environ["OCR_LOW_MEMORY"] = "1"  # harus sebelum pdf_processing di-import
+    if args.no_bucketing:
+        os.environ["OCR_BUCKETING"] = "0"  # harus sebelum batch_scheduler di-import
+
+    from model_registry import DEFAULT_OCR_MODEL, OCR_ENGINE, warmup
+    from sheet_template import SheetTemplate
+    from instrumentation import STAGES
+
+    args.engine = args.engine or OCR_ENGINE
+    args.model = args.model or DEFAULT_OCR_MODEL
+    template = SheetTemplate.load(args.template) if args.template else None
+
+    pdf_paths = collect_pdf_paths(args.paths)
+    if not pdf_paths:
+        parser.error("tidak ada PDF yang ditemukan")
+
+    load_s = None
+    if not args.no_ocr:
+        # Load model di luar pengukuran tahap "ocr"
+        start = time.perf_counter()
+        warmup(model_name=args.model, engine=args.engine)
+        load_s = round(time.perf_counter() - start, 2)
+
+    results = []
+    for pdf_path in pdf_paths:
+        print(f"[INFO] Benchmark {pdf_path}...")
+        results.append(bench_pdf(pdf_path, args, template=template))
+
+    report = {
+        "revision": git_revision(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": {
+            "engine": None if args.no_ocr else args.engine,
+            "model": None if args.no_ocr else args.model,
+            "fast_layout": args.fast_layout,
+            "template": args.template,
+            "ocr": not args.no_ocr,
+            "cache": args.use_cache,
+            "low_memory": args.low_memory,
+            "bucketing": not args.no_bucketing,
+            "memory_limit_mb": args.memory_limit or None,
+            "model_load_s": load_s,
+        },
+        "pdfs": results,
+        "total": summarize(results, STAGES),
+    }
+
+    header = f"{'pdf':<14} {'hal':>4} {'baris':>6} {'wall(s)':>8} " + " ".join(f"{name[:9]:>9}" for name in STAGES)
+    print("\n" + header + f" {'rss(MB)':>8} {'CER':>7}")
+    for r in results + [{**report["total"], "pdf": "TOTAL"}]:
+        print(f"{os.path.basename(r['pdf']):<14} {r['pages']:>4} {r['lines']:>6} {r['wall_s']:>8.2f} "
+              + " ".join(f"{r['stages_s'][name]:>9.3f}" for name in STAGES)
+              + f" {r['peak_rss_mb']!s:>8} {r['cer']!s:>7}")
+    total = report["total"]
+    print(f"\n{total['pages_per_s']} halaman/s, {total['lines_per_s']} baris/s, peak RSS {total['peak_rss_mb']} MB")
+    print("Counter: " + ", ".join(f"{name}={n}" for name, n in total["counters"].items()))
+    if total["batching"]:
+        print(f"Batch OCR: {total['batching']['tokens_per_batch']} token/batch, "
+              f"padding waste {total['batching']['padding_waste']:.1%}")
+    if total["memory"]:
+        print("Peak memori (MiB): " + ", ".join(
+            [f"job={total['memory']['peak_mb']}"]
+            + [f"{name}={total['memory']['stages'][name]}" for name in STAGES if name in total["memory"]["stages"]]))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"[INFO] Hasil disimpan ke {args.json}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare_with_baseline(report, json.load(f), args.tolerance)
+        if regressions:
+            print(f"⚠️ Regresi: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
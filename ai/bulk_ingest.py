@@ -0,0 +1,446 @@
+"""
+Ingest massal scan satu kelas: folder atau ZIP berisi satu PDF per siswa.
+
+Pipeline dibagi menjadi tahap yang berjalan bersamaan, masing-masing dengan
+jumlah worker (thread) sendiri dan dihubungkan antrian berukuran terbatas:
+
+    rasterize -> preprocess -> boxes -> ocr
+
+- rasterize: render halaman 300 DPI (halaman dengan text layer langsung
+  diekstrak di sini, lihat `text_layer`)
+- preprocess: registrasi template atau koreksi perspektif + sudut halaman
+- boxes: deteksi/crop kotak jawaban + segmentasi baris
+- ocr: TrOCR; baris dari beberapa halaman (juga lintas PDF) digabung
+  sampai OCR_BATCH_SIZE sebelum dikirim ke model
+
+Karena OpenCV, PyMuPDF, dan torch melepas GIL selama komputasi, thread
+cukup untuk membuat tahap-tahap ini benar-benar paralel; throughput
+dibatasi tahap paling lambat, bukan jumlah waktu semua tahap per file.
+Antrian terbatas menjaga jumlah halaman yang ada di memori.
+
+Hasil per file (siswa) dihasilkan begitu semua halamannya selesai:
+
+    {"pdf", "student", "status": "done"|"failed", "error", "pages":
+     [{"page", "source", "boxes": [box_result, ...]}], "text", "seconds"}
+
+dengan `box_result` seperti `main.ocr_pdf` (teks, baris, bbox, confidence).
+
+    python bulk_ingest.py scans/kelas-7a.zip --out hasil/kelas-7a
+    python bulk_ingest.py scans/kelas-7a/ --template templates/uts.npz --ocr-workers 2
+"""
+import argparse
+import json
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+import traceback
+import zipfile
+
+from deskew import estimate_skew_angle
+from image_processing import correct_perspective, crop_answer_boxes, detect_answer_boxes
+from main import box_result, result_text
+from model_registry import DEFAULT_OCR_MODEL, OCR_ENGINE
+from ocr_cache import get_ocr_cache
+from ocr_processing import OCR_BATCH_SIZE, extract_line_crops, ocr_pages_line_results
+from page_context import PageContext
+from pdf_processing import iter_pdf_pages
+from text_layer import iter_text_layer_pages, text_layer_pages
+from instrumentation import count
+
+# Jumlah worker per tahap dan kapasitas antrian antar tahap (dalam halaman)
+OCR_BULK_RASTER_WORKERS = int(os.getenv("OCR_BULK_RASTER_WORKERS", "1"))
+OCR_BULK_PREPROCESS_WORKERS = int(os.getenv("OCR_BULK_PREPROCESS_WORKERS", "2"))
+OCR_BULK_BOX_WORKERS = int(os.getenv("OCR_BULK_BOX_WORKERS", "2"))
+OCR_BULK_OCR_WORKERS = int(os.getenv("OCR_BULK_OCR_WORKERS", "1"))
+OCR_BULK_QUEUE_SIZE = int(os.getenv("OCR_BULK_QUEUE_SIZE", "4"))
+
+STAGE_NAMES = ("rasterize", "preprocess", "boxes", "ocr")
+
+_DONE = object()
+
+
+# ========================================================================
+#  INPUT: FOLDER ATAU ZIP
+# ========================================================================
+def collect_pdfs(source, extract_dir=None):
+    """
+    Daftar path PDF (terurut) dari folder (rekursif) atau file ZIP. Isi ZIP
+    diekstrak ke `extract_dir`; hanya file .pdf yang diambil, dengan nama
+    file saja (path di dalam ZIP tidak dipakai, jadi aman dari "../").
+    """
+    if os.path.isdir(source):
+        return sorted(
+            os.path.join(root, name)
+            for root, _, names in os.walk(source)
+            for name in names if name.lower().endswith(".pdf")
+        )
+
+    if not zipfile.is_zipfile(source):
+        raise ValueError(f"Sumber harus folder atau file ZIP: {source}")
+    if extract_dir is None:
+        raise ValueError("extract_dir wajib diisi untuk sumber ZIP")
+
+    pdf_paths, used = [], set()
+    with zipfile.ZipFile(source) as archive:
+        for info in sorted(archive.infolist(), key=lambda i: i.filename):
+            name = os.path.basename(info.filename)
+            if info.is_dir() or not name.lower().endswith(".pdf") or info.filename.startswith("__MACOSX/"):
+                continue
+            stem, ext = os.path.splitext(name)
+            unique, n = name, 1
+            while unique in used:
+                n += 1
+                unique = f"{stem}_{n}{ext}"
+            used.add(unique)
+            path = os.path.join(extract_dir, unique)
+            with archive.open(info) as src, open(path, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            pdf_paths.append(path)
+    return pdf_paths
+
+
+# ========================================================================
+#  PIPELINE
+# ========================================================================
+class _Stage:
+    """
+    Satu tahap pipeline: `workers` thread mengambil item dari `inbox`,
+    memanggil `fn(item)` (generator item untuk tahap berikutnya), dan
+    meneruskan hasilnya ke `outbox`. Worker terakhir yang selesai mengirim
+    sinyal selesai ke semua worker tahap berikutnya. `fn` yang mengambil
+    item tambahan sendiri dari `inbox` melaporkannya lewat `add_items`.
+    """
+
+    def __init__(self, name, fn, workers, inbox, outbox, on_error):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.inbox = inbox
+        self.outbox = outbox
+        self.on_error = on_error
+        self.next_workers = 1
+        self.busy = 0.0
+        self.items = 0
+        self._alive = self.workers
+        self._lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._run, name=f"bulk-{name}-{i}", daemon=True)
+                         for i in range(self.workers)]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def add_items(self, n):
+        with self._lock:
+            self.items += n
+
+    def _run(self):
+        try:
+            while True:
+                item = self.inbox.get()
+                if item is _DONE:
+                    break
+                start = time.perf_counter()
+                try:
+                    for out in self.fn(item):
+                        # Waktu menunggu antrian penuh bukan waktu kerja tahap ini
+                        busy = time.perf_counter() - start
+                        self.outbox.put(out)
+                        start = time.perf_counter() - busy
+                except Exception as e:
+                    self.on_error(item, e)
+                with self._lock:
+                    self.busy += time.perf_counter() - start
+                    self.items += 1
+        finally:
+            with self._lock:
+                self._alive -= 1
+                last = self._alive == 0
+            if last and self.outbox is not None:
+                for _ in range(self.next_workers):
+                    self.outbox.put(_DONE)
+
+
+class _FileState:
+    def __init__(self, index, pdf_path):
+        self.index = index
+        self.pdf_path = pdf_path
+        self.started = None   # saat mulai dirasterisasi
+        self.expected = None  # jumlah halaman, diketahui setelah rasterisasi selesai
+        self.pages = {}
+        self.error = None
+
+
+class BulkIngestPipeline:
+    """
+    Pipeline ingest massal (lihat docstring modul). `run(pdf_paths)` adalah
+    generator hasil per file dalam urutan selesai; `stage_stats()` berisi
+    waktu kerja dan utilisasi tiap tahap untuk mencari bottleneck.
+    """
+
+    def __init__(self, template=None, max_boxes=2, model_name=DEFAULT_OCR_MODEL, engine=OCR_ENGINE, cache=None,
+                 raster_workers=OCR_BULK_RASTER_WORKERS, preprocess_workers=OCR_BULK_PREPROCESS_WORKERS,
+                 box_workers=OCR_BULK_BOX_WORKERS, ocr_workers=OCR_BULK_OCR_WORKERS,
+                 queue_size=OCR_BULK_QUEUE_SIZE, batch_size=OCR_BATCH_SIZE):
+        self.template = template
+        self.max_boxes = max_boxes
+        self.model_name = model_name
+        self.engine = engine
+        self.cache = cache or get_ocr_cache()
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.workers = dict(zip(STAGE_NAMES, (raster_workers, preprocess_workers, box_workers, ocr_workers)))
+        self.stages = {}
+        self.wall = None
+
+    # --- tahap ------------------------------------------------------------
+    def _rasterize(self, item):
+        file_id, pdf_path = item
+        # File yang dibatalkan (konsumen berhenti) tidak perlu dibuka sama sekali
+        if file_id in self._failed:
+            return
+        self._results.put(("started", file_id, time.perf_counter()))
+        text_pages = text_layer_pages(pdf_path)
+        n_pages = 0
+        for page_number, boxes_lines in iter_text_layer_pages(pdf_path, text_pages, max_boxes=self.max_boxes,
+                                                              template=self.template):
+            if file_id in self._failed:
+                return
+            n_pages += 1
+            boxes = [box_result(box_idx, [(text, 1.0) for text, _ in lines], [bbox for _, bbox in lines])
+                     for box_idx, lines in enumerate(boxes_lines)]
+            self._results.put(("page", file_id, page_number, "text_layer", boxes))
+        for page_number, image in iter_pdf_pages(pdf_path, prefetch=0, skip_pages=text_pages):
+            if file_id in self._failed:
+                return
+            n_pages += 1
+            count("pages")
+            yield file_id, page_number, image
+        self._results.put(("pages", file_id, n_pages))
+
+    def _preprocess(self, item):
+        file_id, page_number, image = item
+        if file_id in self._failed:
+            return
+        layout = self.template.layout_for(image, page_number) if self.template else None
+        if layout is not None:
+            yield file_id, page_number, crop_answer_boxes(image, layout), layout["skew"]
+            return
+        page = correct_perspective(PageContext(image))
+        yield file_id, page_number, page, estimate_skew_angle(page, min_line_length=100)
+
+    def _boxes(self, item):
+        file_id, page_number, page_or_crops, skew_angle = item
+        if file_id in self._failed:
+            return
+        crops = page_or_crops
+        if isinstance(page_or_crops, PageContext):
+            crops = detect_answer_boxes(page_or_crops, max_boxes=self.max_boxes, visualize=False)
+        boxes_lines, line_bboxes = [], []
+        for crop in crops:
+            meta = {}
+            boxes_lines.append(extract_line_crops(crop, page_angle=skew_angle, meta=meta) or [])
+            line_bboxes.append(meta.get("line_bboxes", []))
+        yield file_id, page_number, boxes_lines, line_bboxes
+
+    def _ocr(self, item):
+        # Ambil halaman lain yang sudah antre (tanpa menunggu) sampai satu
+        # batch model terisi, supaya halaman dengan sedikit baris tidak
+        # membuat batch kecil-kecil.
+        batch = [item]
+        n_lines = sum(len(lines) for lines in item[2])
+        while n_lines < self.batch_size:
+            try:
+                extra = self._ocr_inbox.get_nowait()
+            except queue.Empty:
+                break
+            if extra is _DONE:
+                self._ocr_inbox.put(_DONE)  # dikembalikan untuk worker OCR yang sedang berjalan
+                break
+            batch.append(extra)
+            n_lines += sum(len(lines) for lines in extra[2])
+        # Halaman tambahan diambil langsung dari antrian, bukan lewat _Stage
+        self.stages["ocr"].add_items(len(batch) - 1)
+
+        batch = [entry for entry in batch if entry[0] not in self._failed]
+        try:
+            pages_results = ocr_pages_line_results([entry[2] for entry in batch], batch_size=self.batch_size,
+                                                   model_name=self.model_name, engine=self.engine, cache=self.cache)
+        except Exception as e:
+            # Batch bisa berisi halaman dari beberapa PDF: semuanya gagal
+            for entry in batch:
+                self._on_error(entry, e)
+            return ()
+        for (file_id, page_number, _, line_bboxes), boxes_results in zip(batch, pages_results):
+            boxes = [box_result(box_idx, lines, line_bboxes[box_idx]) for box_idx, lines in enumerate(boxes_results)]
+            self._results.put(("page", file_id, page_number, "ocr", boxes))
+        return ()
+
+    def _on_error(self, item, error):
+        file_id = item[0]
+        self._failed.add(file_id)
+        message = "".join(traceback.format_exception_only(type(error), error)).strip()
+        self._results.put(("failed", file_id, message))
+
+    # --- eksekusi ---------------------------------------------------------
+    def run(self, pdf_paths):
+        """Generator hasil per PDF (dict, lihat docstring modul), urut selesai."""
+        files = [_FileState(i, path) for i, path in enumerate(pdf_paths)]
+        if not files:
+            return
+        self._results = queue.Queue()
+        self._failed = set()
+
+        inboxes = [queue.Queue()] + [queue.Queue(maxsize=self.queue_size) for _ in STAGE_NAMES[1:]]
+        self._ocr_inbox = inboxes[-1]
+        fns = (self._rasterize, self._preprocess, self._boxes, self._ocr)
+        stages = []
+        for i, (name, fn) in enumerate(zip(STAGE_NAMES, fns)):
+            outbox = inboxes[i + 1] if i + 1 < len(inboxes) else None
+            stages.append(_Stage(name, fn, self.workers[name], inboxes[i], outbox, self._on_error))
+        for stage, next_stage in zip(stages, stages[1:]):
+            stage.next_workers = next_stage.workers
+        self.stages = {stage.name: stage for stage in stages}
+
+        start = time.perf_counter()
+        for stage in stages:
+            stage.start()
+        for state in files:
+            inboxes[0].put((state.index, state.pdf_path))
+        for _ in range(stages[0].workers):
+            inboxes[0].put(_DONE)
+
+        remaining = len(files)
+        try:
+            while remaining:
+                message = self._results.get()
+                state = files[message[1]]
+                if state.expected == -1:
+                    continue  # hasil sudah dikirim (gagal)
+                if message[0] == "started":
+                    state.started = message[2]
+                    continue
+                if message[0] == "failed":
+                    state.error = message[2]
+                elif message[0] == "pages":
+                    state.expected = message[2]
+                else:
+                    _, _, page_number, source, boxes = message
+                    state.pages[page_number] = {"page": page_number, "source": source, "boxes": boxes}
+
+                if state.error is not None or (state.expected is not None and len(state.pages) == state.expected):
+                    remaining -= 1
+                    state.expected = -1
+                    yield self._file_result(state)
+        finally:
+            # Konsumen berhenti lebih awal: file sisanya dibatalkan
+            self._failed.update(range(len(files)))
+            for stage in stages:
+                stage.join()
+            self.wall = time.perf_counter() - start
+
+    def _file_result(self, state):
+        pages = [state.pages[i] for i in sorted(state.pages)]
+        result = {
+            "pdf": state.pdf_path,
+            "student": os.path.splitext(os.path.basename(state.pdf_path))[0],
+            "status": "failed" if state.error else "done",
+            "error": state.error,
+            "pages": pages,
+            "text": None,
+            "seconds": round(time.perf_counter() - (state.started or time.perf_counter()), 3),
+        }
+        if not state.error:
+            result["text"] = result_text(result)
+        return result
+
+    def stage_stats(self):
+        """`{tahap: {"workers", "items", "busy_s", "utilization"}}` dari run terakhir."""
+        stats = {}
+        for name, stage in self.stages.items():
+            capacity = stage.workers * self.wall if self.wall else None
+            stats[name] = {"workers": stage.workers, "items": stage.items, "busy_s": round(stage.busy, 3),
+                           "utilization": round(stage.busy / capacity, 3) if capacity else None}
+        return stats
+
+
+def ingest(source, **pipeline_options):
+    """
+    Library API: menjalankan pipeline pada folder/ZIP `source` dan
+    menghasilkan hasil per PDF (urut selesai). Isi ZIP diekstrak ke folder
+    sementara yang dihapus setelah generator selesai.
+    """
+    with tempfile.TemporaryDirectory(prefix="bulk-ingest-") as extract_dir:
+        pdf_paths = collect_pdfs(source, extract_dir=extract_dir)
+        print(f"[INFO] {len(pdf_paths)} PDF ditemukan di {source}")
+        yield from BulkIngestPipeline(**pipeline_options).run(pdf_paths)
+
+
+def ingest_to_dir(source, out_dir, **pipeline_options):
+    """
+    Menjalankan `ingest` dan menulis `<out_dir>/<siswa>.json` dan `.txt`
+    per PDF, plus `summary.json`. Mengembalikan isi summary.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    pipeline = BulkIngestPipeline(**pipeline_options)
+    summary = {"source": source, "files": []}
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="bulk-ingest-") as extract_dir:
+        pdf_paths = collect_pdfs(source, extract_dir=extract_dir)
+        print(f"[INFO] {len(pdf_paths)} PDF ditemukan di {source}")
+        for result in pipeline.run(pdf_paths):
+            base = os.path.join(out_dir, result["student"])
+            with open(base + ".json", "w", encoding="utf-8") as f:
+                json.dump({**result, "pdf": os.path.basename(result["pdf"])}, f, ensure_ascii=False, indent=2)
+            if result["text"] is not None:
+                with open(base + ".txt", "w", encoding="utf-8") as f:
+                    f.write(result["text"])
+            status = "✅" if result["status"] == "done" else f"❌ {result['error']}"
+            print(f"[INFO] {result['student']}: {len(result['pages'])} halaman, {result['seconds']:.1f} s {status}")
+            summary["files"].append({key: result[key] for key in ("student", "status", "error", "seconds")})
+
+    wall = time.perf_counter() - start
+    summary.update(wall_s=round(wall, 3), stages=pipeline.stage_stats())
+    with open(os.path.join(out_dir, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    print(f"\n{'tahap':<11} {'worker':>6} {'item':>6} {'kerja(s)':>9} {'util':>6}")
+    for name, entry in summary["stages"].items():
+        print(f"{name:<11} {entry['workers']:>6} {entry['items']:>6} {entry['busy_s']:>9.2f} {entry['utilization']!s:>6}")
+    if summary["stages"]:
+        bottleneck = max(summary["stages"], key=lambda name: summary["stages"][name]["utilization"] or 0)
+        print(f"[INFO] {len(summary['files'])} file dalam {wall:.1f} s; tahap paling sibuk: {bottleneck}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="folder atau file ZIP berisi PDF (satu per siswa)")
+    parser.add_argument("--out", default="hasil_ocr", help="folder output hasil per siswa (default: hasil_ocr)")
+    parser.add_argument("--template", metavar="PATH", default=None, help="template lembar jawaban (.npz)")
+    parser.add_argument("--engine", choices=["torch", "onnx"], default=OCR_ENGINE)
+    parser.add_argument("--raster-workers", type=int, default=OCR_BULK_RASTER_WORKERS)
+    parser.add_argument("--preprocess-workers", type=int, default=OCR_BULK_PREPROCESS_WORKERS)
+    parser.add_argument("--box-workers", type=int, default=OCR_BULK_BOX_WORKERS)
+    parser.add_argument("--ocr-workers", type=int, default=OCR_BULK_OCR_WORKERS)
+    parser.add_argument("--queue-size", type=int, default=OCR_BULK_QUEUE_SIZE,
+                        help="kapasitas antrian antar tahap (halaman)")
+    args = parser.parse_args()
+
+    from sheet_template import SheetTemplate
+
+    template = SheetTemplate.load(args.template) if args.template else None
+    ingest_to_dir(args.source, args.out, template=template, engine=args.engine,
+                  raster_workers=args.raster_workers, preprocess_workers=args.preprocess_workers,
+                  box_workers=args.box_workers, ocr_workers=args.ocr_workers, queue_size=args.queue_size)
+
+
+if __name__ == "__main__":
+    main()
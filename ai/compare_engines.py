@@ -0,0 +1,91 @@
+"""
+Membandingkan engine OCR (PyTorch fp32 vs ONNX Runtime int8) pada crop
+baris dari sampel PDF: latensi, lines/sec, dan CER.
+
+CER dihitung terhadap ground truth `<nama_pdf>.txt` di folder yang sama jika
+ada; selain itu engine ONNX dibandingkan terhadap output PyTorch.
+
+    python onnx_engine.py  # sekali, export + kuantisasi model ONNX
+    python compare_engines.py --pdf-dir files --engines torch onnx --json hasil.json
+"""
+import argparse
+import glob
+import json
+import os
+import time
+from PIL import Image
+
+from main import iter_page_sources
+from ocr_processing import extract_line_crops, ocr_batch, OCR_BATCH_SIZE
+from model_registry import get_engine, DEFAULT_OCR_MODEL
+from text_metrics import character_error_rate
+
+
+def collect_line_crops(pdf_path):
+    crops = []
+    for _, _, find_boxes in iter_page_sources(pdf_path):
+        boxes, skew_angle = find_boxes()
+        for crop in boxes:
+            crops.extend(extract_line_crops(crop, page_angle=skew_angle) or [])
+    return [Image.fromarray(roi) for roi in crops]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf-dir", default="files")
+    parser.add_argument("--engines", nargs="+", default=["torch", "onnx"])
+    parser.add_argument("--model", default=DEFAULT_OCR_MODEL)
+    parser.add_argument("--batch-size", type=int, default=OCR_BATCH_SIZE)
+    parser.add_argument("--json", default=None, help="simpan hasil perbandingan ke file JSON")
+    args = parser.parse_args()
+
+    pdf_paths = sorted(glob.glob(os.path.join(args.pdf_dir, "*.pdf")))
+    documents = {path: collect_line_crops(path) for path in pdf_paths}
+    n_lines = sum(len(lines) for lines in documents.values())
+    print(f"[INFO] {len(pdf_paths)} PDF, {n_lines} baris.")
+
+    outputs = {}
+    report = {"model": args.model, "batch_size": args.batch_size, "lines": n_lines, "engines": {}}
+    for engine in args.engines:
+        start_load = time.perf_counter()
+        get_engine(engine, args.model)
+        load_time = time.perf_counter() - start_load
+
+        start = time.perf_counter()
+        outputs[engine] = {
+            path: "\n".join(ocr_batch(lines, batch_size=args.batch_size, model_name=args.model, engine=engine))
+            for path, lines in documents.items()
+        }
+        elapsed = time.perf_counter() - start
+        report["engines"][engine] = {
+            "load_s": round(load_time, 2),
+            "ocr_s": round(elapsed, 2),
+            "lines_per_s": round(n_lines / elapsed, 2) if elapsed else None,
+            "ms_per_line": round(elapsed * 1000 / n_lines, 1) if n_lines else None,
+        }
+
+    baseline = args.engines[0]
+    for engine in args.engines:
+        truth_cer, agreement_cer = [], []
+        for path in pdf_paths:
+            truth_path = os.path.splitext(path)[0] + ".txt"
+            if os.path.exists(truth_path):
+                with open(truth_path, encoding="utf-8") as f:
+                    truth_cer.append(character_error_rate(outputs[engine][path], f.read()))
+            agreement_cer.append(character_error_rate(outputs[engine][path], outputs[baseline][path]))
+        stats = report["engines"][engine]
+        stats["cer_vs_truth"] = round(sum(truth_cer) / len(truth_cer), 4) if truth_cer else None
+        stats[f"cer_vs_{baseline}"] = round(sum(agreement_cer) / len(agreement_cer), 4) if agreement_cer else None
+
+    print(f"\n{'engine':<8} {'load (s)':>9} {'ms/line':>9} {'lines/s':>9} {'CER truth':>10} {'CER vs ' + baseline:>14}")
+    for engine, stats in report["engines"].items():
+        print(f"{engine:<8} {stats['load_s']:>9} {stats['ms_per_line']!s:>9} {stats['lines_per_s']!s:>9} "
+              f"{stats['cer_vs_truth']!s:>10} {stats['cer_vs_' + baseline]!s:>14}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
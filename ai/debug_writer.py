@@ -0,0 +1,87 @@
+import os
+import queue
+import threading
+import cv2
+
+# Debug nonaktif secara default. Set OCR_DEBUG_DIR (atau panggil
+# enable_debug) untuk menyimpan gambar antara pipeline OCR.
+OCR_DEBUG_DIR = os.getenv("OCR_DEBUG_DIR")
+OCR_DEBUG_QUEUE = int(os.getenv("OCR_DEBUG_QUEUE", "64"))
+
+class DebugWriter:
+    """
+    Menulis gambar debug di thread background. Antrian dibatasi
+    `max_queue` frame; jika penuh, frame baru dibuang (dihitung di
+    `dropped`) supaya mode debug tidak menambah latensi OCR.
+    """
+
+    def __init__(self, root_dir, max_queue=OCR_DEBUG_QUEUE):
+        self.root_dir = root_dir
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="ocr-debug-writer", daemon=True)
+        self._thread.start()
+
+    def save(self, rel_path, image, boxes=None):
+        """
+        Antrikan `image` untuk ditulis ke `root_dir/rel_path`. Jika `boxes`
+        diisi, kotak `(x, y, w, h)` digambar di thread writer, bukan di sini.
+        Gambar tidak boleh diubah caller setelah diantrikan.
+        """
+        try:
+            self._queue.put_nowait((rel_path, image, boxes))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            rel_path, image, boxes = item
+            try:
+                path = os.path.join(self.root_dir, rel_path)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if boxes is not None:
+                    image = image.copy()
+                    for x, y, w, h in boxes:
+                        cv2.rectangle(image, (x, y), (x + w, y + h), (0, 255, 0), 2)
+                cv2.imwrite(path, image)
+                self.written += 1
+            except Exception as e:
+                print(f"⚠️ [Debug] Gagal menulis {rel_path}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        if self.dropped:
+            print(f"⚠️ [Debug] {self.dropped} frame debug dibuang karena antrian penuh.")
+
+
+DEBUG_WRITER = None
+
+def enable_debug(root_dir="debug_results", max_queue=OCR_DEBUG_QUEUE):
+    global DEBUG_WRITER
+    disable_debug()
+    DEBUG_WRITER = DebugWriter(root_dir, max_queue=max_queue)
+    return DEBUG_WRITER
+
+def disable_debug():
+    global DEBUG_WRITER
+    if DEBUG_WRITER is not None:
+        DEBUG_WRITER.close()
+        DEBUG_WRITER = None
+
+def get_debug_writer():
+    return DEBUG_WRITER
+
+
+if OCR_DEBUG_DIR:
+    enable_debug(OCR_DEBUG_DIR)
@@ -0,0 +1,57 @@
+import math
+import os
+
+# Konfigurasi decoding per deployment (lihat DecodingPolicy)
+OCR_DECODING = os.getenv("OCR_DECODING", "greedy")  # "greedy" atau "beam"
+OCR_NUM_BEAMS = int(os.getenv("OCR_NUM_BEAMS", "4"))
+OCR_TOKENS_PER_ASPECT = float(os.getenv("OCR_TOKENS_PER_ASPECT", "1.0"))
+OCR_BASE_TOKENS = int(os.getenv("OCR_BASE_TOKENS", "6"))
+OCR_MAX_NEW_TOKENS = int(os.getenv("OCR_MAX_NEW_TOKENS", "64"))
+
+class DecodingPolicy:
+    """
+    Menentukan parameter `generate` untuk satu batch crop baris.
+
+    Budget token diturunkan dari rasio lebar/tinggi crop: baris pendek
+    (satu-dua kata) mendapat `max_new_tokens` kecil, baris penuh mendapat
+    budget lebih besar, dibatasi `max_tokens`. Dalam satu batch dipakai
+    budget terbesar; generate tetap berhenti lebih awal saat semua anggota
+    batch sudah menghasilkan EOS.
+    """
+
+    def __init__(self, strategy=OCR_DECODING, num_beams=OCR_NUM_BEAMS,
+                 tokens_per_aspect=OCR_TOKENS_PER_ASPECT, base_tokens=OCR_BASE_TOKENS,
+                 max_tokens=OCR_MAX_NEW_TOKENS):
+        if strategy not in ("greedy", "beam"):
+            raise ValueError(f"Strategi decoding tidak dikenal: {strategy}")
+        self.strategy = strategy
+        self.num_beams = num_beams if strategy == "beam" else 1
+        self.tokens_per_aspect = tokens_per_aspect
+        self.base_tokens = base_tokens
+        self.max_tokens = max_tokens
+
+    @property
+    def cache_id(self):
+        """Identitas policy untuk key cache (hasil OCR bergantung padanya)."""
+        return f"{self.strategy}:{self.num_beams}:{self.tokens_per_aspect}:{self.base_tokens}:{self.max_tokens}"
+
+    def token_budget(self, width, height):
+        aspect = width / max(1, height)
+        return min(self.max_tokens, self.base_tokens + math.ceil(aspect * self.tokens_per_aspect))
+
+    def generate_kwargs(self, sizes):
+        """`sizes` = list `(width, height)` crop dalam satu batch."""
+        return {
+            "max_new_tokens": max(self.token_budget(w, h) for w, h in sizes),
+            "num_beams": self.num_beams,
+        }
+
+
+DECODING_POLICY = DecodingPolicy()
+
+def get_decoding_policy():
+    return DECODING_POLICY
+
+def set_decoding_policy(policy):
+    global DECODING_POLICY
+    DECODING_POLICY = policy
@@ -0,0 +1,123 @@
+import math
+import os
+import cv2
+import numpy as np
+
+from page_context import as_page_context, gray_of, like_input
+from instrumentation import timed
+
+# Sudut halaman diestimasi sekali pada versi halaman yang diperkecil (sisi
+# terpanjang OCR_DESKEW_MAX_SIDE piksel) lalu dipakai ulang untuk semua crop.
+OCR_DESKEW_MAX_SIDE = int(os.getenv("OCR_DESKEW_MAX_SIDE", "1000"))
+# Crop yang sisa kemiringannya melebihi batas ini di-deskew ulang sendiri
+# (Hough dengan resolusi sudut 1 derajat tidak bisa memperbaiki yang lebih kecil).
+OCR_DESKEW_TOLERANCE = float(os.getenv("OCR_DESKEW_TOLERANCE", "0.75"))
+
+RESIDUAL_MAX_SIDE = 400
+RESIDUAL_MAX_ANGLE = 5.0
+RESIDUAL_STEP = 0.25
+RESIDUAL_MIN_CONTRAST = 1.05  # energi puncak / energi minimum agar estimasi dianggap valid
+
+def deskew_id():
+    """Identitas konfigurasi deskew untuk key cache halaman."""
+    return f"page:{OCR_DESKEW_MAX_SIDE}:{OCR_DESKEW_TOLERANCE}"
+
+def _downscale(gray, max_side):
+    scale = min(1.0, max_side / max(gray.shape[:2])) if max_side else 1.0
+    if scale < 1.0:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return gray, scale
+
+@timed("deskew")
+def estimate_skew_angle(image, max_side=OCR_DESKEW_MAX_SIDE, hough_threshold=100, min_line_length=50,
+                        max_line_gap=10, angle_limit=15):
+    """
+    Mengestimasi sudut kemiringan (derajat) dari median garis Hough yang
+    mendekati horizontal (|sudut| < `angle_limit`). Gambar diperkecil dulu
+    sampai sisi terpanjang `max_side` (None = resolusi asli); parameter Hough
+    diberikan dalam piksel resolusi asli dan ikut diskalakan. Mengembalikan
+    None jika tidak ada garis valid.
+    """
+    gray = gray_of(image)
+    gray, scale = _downscale(gray, max_side)
+    edges = cv2.Canny(gray, 50, 150, apertureSize=3)
+    lines = cv2.HoughLinesP(edges, 1, np.pi / 180, max(10, int(round(hough_threshold * scale))),
+                            minLineLength=max(10, int(round(min_line_length * scale))),
+                            maxLineGap=max(2, int(round(max_line_gap * scale))))
+    if lines is None:
+        return None
+    x1, y1, x2, y2 = lines[:, 0, :].T.astype(np.float64)
+    angles = np.rad2deg(np.arctan2(y2 - y1, x2 - x1))
+    angles = angles[np.abs(angles) < angle_limit]
+    return float(np.median(angles)) if angles.size else None
+
+def residual_skew_angle(image, max_side=RESIDUAL_MAX_SIDE, max_angle=RESIDUAL_MAX_ANGLE, step=RESIDUAL_STEP):
+    """
+    Estimasi cepat kemiringan crop tanpa Hough (projection profile): piksel
+    tinta di-shear untuk setiap sudut kandidat dalam +-`max_angle`, lalu
+    dipilih sudut yang membuat profil tinta per baris paling tajam (garis
+    bantu dan baris tulisan jatuh di baris piksel yang sama). Semua sudut
+    dievaluasi sekaligus dengan satu `bincount`. Mengembalikan None jika
+    crop tidak punya struktur horizontal yang cukup jelas untuk diukur.
+    """
+    gray = gray_of(image)
+    gray, _ = _downscale(gray, max_side)
+    h, w = gray.shape
+    ink = cv2.adaptiveThreshold(gray, 1, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 15, 10)
+    ys, xs = np.nonzero(ink)
+    if ys.size < w:
+        return None
+
+    angles = np.arange(-max_angle, max_angle + step / 2, step)
+    slopes = np.tan(np.deg2rad(angles))
+    pad = int(math.ceil(abs(slopes).max() * w)) + 1
+    rows = np.rint(ys[None, :] - (xs[None, :] - w / 2) * slopes[:, None]).astype(np.int64) + pad
+    n_rows = h + 2 * pad
+    profiles = np.bincount((rows + np.arange(len(angles))[:, None] * n_rows).ravel(),
+                           minlength=len(angles) * n_rows).reshape(len(angles), n_rows)
+    energy = (profiles.astype(np.float64) ** 2).sum(axis=1)
+
+    peak = int(np.argmax(energy))
+    if energy[peak] < RESIDUAL_MIN_CONTRAST * energy.min():
+        return None
+    angle = float(angles[peak])
+    # Interpolasi parabola di sekitar puncak untuk presisi di bawah `step`
+    if 0 < peak < len(angles) - 1:
+        a, b, c = energy[peak - 1], energy[peak], energy[peak + 1]
+        denom = a - 2 * b + c
+        if denom != 0:
+            angle += 0.5 * (a - c) / denom * step
+    return angle
+
+def rotate_image(image, angle):
+    """Memutar gambar (array atau PageContext) `angle` derajat terhadap pusatnya (tanpa mengubah ukuran)."""
+    if not angle:
+        return image
+    return like_input(image, as_page_context(image).rotate(angle))
+
+@timed("deskew")
+def deskew_crop(image, page_angle=None, tolerance=OCR_DESKEW_TOLERANCE):
+    """
+    Meluruskan satu crop kotak jawaban. Jika `page_angle` (hasil
+    `estimate_skew_angle` pada halaman) diberikan, sudut itu dipakai langsung
+    kecuali pemeriksaan residual menunjukkan crop masih miring lebih dari
+    `tolerance` derajat; hanya dalam kasus itu (atau tanpa `page_angle`)
+    Hough dijalankan pada crop.
+
+    `image` boleh berupa PageContext (gray-nya dipakai ulang dan hasilnya
+    juga PageContext). Mengembalikan `(gambar, info)` dengan info
+    `{"angle", "page_angle", "residual", "source"}`; source adalah "page"
+    atau "crop".
+    """
+    info = {"angle": 0.0, "page_angle": page_angle, "residual": None, "source": "crop"}
+    if page_angle is not None:
+        measured = residual_skew_angle(image)
+        if measured is not None:
+            info["residual"] = measured - page_angle
+        if measured is None or abs(info["residual"]) <= tolerance:
+            info.update(angle=page_angle, source="page")
+            return rotate_image(image, page_angle), info
+
+    angle = estimate_skew_angle(image, max_side=None)
+    info["angle"] = angle or 0.0
+    return rotate_image(image, info["angle"]), info
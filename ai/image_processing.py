@@ -1,7 +1,12 @@
+import time
 import cv2
 import numpy as np
 import matplotlib.pyplot as plt
 
+from deskew import estimate_skew_angle, OCR_DESKEW_MAX_SIDE
+from page_context import as_page_context, like_input
+from instrumentation import count, stage, timed
+
 # ========================================================================
 #  HELPER: Order points (Dari kode Anda)
 # ========================================================================
@@ -19,22 +24,19 @@ def order_points(pts):
 # ========================================================================
 #  LANGKAH 1: PERSPECTIVE TRANSFORM (Dari kode Anda)
 # ========================================================================
-def correct_perspective(image_input):
-    if isinstance(image_input, str):
-        image = cv2.imread(image_input)
-    else:
-        image = image_input.copy()
+def find_page_corners(image, block_size=35, kernel_size=5, min_area=10000):
+    """
+    Mencari 4 sudut halaman (urutan tl, tr, br, bl) pada gambar BGR atau
+    PageContext. Parameter default disetel untuk halaman 300 DPI; untuk
+    gambar yang diperkecil, skalakan `block_size`, `kernel_size`, dan `min_area`.
+    """
+    page = as_page_context(image)
 
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    gray = cv2.GaussianBlur(gray, (5, 5), 0)
-
-    # Adaptive threshold agar tahan bayangan
-    binary = cv2.adaptiveThreshold(
-        gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 35, 10
-    )
+    # Adaptive threshold (dari gray yang di-blur) agar tahan bayangan
+    binary = page.adaptive_binary(block_size, 10, blur=5)
 
     # Menyatukan tepi yang patah
-    kernel = np.ones((5, 5), np.uint8)
+    kernel = np.ones((kernel_size, kernel_size), np.uint8)
     morph = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel, iterations=2)
 
     contours, _ = cv2.findContours(morph, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
@@ -43,7 +45,7 @@ def correct_perspective(image_input):
     max_area = 0
     for cnt in contours:
         area = cv2.contourArea(cnt)
-        if area < 10000:
+        if area < min_area:
             continue
         peri = cv2.arcLength(cnt, True)
         approx = cv2.approxPolyDP(cnt, 0.02 * peri, True)
@@ -55,16 +57,18 @@ def correct_perspective(image_input):
 
     if page_contour is None or len(page_contour) < 4:
         x, y, w, h = cv2.boundingRect(max(contours, key=cv2.contourArea))
-        ordered_corners = np.array([
+        return np.array([
             [x, y],
             [x+w, y],
             [x+w, y+h],
             [x, y+h]
         ], dtype=np.float32)
-    else:
-        ordered_corners = order_points(page_contour.reshape(-1, 2))
 
-    # Perspective transform
+    return order_points(page_contour.reshape(-1, 2))
+
+
+def perspective_transform(ordered_corners):
+    """Menghitung matriks perspektif dan ukuran output dari 4 sudut halaman."""
     (tl, tr, br, bl) = ordered_corners
     widthA = np.linalg.norm(br - bl)
     widthB = np.linalg.norm(tr - tl)
@@ -80,58 +84,63 @@ def correct_perspective(image_input):
         [0, maxHeight - 1]
     ], dtype="float32")
 
-    M = cv2.getPerspectiveTransform(ordered_corners, dst_pts)
-    warped = cv2.warpPerspective(image, M, (maxWidth, maxHeight))
+    M = cv2.getPerspectiveTransform(np.asarray(ordered_corners, dtype="float32"), dst_pts)
+    return M, (maxWidth, maxHeight)
+
+
+@timed("perspective")
+def correct_perspective(image_input):
+    """
+    Meluruskan perspektif halaman. Menerima path, array BGR, atau
+    PageContext; untuk PageContext hasilnya juga PageContext (dengan
+    `matrix` yang sudah memuat homografi ini).
+    """
+    page = as_page_context(image_input)
+    ordered_corners = find_page_corners(page)
+    # Turunan halaman sebelum warp tidak dipakai lagi; bebaskan sebelum
+    # halaman hasil warp dialokasikan
+    page.release()
+
+    # Perspective transform
+    M, (maxWidth, maxHeight) = perspective_transform(ordered_corners)
+    warped = page.warp(M, (maxWidth, maxHeight))
 
     print("✅ [Perspective] Koreksi perspektif berhasil (robust mode).")
-    return warped
+    return like_input(image_input, warped)
 
 
 # ========================================================================
 #  LANGKAH 2: ROTATIONAL DESKEW 
 # ========================================================================
+def estimate_rotation_angle(image, hough_threshold=100, min_line_length=100, max_line_gap=10, max_side=None):
+    """
+    Mengestimasi sudut kemiringan (derajat) dari median garis mendekati
+    horizontal. Mengembalikan None jika tidak ada garis valid. Implementasi
+    Hough yang sama dipakai untuk crop kotak jawaban (lihat `deskew`);
+    `max_side` memperkecil gambar lebih dulu.
+    """
+    angle = estimate_skew_angle(image, max_side=max_side, hough_threshold=hough_threshold,
+                                min_line_length=min_line_length, max_line_gap=max_line_gap, angle_limit=45)
+    if angle is None:
+        print("⚠️ [Rotation] Tidak ada garis horizontal valid. Melewatkan koreksi rotasi.")
+    return angle
+
+
 def correct_rotation_hough(image_input):
     """
     Menyempurnakan pelurusan gambar dengan mengoreksi rotasi minor
     menggunakan Hough Line Transform.
-    Bisa menerima path string ATAU numpy array.
+    Bisa menerima path string, numpy array, ATAU PageContext.
     """
-    if isinstance(image_input, str):
-        image = cv2.imread(image_input)
-        if image is None: raise FileNotFoundError(f"Gagal membaca gambar dari {image_input}")
-    else:
-        image = image_input.copy()
-
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    gray = cv2.bitwise_not(gray) # Inversi warna agar teks putih, latar hitam
-    edges = cv2.Canny(gray, 50, 150, apertureSize=3)
-    lines = cv2.HoughLinesP(edges, 1, np.pi / 180, threshold=100, minLineLength=100, maxLineGap=10)
-
-    if lines is None:
-        print("⚠️ [Rotation] Tidak ada garis terdeteksi. Melewatkan koreksi rotasi.")
-        return image
-
-    angles = []
-    for line in lines:
-        x1, y1, x2, y2 = line[0]
-        angle = np.rad2deg(np.arctan2(y2 - y1, x2 - x1))
-        # Hanya pertimbangkan garis yang mendekati horizontal
-        if abs(angle) < 45:
-            angles.append(angle)
-    
-    if not angles:
-        print("⚠️ [Rotation] Tidak ada garis horizontal valid. Melewatkan koreksi rotasi.")
-        return image
+    page = as_page_context(image_input)
 
-    median_angle = np.median(angles)
-    print(f"✅ [Rotation] Sudut kemiringan terdeteksi: {median_angle:.2f} derajat. Mengoreksi...")
+    # Sudut cukup diestimasi di versi halaman yang diperkecil
+    median_angle = estimate_rotation_angle(page, max_side=OCR_DESKEW_MAX_SIDE)
+    if median_angle is None:
+        return like_input(image_input, page)
 
-    (h, w) = image.shape[:2]
-    center = (w // 2, h // 2)
-    M = cv2.getRotationMatrix2D(center, median_angle, 1.0)
-    rotated = cv2.warpAffine(image, M, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
-    
-    return rotated
+    print(f"✅ [Rotation] Sudut kemiringan terdeteksi: {median_angle:.2f} derajat. Mengoreksi...")
+    return like_input(image_input, page.rotate(median_angle))
 
 # ========================================================================
 #  MASTER PREPROCESSING PIPELINE
@@ -172,25 +181,67 @@ def preprocess_image(image_input, visualize=False):
 # ========================================================================
 #  DETEKSI KOTAK JAWABAN (Dari kode Anda, tidak ada perubahan)
 # ========================================================================
-def detect_answer_boxes(image_input, max_boxes=4, visualize=False):
-    if isinstance(image_input, str):
-        image = cv2.imread(image_input)
-        if image is None:
-            raise FileNotFoundError(f"Gagal membaca gambar dari {image_input}")
-    else:
-        image = image_input.copy()
+def _contour_bounding_rects(contours):
+    """
+    Bounding rect `(x, y, w, h)` semua kontur sekaligus (hasil sama dengan
+    `cv2.boundingRect` per kontur): titik semua kontur digabung lalu min/max
+    per kontur dihitung dengan `reduceat`.
+    """
+    lengths = np.fromiter((len(c) for c in contours), dtype=np.int64, count=len(contours))
+    points = np.concatenate(contours).reshape(-1, 2)
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    lo = np.minimum.reduceat(points, starts)
+    hi = np.maximum.reduceat(points, starts)
+    return np.hstack([lo, hi - lo + 1])
+
 
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    blur = cv2.GaussianBlur(gray, (5, 5), 0)
+def _select_non_overlapping(boxes, threshold):
+    """
+    Seleksi greedy (sesuai urutan input): kotak dibuang jika pojok kiri-atasnya
+    berjarak < `threshold` di kedua sumbu dari kotak yang sudah terpilih.
+    Kotak terpilih diindeks di grid bersel `threshold`, sehingga tiap kotak
+    hanya dibandingkan dengan isi 3x3 sel di sekitarnya.
+    """
+    cell = max(threshold, 1)
+    grid = {}
+    selected = []
+    for box in boxes:
+        x, y = box[0], box[1]
+        cx, cy = int(x // cell), int(y // cell)
+        neighbours = (grid.get((gx, gy), ()) for gx in (cx - 1, cx, cx + 1) for gy in (cy - 1, cy, cy + 1))
+        if any(abs(x - ux) < threshold and abs(y - uy) < threshold for cell_boxes in neighbours for (ux, uy, *_) in cell_boxes):
+            continue
+        grid.setdefault((cx, cy), []).append(box)
+        selected.append(box)
+    return selected
+
+
+@timed("boxes")
+def find_answer_box_rects(image, max_boxes=4, block_size=15, padding=50, stats=None):
+    """
+    Mencari kotak jawaban dan mengembalikan list `(x, y, w, h, area)` yang
+    sudah dipersempit ke dalam sebesar `padding`, terurut dari atas.
+    Parameter default disetel untuk halaman 300 DPI.
+
+    Jika `stats` (dict) diberikan, diisi jumlah kontur per tahap seleksi
+    (`contours`, `candidates`, `boxes`, `unique`) dan waktu tiap tahap dalam
+    milidetik (`timings`).
+    """
+    page = as_page_context(image)
+    timings = {}
+    t0 = time.perf_counter()
 
     # 🔧 Gunakan adaptive threshold agar lebih stabil di DPI tinggi
-    binary = cv2.adaptiveThreshold(
-        gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-        cv2.THRESH_BINARY_INV, 15, 8
-    )
+    binary = page.adaptive_binary(block_size, 8)
+    t1 = time.perf_counter()
 
     # 🔧 Deteksi kontur
     contours, hierarchy = cv2.findContours(binary, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+    count("contours", len(contours))
+    t2 = time.perf_counter()
+    timings.update(threshold=(t1 - t0) * 1000, contours=(t2 - t1) * 1000)
+    if stats is not None:
+        stats.update(contours=len(contours), candidates=0, boxes=0, unique=0, timings=timings)
 
     if not contours:
         print("⚠️ [Boxes] Tidak ada kontur valid ditemukan.")
@@ -200,37 +251,40 @@ def detect_answer_boxes(image_input, max_boxes=4, visualize=False):
     img_area = h_img * w_img
     min_area, max_area = img_area * 0.1, img_area * 0.3
 
+    # Prefilter: bounding rect hasil approxPolyDP tidak pernah lebih besar dari
+    # bounding rect kontur, jadi kontur yang rect-nya <= min_area pasti ditolak
+    rects = _contour_bounding_rects(contours)
+    candidates = np.flatnonzero(rects[:, 2] * rects[:, 3] > min_area)
+
     boxes_detected = []
-    for i, cnt in enumerate(contours):
+    for i in candidates:
+        cnt = contours[i]
         approx = cv2.approxPolyDP(cnt, 0.3 * cv2.arcLength(cnt, True), True)
         if len(approx) <= 4: 
             x, y, w, h = cv2.boundingRect(approx)
             area = w * h
             if min_area < area < max_area:
                 boxes_detected.append((x, y, w, h, area))
+    t3 = time.perf_counter()
 
     # print(f"✅ [Boxes] Jumlah kotak terdeteksi: {len(boxes_detected)}")
 
     # Seleksi non-overlap
-    unique_boxes = []
-    for box in boxes_detected:
-        (x, y, w, h, area) = box
-        threshold = min(w_img, h_img) * 0.5
-        if not any(abs(x - ux) < threshold and abs(y - uy) < threshold for (ux, uy, uw, uh, ua) in unique_boxes):
-            unique_boxes.append(box)
+    unique_boxes = _select_non_overlapping(boxes_detected, min(w_img, h_img) * 0.5)
+    t4 = time.perf_counter()
+
+    timings.update(filter=(t3 - t2) * 1000, select=(t4 - t3) * 1000)
+    if stats is not None:
+        stats.update(candidates=len(candidates), boxes=len(boxes_detected), unique=len(unique_boxes))
 
     unique_boxes = sorted(unique_boxes, key=lambda b: b[4], reverse=True)[:max_boxes]
     unique_boxes = sorted(unique_boxes, key=lambda b: b[1])
     
     margin_boxes = []
     for (x, y, w, h, area) in unique_boxes:
-        # Padding ke dalam sebesar 500px
-        padding_x = 50
-        padding_y = 50
-
         # Batasi padding agar tidak lebih dari setengah ukuran kotak
-        pad_x = min(padding_x, w // 2 - 1)
-        pad_y = min(padding_y, h // 2 - 1)
+        pad_x = min(padding, w // 2 - 1)
+        pad_y = min(padding, h // 2 - 1)
 
         # Hitung koordinat baru
         x1 = max(0, x + pad_x)
@@ -242,9 +296,20 @@ def detect_answer_boxes(image_input, max_boxes=4, visualize=False):
         if x2 > x1 and y2 > y1:
             margin_boxes.append((x1, y1, x2 - x1, y2 - y1, area))
 
+    return margin_boxes
+
+
+def detect_answer_boxes(image_input, max_boxes=4, visualize=False, stats=None):
+    """
+    Mengembalikan crop kotak jawaban (view ke halaman, tanpa copy). Untuk
+    input PageContext, crop juga berupa PageContext yang memakai ulang
+    gray/HSV halaman. `stats` diteruskan ke `find_answer_box_rects`.
+    """
+    page = as_page_context(image_input)
+    margin_boxes = find_answer_box_rects(page, max_boxes=max_boxes, stats=stats)
 
     if visualize:
-        preview = image.copy()
+        preview = page.image.copy()
         for i, (x, y, w, h, _) in enumerate(margin_boxes):
             cv2.rectangle(preview, (x, y), (x + w, y + h), (0, 255, 0), 3)
             cv2.putText(preview, f"Box {i+1}", (x, y - 10),
@@ -256,7 +321,131 @@ def detect_answer_boxes(image_input, max_boxes=4, visualize=False):
         plt.axis("off")
         plt.show()
 
-    return [image[y:y+h, x:x+w] for (x, y, w, h, _) in margin_boxes]
+    return [like_input(image_input, page.crop(x, y, w, h)) for (x, y, w, h, _) in margin_boxes]
+
+
+# ========================================================================
+#  PIPELINE DUA RESOLUSI: ANALISIS LAYOUT DI PROXY, CROP DI RESOLUSI PENUH
+# ========================================================================
+def _scaled_odd(value, scale, minimum=3):
+    size = max(minimum, int(round(value * scale)))
+    return size if size % 2 == 1 else size + 1
+
+
+def _translation(tx, ty):
+    return np.array([[1, 0, tx], [0, 1, ty], [0, 0, 1]], dtype=np.float64)
+
+
+def analyze_layout(proxy_image, scale, max_boxes=4, deskew=False, stats=None):
+    """
+    Menjalankan deteksi halaman, estimasi sudut (opsional), dan deteksi kotak
+    jawaban pada `proxy_image`, yaitu halaman yang diperkecil dengan faktor
+    `scale` (lebar proxy = scale * lebar asli).
+
+    Semua geometri dikembalikan dalam koordinat resolusi penuh:
+    - "matrix": homografi 3x3 dari halaman asli ke halaman terkoreksi
+    - "size": ukuran (W, H) halaman terkoreksi
+    - "angle": sudut rotasi yang dikoreksi (0.0 jika tidak ada)
+    - "skew": sisa kemiringan halaman yang belum dikoreksi (diestimasi di
+      proxy, None jika tidak terukur), untuk dipakai ulang oleh setiap crop
+    - "boxes": list `(x, y, w, h, area)` di halaman terkoreksi
+
+    `stats` diteruskan ke `find_answer_box_rects` (kontur dihitung di proxy).
+
+    Dengan `scale` 1.0 (halaman 300 DPI, mode OCR_LOW_MEMORY) hasilnya sama
+    dengan `correct_perspective` + `detect_answer_boxes`; turunan proxy
+    dibebaskan begitu tidak dipakai lagi.
+    """
+    S = np.diag([scale, scale, 1.0])
+    S_inv = np.diag([1.0 / scale, 1.0 / scale, 1.0])
+    proxy = as_page_context(proxy_image)
+
+    with stage("perspective"):
+        corners = find_page_corners(
+            proxy,
+            block_size=_scaled_odd(35, scale),
+            kernel_size=max(1, int(round(5 * scale))),
+            min_area=10000 * scale * scale,
+        )
+        # Turunan proxy sebelum warp tidak dipakai lagi (lihat correct_perspective)
+        proxy.release()
+        M, (W, H) = perspective_transform(corners / scale)
+        M = M.astype(np.float64)
+
+        proxy_size = (max(1, int(round(W * scale))), max(1, int(round(H * scale))))
+        warped_proxy = proxy.warp(S @ M @ S_inv, proxy_size)
+
+    # Proxy kecil: parameter Hough diskalakan, tanpa downscale lagi
+    skew = estimate_skew_angle(
+        warped_proxy,
+        max_side=None if scale < 1 else OCR_DESKEW_MAX_SIDE,
+        hough_threshold=max(10, int(round(100 * scale))),
+        min_line_length=max(10, int(round(100 * scale))),
+        max_line_gap=max(2, int(round(10 * scale))),
+    )
+    angle = skew if deskew else None
+    if angle is not None:
+        skew = 0.0
+        R = np.vstack([cv2.getRotationMatrix2D((W // 2, H // 2), angle, 1.0), [0, 0, 1]])
+        M = R @ M
+        warped_proxy = proxy.warp(S @ M @ S_inv, proxy_size, borderMode=cv2.BORDER_REPLICATE)
+
+    proxy_boxes = find_answer_box_rects(
+        warped_proxy,
+        max_boxes=max_boxes,
+        block_size=_scaled_odd(15, scale),
+        padding=int(round(50 * scale)),
+        stats=stats,
+    )
+
+    boxes = []
+    for (x, y, w, h, area) in proxy_boxes:
+        x1, y1 = int(round(x / scale)), int(round(y / scale))
+        x2, y2 = min(W, int(round((x + w) / scale))), min(H, int(round((y + h) / scale)))
+        boxes.append((x1, y1, x2 - x1, y2 - y1, int(area / (scale * scale))))
+
+    return {"matrix": M, "size": (W, H), "angle": angle or 0.0, "skew": skew, "boxes": boxes}
+
+
+def box_source_rect(layout, box, margin=2):
+    """
+    Bounding rect `(x0, y0, x1, y1)` di halaman ASLI (sebelum koreksi) yang
+    memuat `box` dari `layout`. Dipakai untuk merender ulang hanya area itu.
+    """
+    x, y, w, h = box[:4]
+    pts = np.array([[[x, y], [x + w, y], [x + w, y + h], [x, y + h]]], dtype=np.float64)
+    src = cv2.perspectiveTransform(pts, np.linalg.inv(layout["matrix"]))[0]
+    x0, y0 = np.floor(src.min(axis=0)) - margin
+    x1, y1 = np.ceil(src.max(axis=0)) + margin
+    return int(x0), int(y0), int(x1), int(y1)
+
+
+@timed("boxes")
+def crop_answer_boxes(image, layout, origin=(0, 0)):
+    """
+    Memotong setiap kotak dari `layout` langsung dari gambar resolusi penuh
+    dengan satu warpPerspective per kotak (tanpa me-warp seluruh halaman).
+    `origin` adalah posisi piksel (0, 0) `image` di halaman asli, untuk
+    kasus `image` hanya potongan halaman.
+    """
+    crops = []
+    for (x, y, w, h, _) in layout["boxes"]:
+        M = _translation(-x, -y) @ layout["matrix"] @ _translation(*origin)
+        crops.append(cv2.warpPerspective(image, M, (w, h), borderMode=cv2.BORDER_REPLICATE))
+    return crops
+
+
+def extract_answer_boxes_two_pass(image, max_boxes=4, layout_scale=1/3, deskew=False):
+    """
+    Versi dua resolusi dari `correct_perspective` + `detect_answer_boxes`
+    untuk gambar yang sudah ada di memori: layout dianalisis di proxy
+    berukuran `layout_scale`, crop diambil dari resolusi penuh.
+    """
+    h, w = image.shape[:2]
+    proxy = cv2.resize(image, (max(1, int(round(w * layout_scale))), max(1, int(round(h * layout_scale)))),
+                       interpolation=cv2.INTER_AREA)
+    layout = analyze_layout(proxy, layout_scale, max_boxes=max_boxes, deskew=deskew)
+    return crop_answer_boxes(image, layout)
 
 
 # ========================================================================
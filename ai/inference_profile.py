@@ -0,0 +1,248 @@
+"""
+Profil inferensi CPU untuk engine TrOCR PyTorch: jumlah thread intra-op /
+inter-op per worker, autocast bf16 (opsional, hanya jika CPU mendukung),
+dan `torch.compile` encoder (opsional). Generate selalu berjalan di dalam
+`torch.inference_mode()`.
+
+Tanpa pengaturan, setiap worker mendapat `jumlah core // jumlah worker`
+thread sehingga beberapa worker OCR di satu host tidak saling berebut core.
+Auto-tuner mengukur lines/sec untuk beberapa pembagian worker x thread
+(dan opsional bf16/compile) pada mesin ini lalu menyimpan konfigurasi
+terbaik ke OCR_TUNING_FILE; file itu dipakai sebagai default berikutnya
+(variabel environment tetap menang).
+
+    python inference_profile.py --pdf-dir files --workers 1 2 4
+    python inference_profile.py --bf16 --compile --lines 64
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import time
+
+# 0 = dari hasil tuning, atau jumlah core // jumlah worker
+OCR_TORCH_THREADS = int(os.getenv("OCR_TORCH_THREADS", "0"))
+OCR_TORCH_INTEROP_THREADS = int(os.getenv("OCR_TORCH_INTEROP_THREADS", "1"))
+# "1"/"0" memaksa on/off; kosong = dari hasil tuning (default off)
+OCR_TORCH_BF16 = os.getenv("OCR_TORCH_BF16", "")
+OCR_TORCH_COMPILE = os.getenv("OCR_TORCH_COMPILE", "")
+OCR_TUNING_FILE = os.getenv("OCR_TUNING_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                            "inference_tuning.json"))
+
+_PROFILE = None  # profil yang sudah diterapkan di proses ini
+
+def cpu_count():
+    """Jumlah core yang boleh dipakai proses ini."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def bf16_supported():
+    """True jika CPU punya instruksi bf16 native (AVX512-BF16/AMX) yang dipakai oneDNN."""
+    import torch
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+def load_tuning(path=OCR_TUNING_FILE):
+    """Hasil auto-tuner terakhir, atau None jika belum ada / diukur di mesin dengan jumlah core lain."""
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        tuning = json.load(f)
+    if tuning.get("cpus") != cpu_count():
+        print(f"⚠️ [Inference] {path} diukur untuk {tuning.get('cpus')} core, mesin ini {cpu_count()}; diabaikan.")
+        return None
+    return tuning
+
+def _flag(value, default):
+    return default if value == "" else value == "1"
+
+def resolve_profile(workers=None, torch_threads=None):
+    """
+    Profil inferensi untuk `workers` proses OCR di host ini:
+    `{"workers", "torch_threads", "interop_threads", "bf16", "compile"}`.
+    Urutan prioritas: argumen, environment, hasil tuning, lalu default.
+    """
+    tuning = load_tuning() or {}
+    workers = workers or tuning.get("workers") or 1
+    threads = torch_threads or OCR_TORCH_THREADS
+    if not threads and tuning.get("workers") == workers:
+        threads = tuning.get("torch_threads")
+    return {
+        "workers": workers,
+        "torch_threads": threads or max(1, cpu_count() // workers),
+        "interop_threads": OCR_TORCH_INTEROP_THREADS,
+        "bf16": _flag(OCR_TORCH_BF16, tuning.get("bf16", False)),
+        "compile": _flag(OCR_TORCH_COMPILE, tuning.get("compile", False)),
+    }
+
+def apply_profile(profile):
+    """
+    Menerapkan jumlah thread torch/OpenCV di proses ini (panggil di awal
+    proses worker, sebelum model dimuat) dan menyimpan profil untuk engine.
+    Dengan lebih dari satu worker, OpenCV dibatasi satu thread: preprocessing
+    sudah paralel antar proses, dan thread pool OpenCV tiap worker hanya
+    berebut core dengan inferensi worker lain.
+    """
+    global _PROFILE
+    import cv2
+    import torch
+
+    torch.set_num_threads(profile["torch_threads"])
+    try:
+        torch.set_num_interop_threads(profile["interop_threads"])
+    except RuntimeError:
+        # Hanya bisa diset sekali, sebelum ada kerja paralel inter-op
+        pass
+    cv2.setNumThreads(1 if profile["workers"] > 1 else profile["torch_threads"])
+    _PROFILE = profile
+    return profile
+
+def current_profile():
+    """Profil yang sudah diterapkan, atau profil default satu worker (tanpa mengubah thread)."""
+    return _PROFILE or resolve_profile(workers=1)
+
+
+# ========================================================================
+#  AUTO-TUNER
+# ========================================================================
+def candidate_splits(cpus, workers_options=None):
+    """Pembagian `(workers, threads)` yang memakai semua core tanpa oversubscribe."""
+    workers_options = workers_options or [w for w in (1, 2, 4, 8) if w <= cpus]
+    return [(workers, max(1, cpus // workers)) for workers in workers_options if workers <= cpus]
+
+def _tune_worker(profile, model_name, images, batch_size, repeats, barrier, results):
+    from PIL import Image
+    from model_registry import warmup
+    from ocr_processing import ocr_batch
+
+    try:
+        apply_profile(profile)
+        warmup(model_name=model_name, engine="torch")
+        batch = [Image.fromarray(image) for image in images]
+        ocr_batch(batch[:batch_size], batch_size=batch_size, model_name=model_name, engine="torch")
+        barrier.wait()
+        start = time.perf_counter()
+        for _ in range(repeats):
+            ocr_batch(batch, batch_size=batch_size, model_name=model_name, engine="torch")
+        results.put((len(batch) * repeats, time.perf_counter() - start, None))
+    except Exception as e:
+        barrier.abort()
+        results.put((0, 0.0, repr(e)))
+
+def measure_profile(profile, model_name, images, batch_size, repeats=1):
+    """
+    Throughput (lines/sec total) `profile["workers"]` proses yang masing-
+    masing meng-OCR `images` sebanyak `repeats` kali secara bersamaan.
+    Waktu load model dan warmup tidak ikut diukur.
+    """
+    ctx = mp.get_context("spawn")
+    barrier = ctx.Barrier(profile["workers"])
+    results = ctx.Queue()
+    processes = [ctx.Process(target=_tune_worker, args=(profile, model_name, images, batch_size, repeats, barrier, results))
+                 for _ in range(profile["workers"])]
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    errors = [error for _, _, error in outcomes if error]
+    if errors:
+        raise RuntimeError(errors[0])
+    return sum(lines for lines, _, _ in outcomes) / max(seconds for _, seconds, _ in outcomes)
+
+def autotune(images, model_name, batch_size, workers_options=None, try_bf16=False, try_compile=False, repeats=1,
+             path=OCR_TUNING_FILE):
+    """
+    Mengukur semua kandidat profil pada crop baris `images` (array numpy),
+    mencetak tabelnya, lalu menyimpan yang tercepat ke `path`.
+    Mengembalikan dict hasil tuning.
+    """
+    cpus = cpu_count()
+    variants = [(False, False)]
+    if try_bf16:
+        if bf16_supported():
+            variants.append((True, False))
+        else:
+            print("[INFO] CPU tidak mendukung bf16 native; kandidat bf16 dilewati.")
+    if try_compile:
+        variants += [(bf16, True) for bf16, _ in list(variants)]
+
+    candidates = []
+    for workers, threads in candidate_splits(cpus, workers_options):
+        for bf16, compile_encoder in variants:
+            profile = {"workers": workers, "torch_threads": threads, "interop_threads": OCR_TORCH_INTEROP_THREADS,
+                       "bf16": bf16, "compile": compile_encoder}
+            print(f"[INFO] Mengukur {workers} worker x {threads} thread"
+                  f"{' bf16' if bf16 else ''}{' compile' if compile_encoder else ''}...")
+            try:
+                lines_per_s = round(measure_profile(profile, model_name, images, batch_size, repeats), 3)
+            except RuntimeError as e:
+                print(f"⚠️ [Inference] Kandidat gagal: {e}")
+                continue
+            candidates.append({**profile, "lines_per_s": lines_per_s})
+
+    if not candidates:
+        raise RuntimeError("Semua kandidat profil gagal diukur")
+
+    print(f"\n{'worker':>6} {'thread':>6} {'bf16':>5} {'compile':>7} {'baris/s':>9}")
+    for c in candidates:
+        print(f"{c['workers']:>6} {c['torch_threads']:>6} {c['bf16']!s:>5} {c['compile']!s:>7} {c['lines_per_s']:>9}")
+
+    best = max(candidates, key=lambda c: c["lines_per_s"])
+    tuning = {
+        **best,
+        "cpus": cpus,
+        "model": model_name,
+        "batch_size": batch_size,
+        "lines": len(images) * repeats,
+        "measured_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "candidates": candidates,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(tuning, f, indent=2)
+    print(f"\n✅ Profil terbaik: {best['workers']} worker x {best['torch_threads']} thread"
+          f"{', bf16' if best['bf16'] else ''}{', compile' if best['compile'] else ''} "
+          f"({best['lines_per_s']} baris/s), disimpan ke {path}")
+    return tuning
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf-dir", default="files", help="folder PDF sampel untuk crop baris")
+    parser.add_argument("--lines", type=int, default=32, help="jumlah crop baris per worker")
+    parser.add_argument("--repeats", type=int, default=1, help="berapa kali tiap worker meng-OCR semua crop")
+    parser.add_argument("--workers", type=int, nargs="+", default=None,
+                        help="jumlah worker yang dicoba (default: 1, 2, 4, 8 sampai jumlah core)")
+    parser.add_argument("--bf16", action="store_true", help="coba juga autocast bf16 (jika CPU mendukung)")
+    parser.add_argument("--compile", action="store_true", help="coba juga torch.compile encoder")
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--out", default=OCR_TUNING_FILE, help="file hasil tuning (default: OCR_TUNING_FILE)")
+    args = parser.parse_args()
+
+    import glob
+    from compare_engines import collect_line_crops
+    from model_registry import DEFAULT_OCR_MODEL
+    from ocr_processing import OCR_BATCH_SIZE
+    import numpy as np
+
+    images = []
+    for pdf_path in sorted(glob.glob(os.path.join(args.pdf_dir, "*.pdf"))):
+        images.extend(np.asarray(image) for image in collect_line_crops(pdf_path))
+        if len(images) >= args.lines:
+            break
+    if not images:
+        parser.error(f"tidak ada crop baris dari PDF di {args.pdf_dir}")
+    images = images[:args.lines]
+    print(f"[INFO] {len(images)} crop baris, {cpu_count()} core.")
+
+    autotune(images, args.model or DEFAULT_OCR_MODEL, args.batch_size or OCR_BATCH_SIZE, workers_options=args.workers,
+             try_bf16=args.bf16, try_compile=args.compile, repeats=args.repeats, path=args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import os
+import cv2
+import numpy as np
+
+from page_context import gray_of
+
+# Prefilter tinta: kotak kosong dan "baris" noise tidak dikirim ke TrOCR.
+# Set OCR_INK_FILTER=0 untuk menonaktifkan.
+OCR_INK_FILTER = os.getenv("OCR_INK_FILTER", "1") != "0"
+# Kotak dianggap kosong hanya jika rasio tinta DAN jumlah komponen sama-sama
+# di bawah batas (dihitung di resolusi 1/4, setelah garis bantu dibuang).
+OCR_BOX_MIN_INK = float(os.getenv("OCR_BOX_MIN_INK", "0.001"))
+OCR_BOX_MIN_COMPONENTS = int(os.getenv("OCR_BOX_MIN_COMPONENTS", "3"))
+# Baris noise: komponen terbesar terlalu kecil (bintik) atau komponen
+# tertinggi terlalu pendek (sisa garis bantu yang tidak terhapus).
+OCR_LINE_MIN_COMPONENT_AREA = int(os.getenv("OCR_LINE_MIN_COMPONENT_AREA", "60"))
+OCR_LINE_MIN_STROKE_HEIGHT = int(os.getenv("OCR_LINE_MIN_STROKE_HEIGHT", "8"))
+
+BOX_SCALE = 0.25
+RULE_FILL_RATIO = 0.3  # baris/kolom piksel dengan tinta > 30% dianggap garis bantu/bingkai
+
+def filter_id():
+    """Identitas konfigurasi filter untuk key cache halaman."""
+    if not OCR_INK_FILTER:
+        return "off"
+    return f"{OCR_BOX_MIN_INK}:{OCR_BOX_MIN_COMPONENTS}:{OCR_LINE_MIN_COMPONENT_AREA}:{OCR_LINE_MIN_STROKE_HEIGHT}"
+
+def box_ink_stats(color_image):
+    """
+    Rasio tinta dan jumlah komponen tinta pada crop kotak jawaban (BGR
+    atau PageContext).
+    Tinta dicari dengan threshold adaptif di versi 1/4 resolusi (tahan
+    terhadap pencahayaan tidak rata), lalu baris/kolom yang hampir penuh
+    tinta (garis bantu dan bingkai kotak) dibuang sebelum dihitung.
+    """
+    gray = gray_of(color_image)
+    small = cv2.resize(gray, None, fx=BOX_SCALE, fy=BOX_SCALE, interpolation=cv2.INTER_AREA)
+    ink = cv2.adaptiveThreshold(small, 1, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 15, 20)
+    ink[ink.mean(axis=1) > RULE_FILL_RATIO, :] = 0
+    ink[:, ink.mean(axis=0) > RULE_FILL_RATIO] = 0
+
+    _, _, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+    n_components = int(np.count_nonzero(stats[1:, cv2.CC_STAT_AREA] >= 4))
+    return float(ink.mean()), n_components
+
+def box_skip_reason(color_image):
+    """Alasan kotak dilewati ("blank_box"), atau None jika kotak berisi tulisan."""
+    if not OCR_INK_FILTER:
+        return None
+    ink_ratio, n_components = box_ink_stats(color_image)
+    if ink_ratio < OCR_BOX_MIN_INK and n_components < OCR_BOX_MIN_COMPONENTS:
+        return "blank_box"
+    return None
+
+def line_skip_reason(roi):
+    """
+    Alasan crop baris (teks hitam, latar putih) dilewati, atau None:
+
+    - "empty": tidak ada piksel tinta
+    - "specks": hanya bintik-bintik kecil
+    - "rule_residue": hanya goresan setipis sisa garis bantu
+    """
+    if not OCR_INK_FILTER:
+        return None
+    ink = (roi == 0).view(np.uint8)
+    n, _, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+    if n <= 1:
+        return "empty"
+    if stats[1:, cv2.CC_STAT_AREA].max() < OCR_LINE_MIN_COMPONENT_AREA:
+        return "specks"
+    if stats[1:, cv2.CC_STAT_HEIGHT].max() < OCR_LINE_MIN_STROKE_HEIGHT:
+        return "rule_residue"
+    return None
@@ -0,0 +1,357 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+
+# Instrumentasi pipeline OCR: timer per tahap, counter, dan trace per job.
+# Tanpa trace aktif, `stage`/`timed`/`count` hanya memeriksa satu global.
+# Set OCR_METRICS=1 agar worker OCR merekam trace setiap job (dicetak sebagai
+# log JSON dan diagregasi untuk endpoint Prometheus di backend).
+OCR_METRICS = os.getenv("OCR_METRICS", "0") == "1"
+# Batas memori per job (MiB) untuk buffer yang dialokasikan pipeline selama
+# job berjalan (array numpy/OpenCV, diukur lewat tracemalloc; bobot model dan
+# buffer internal MuPDF/torch tidak termasuk). Job yang melewatinya dihentikan
+# dengan MemoryBudgetExceeded alih-alih membuat worker kena OOM.
+# 0 = tanpa batas (dan tanpa pengukuran memori, karena tracemalloc menambah
+# overhead pada setiap alokasi Python).
+OCR_JOB_MEMORY_MB = int(os.getenv("OCR_JOB_MEMORY_MB", "0"))
+
+# Tahap pipeline OCR yang diukur (urutan dipakai untuk laporan)
+STAGES = ("rasterize", "perspective", "boxes", "deskew", "line_removal", "segmentation", "ocr", "text_layer")
+# Counter yang dilaporkan (nama lain tetap direkam jika dipakai)
+COUNTERS = ("pages", "text_layer_pages", "contours", "boxes", "boxes_skipped", "lines", "lines_skipped", "model_calls", "tokens_generated",
+            "padding_tokens")
+
+MB = 1024 * 1024
+
+class MemoryBudgetExceeded(MemoryError):
+    """Job melewati batas memori OCR_JOB_MEMORY_MB."""
+
+
+class MemoryTracker:
+    """
+    Peak memori (byte di atas baseline saat job mulai) seluruh job dan per
+    tahap, dari tracemalloc. Peak tiap interval antar batas tahap dihitung
+    ke semua tahap yang sedang aktif saat itu (dari thread mana pun), jadi
+    peak tahap adalah puncak memori proses selama tahap itu berjalan.
+    Batas `limit` diperiksa di setiap batas tahap dan sebelum alokasi besar
+    yang diumumkan lewat `reserve_memory`.
+    """
+
+    def __init__(self, limit=0):
+        self.limit = limit
+        self.peak = 0
+        self.stage_peaks = {}
+        self._active = {}
+        self._started = not tracemalloc.is_tracing()
+        if self._started:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self.baseline = tracemalloc.get_traced_memory()[0]
+
+    def _fold(self):
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        peak -= self.baseline
+        self.peak = max(self.peak, peak)
+        for entry in self._active.values():
+            entry[1] = max(entry[1], peak)
+        return current - self.baseline
+
+    def _check(self, used, what):
+        if self.limit and used > self.limit:
+            raise MemoryBudgetExceeded(f"Memori job melebihi batas {self.limit / MB:.0f} MiB "
+                                       f"({used / MB:.0f} MiB, {what})")
+
+    def enter(self, key, name):
+        current = self._fold()
+        self._active[key] = [name, current]
+        self._check(self.peak, f"sebelum tahap {name}")
+
+    def exit(self, key, check=True):
+        self._fold()
+        name, peak = self._active.pop(key)
+        self.stage_peaks[name] = max(self.stage_peaks.get(name, 0), peak)
+        if check:
+            self._check(peak, f"tahap {name}")
+
+    def reserve(self, nbytes, what):
+        current = self._fold()
+        self._check(current + nbytes, f"{what} butuh {nbytes / MB:.0f} MiB")
+
+    def stop(self):
+        self._fold()
+        if self._started:
+            tracemalloc.stop()
+
+    def as_dict(self):
+        return {
+            "limit_mb": round(self.limit / MB, 1) if self.limit else None,
+            "peak_mb": round(self.peak / MB, 1),
+            "stages": {name: round(peak / MB, 1) for name, peak in self.stage_peaks.items()},
+        }
+
+
+class Trace:
+    """
+    Record satu job: wall time dan jumlah panggilan per tahap, counter, dan
+    metadata (mis. job_id, nama PDF). Aman dipakai dari beberapa thread
+    (mis. thread render PDF prefetch). Dengan `memory` (MemoryTracker), peak
+    memori job dan per tahap ikut direkam.
+    """
+
+    def __init__(self, memory=None, **meta):
+        self.meta = meta
+        self.seconds = {}
+        self.calls = {}
+        self.counters = {}
+        self.memory = memory
+        self.started_at = time.time()
+        self.wall = None
+        self._lock = threading.Lock()
+
+    def add_stage(self, name, elapsed):
+        with self._lock:
+            self.seconds[name] = self.seconds.get(name, 0.0) + elapsed
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def add_count(self, name, n):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def enter_memory(self, key, name):
+        with self._lock:
+            self.memory.enter(key, name)
+
+    def exit_memory(self, key, check=True):
+        with self._lock:
+            self.memory.exit(key, check=check)
+
+    def reserve_memory(self, nbytes, what):
+        with self._lock:
+            self.memory.reserve(nbytes, what)
+
+    def as_dict(self):
+        with self._lock:
+            record = {
+                **self.meta,
+                "started_at": self.started_at,
+                "wall_s": self.wall,
+                "stages": {name: {"s": round(self.seconds[name], 6), "calls": self.calls[name]} for name in self.seconds},
+                "counters": dict(self.counters),
+            }
+            if self.memory is not None:
+                record["memory"] = self.memory.as_dict()
+            return record
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _Stage:
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        # Tahap bersarang dengan nama sama (mis. estimate_skew_angle di dalam
+        # deskew_crop) hanya dihitung sekali, oleh yang terluar
+        active = _local.__dict__.setdefault("active", set())
+        self.outer = self.name not in active
+        if self.outer:
+            active.add(self.name)
+            self.start = time.perf_counter()
+            if self.trace.memory is not None:
+                try:
+                    self.trace.enter_memory(id(self), self.name)
+                except MemoryBudgetExceeded:
+                    self.trace.exit_memory(id(self), check=False)
+                    active.discard(self.name)
+                    raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.outer:
+            self.trace.add_stage(self.name, time.perf_counter() - self.start)
+            _local.active.discard(self.name)
+            if self.trace.memory is not None:
+                # Tidak menimpa exception yang sedang berjalan
+                self.trace.exit_memory(id(self), check=exc_type is None)
+        return False
+
+
+_NULL_STAGE = _NullStage()
+_local = threading.local()
+_TRACE = None
+
+def stage(name):
+    """Context manager yang mengukur blok sebagai tahap `name` (no-op tanpa trace aktif)."""
+    trace = _TRACE
+    return _NULL_STAGE if trace is None else _Stage(trace, name)
+
+def timed(name):
+    """Decorator: seluruh panggilan fungsi diukur sebagai tahap `name`."""
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            trace = _TRACE
+            if trace is None:
+                return fn(*args, **kwargs)
+            with _Stage(trace, name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def count(name, n=1):
+    """Menambah counter `name` pada trace aktif (no-op tanpa trace aktif)."""
+    trace = _TRACE
+    if trace is not None:
+        trace.add_count(name, n)
+
+def is_tracing():
+    """True jika ada trace aktif (untuk counter yang mahal dihitung)."""
+    return _TRACE is not None
+
+def reserve_memory(nbytes, what):
+    """
+    Memeriksa sebelum alokasi besar (mis. render halaman) bahwa `nbytes` masih
+    muat dalam batas memori job; jika tidak, MemoryBudgetExceeded dilempar
+    sebelum memori dialokasikan. No-op tanpa trace yang mengukur memori.
+    """
+    trace = _TRACE
+    if trace is not None and trace.memory is not None:
+        trace.reserve_memory(nbytes, what)
+
+@contextmanager
+def trace(memory=False, memory_limit_mb=0, **meta):
+    """
+    Mengaktifkan `Trace` baru (global, semua thread) selama blok `with`.
+    Dengan `memory` atau `memory_limit_mb` > 0, peak memori job dan per tahap
+    diukur (lihat MemoryTracker) dan job dihentikan jika melewati batas.
+    """
+    global _TRACE
+    tracker = MemoryTracker(memory_limit_mb * MB) if memory or memory_limit_mb else None
+    current = Trace(memory=tracker, **meta)
+    previous, _TRACE = _TRACE, current
+    start = time.perf_counter()
+    try:
+        yield current
+    finally:
+        current.wall = round(time.perf_counter() - start, 6)
+        _TRACE = previous
+        if tracker is not None:
+            tracker.stop()
+
+def log_trace(record):
+    """Mencetak trace job sebagai satu baris JSON (structured log)."""
+    print("[TRACE] " + json.dumps({"event": "ocr_trace", **record}, sort_keys=True, default=str), flush=True)
+
+def memory_report(record):
+    """Ringkasan satu baris peak memori job dan per tahap dari `Trace.as_dict()` (None jika tidak diukur)."""
+    memory = record.get("memory")
+    if not memory:
+        return None
+    limit = f" (batas {memory['limit_mb']:.0f} MiB)" if memory["limit_mb"] else ""
+    stages = ", ".join(f"{name} {memory['stages'][name]:.1f}" for name in _ordered(memory["stages"], STAGES)
+                       if name in memory["stages"])
+    return f"Peak memori {memory['peak_mb']:.1f} MiB{limit}; per tahap (MiB): {stages or '-'}"
+
+def batch_stats(counters):
+    """
+    Efisiensi batch OCR dari counter trace: rata-rata token hasil per
+    panggilan model dan fraksi langkah decode yang terbuang untuk token
+    padding (anggota batch yang sudah selesai menunggu anggota terpanjang).
+    None jika tidak ada panggilan model.
+    """
+    calls = counters.get("model_calls", 0)
+    if not calls:
+        return None
+    tokens = counters.get("tokens_generated", 0)
+    slots = tokens + counters.get("padding_tokens", 0)
+    return {
+        "tokens_per_batch": round(tokens / calls, 2),
+        "padding_waste": round(counters.get("padding_tokens", 0) / slots, 4) if slots else 0.0,
+    }
+
+
+# ========================================================================
+#  AGREGASI (proses backend) + FORMAT PROMETHEUS
+# ========================================================================
+class MetricsRegistry:
+    """Agregat trace dari banyak job, diekspor dalam format teks Prometheus."""
+
+    def __init__(self, prefix="ocr"):
+        self.prefix = prefix
+        self.jobs = {}
+        self.job_seconds = 0.0
+        self.stage_seconds = {}
+        self.stage_calls = {}
+        self.counters = {}
+        self.peak_memory_mb = None
+        self.stage_peak_memory_mb = {}
+        self._lock = threading.Lock()
+
+    def observe(self, record=None, status="done"):
+        """Menambahkan satu job (`record` dari `Trace.as_dict()`, atau None jika tidak direkam)."""
+        with self._lock:
+            self.jobs[status] = self.jobs.get(status, 0) + 1
+            if not record:
+                return
+            self.job_seconds += record.get("wall_s") or 0.0
+            for name, entry in record.get("stages", {}).items():
+                self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + entry["s"]
+                self.stage_calls[name] = self.stage_calls.get(name, 0) + entry["calls"]
+            for name, n in record.get("counters", {}).items():
+                self.counters[name] = self.counters.get(name, 0) + n
+            memory = record.get("memory")
+            if memory:
+                self.peak_memory_mb = max(self.peak_memory_mb or 0.0, memory["peak_mb"])
+                for name, peak in memory["stages"].items():
+                    self.stage_peak_memory_mb[name] = max(self.stage_peak_memory_mb.get(name, 0.0), peak)
+
+    def prometheus_text(self):
+        p = self.prefix
+        with self._lock:
+            traced_jobs = self.jobs.get("done", 0)
+            lines = [
+                f"# HELP {p}_jobs_total Jumlah job OCR yang selesai, per status.",
+                f"# TYPE {p}_jobs_total counter",
+                *(f'{p}_jobs_total{{status="{status}"}} {n}' for status, n in sorted(self.jobs.items())),
+                f"# HELP {p}_job_seconds Wall time job OCR yang direkam.",
+                f"# TYPE {p}_job_seconds summary",
+                f"{p}_job_seconds_sum {self.job_seconds:.6f}",
+                f"{p}_job_seconds_count {traced_jobs}",
+                f"# HELP {p}_stage_seconds_total Total wall time per tahap pipeline OCR.",
+                f"# TYPE {p}_stage_seconds_total counter",
+                *(f'{p}_stage_seconds_total{{stage="{name}"}} {self.stage_seconds.get(name, 0.0):.6f}'
+                  for name in _ordered(self.stage_seconds, STAGES)),
+                f"# HELP {p}_stage_calls_total Jumlah panggilan per tahap pipeline OCR.",
+                f"# TYPE {p}_stage_calls_total counter",
+                *(f'{p}_stage_calls_total{{stage="{name}"}} {self.stage_calls.get(name, 0)}'
+                  for name in _ordered(self.stage_calls, STAGES)),
+            ]
+            for name in _ordered(self.counters, COUNTERS):
+                lines += [f"# TYPE {p}_{name}_total counter", f"{p}_{name}_total {self.counters.get(name, 0)}"]
+            if self.peak_memory_mb is not None:
+                lines += [
+                    f"# HELP {p}_job_peak_memory_bytes Peak memori job OCR terbesar (OCR_JOB_MEMORY_MB).",
+                    f"# TYPE {p}_job_peak_memory_bytes gauge",
+                    f"{p}_job_peak_memory_bytes {int(self.peak_memory_mb * MB)}",
+                    f"# HELP {p}_stage_peak_memory_bytes Peak memori terbesar per tahap pipeline OCR.",
+                    f"# TYPE {p}_stage_peak_memory_bytes gauge",
+                    *(f'{p}_stage_peak_memory_bytes{{stage="{name}"}} {int(self.stage_peak_memory_mb[name] * MB)}'
+                      for name in _ordered(self.stage_peak_memory_mb, STAGES) if name in self.stage_peak_memory_mb),
+                ]
+        return "\n".join(lines) + "\n"
+
+
+def _ordered(values, known):
+    return list(known) + sorted(name for name in values if name not in known)
@@ -1,60 +1,362 @@
-import fitz
+import argparse
 import os
-import cv2
 import re
-from image_processing import correct_perspective, detect_answer_boxes
-from ocr_processing import segment_and_ocr
+from image_processing import correct_perspective, detect_answer_boxes, analyze_layout, crop_answer_boxes
+from ocr_processing import extract_line_crops, ocr_pages_line_results, OCR_BATCH_SIZE
+from model_registry import DEFAULT_OCR_MODEL, OCR_ENGINE
+from ocr_cache import get_ocr_cache, content_key, file_key
+from decoding_policy import DecodingPolicy, get_decoding_policy, set_decoding_policy
+from ink_filter import filter_id
+from deskew import estimate_skew_angle, deskew_id
+from page_context import PageContext
+from instrumentation import count
+from sheet_template import SheetTemplate
+from text_layer import iter_text_layer_pages, text_layer_id, text_layer_pages
+from debug_writer import enable_debug, disable_debug
+from pdf_processing import iter_pdf_pages, iter_pdf_layout_pages, crop_page_answer_boxes, RENDER_DPI, LAYOUT_DPI, OCR_LOW_MEMORY
 
-def pdf_to_images(pdf_path, output_folder="output_images"):
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
 
-    doc = fitz.open(pdf_path)
-    image_paths = []
+def iter_page_sources(pdf_path, max_boxes=2, save_dir=None, layout_dpi=None, template=None, skip_pages=()):
+    """
+    Generator `(page_number, raster, find_boxes)` per halaman. `raster` adalah
+    gambar halaman yang dipakai untuk analisis (dipakai juga sebagai key
+    cache), `find_boxes(stats=None)` mengembalikan `(crop kotak jawaban, sudut
+    kemiringan halaman)`; sudut diestimasi sekali per halaman di resolusi
+    rendah dan dipakai ulang untuk deskew setiap crop. `stats` (dict) diisi
+    statistik deteksi kotak (lihat `find_answer_box_rects`).
 
-    for page_number in range(len(doc)):
-        page = doc[page_number]
-        pix = page.get_pixmap(dpi=300)
-        img_path = os.path.join(output_folder, f"page_{page_number+1}.png")
-        pix.save(img_path)
-        image_paths.append(img_path)
+    Jika `layout_dpi` diisi, layout dianalisis di resolusi rendah dan hanya
+    kotak jawaban yang dirender di resolusi penuh; jika tidak, seluruh
+    halaman diproses di 300 DPI. Dengan OCR_LOW_MEMORY, halaman 300 DPI itu
+    dianalisis sebagai grayscale dan kotak jawaban dirender ulang berwarna
+    (`raster` berupa gambar grayscale).
 
-    return image_paths
+    Jika `template` (SheetTemplate) diberikan, setiap halaman diregistrasi
+    ke template dan kotak langsung dipotong dari layout template; deteksi
+    kontur hanya dijalankan jika registrasi gagal.
 
+    Halaman di `skip_pages` (mis. halaman dengan text layer) dilewati tanpa
+    dirender.
+    """
+    if OCR_LOW_MEMORY and not layout_dpi:
+        layout_dpi = RENDER_DPI
+    if layout_dpi:
+        scale = layout_dpi / RENDER_DPI
+        for page_number, page, proxy in iter_pdf_layout_pages(pdf_path, layout_dpi=layout_dpi, skip_pages=skip_pages):
+            def find_boxes(stats=None, page=page, proxy=proxy, page_number=page_number):
+                layout = template.layout_for(proxy, page_number, scale=scale) if template else None
+                if layout is None:
+                    layout = analyze_layout(proxy, scale, max_boxes=max_boxes, stats=stats)
+                return crop_page_answer_boxes(page, layout, dpi=RENDER_DPI), layout["skew"]
+            count("pages")
+            yield page_number, proxy, find_boxes
+        return
 
-def main():
-    pdf_path = "files/test10.pdf"
+    # Halaman dirender secara streaming: halaman berikutnya dirender di
+    # background selama halaman saat ini diproses.
+    for page_number, image in iter_pdf_pages(pdf_path, save_dir=save_dir, skip_pages=skip_pages):
+        def find_boxes(stats=None, image=image, page_number=page_number):
+            # 0. Template lembar jawaban: registrasi lalu potong kotak langsung
+            layout = template.layout_for(image, page_number) if template else None
+            if layout is not None:
+                return crop_answer_boxes(image, layout), layout["skew"]
+
+            # 1. Koreksi perspektif (turunan gray/threshold halaman dipakai
+            #    bersama oleh tahap-tahap berikutnya lewat PageContext)
+            page = correct_perspective(PageContext(image))
+
+            # 2. Deteksi kotak jawaban + sudut kemiringan halaman
+            boxes = detect_answer_boxes(page, max_boxes=max_boxes, visualize=False, stats=stats)
+            return boxes, estimate_skew_angle(page, min_line_length=100)
+        count("pages")
+        yield page_number, image, find_boxes
+
+
+def format_box_text(text):
+    text = re.sub(r'\n+', '\n', text).strip()  
+    return text + "\n"
+
+
+def box_result(box_idx, lines, bboxes=None):
+    """
+    Hasil terstruktur satu kotak jawaban dari list `(teks, confidence)` per
+    baris dan bbox `(x, y, w, h)` tiap baris (koordinat kotak, piksel 300
+    DPI; None jika tidak diketahui):
+
+        {"box", "text", "confidence", "lines": [{"line", "text", "bbox", "confidence"}]}
+
+    `confidence` kotak adalah rata-rata confidence barisnya (None jika kosong).
+    """
+    bboxes = bboxes or [None] * len(lines)
+    confidences = [confidence for _, confidence in lines if confidence is not None]
+    return {
+        "box": box_idx,
+        "text": "\n".join(text for text, _ in lines),
+        "confidence": round(sum(confidences) / len(confidences), 4) if confidences else None,
+        "lines": [{"line": line_idx, "text": text, "bbox": list(bbox) if bbox else None, "confidence": confidence}
+                  for line_idx, ((text, confidence), bbox) in enumerate(zip(lines, bboxes))],
+    }
+
+
+def box_progress(page_number, boxes_lines, on_event, line_bboxes=None):
+    """
+    Callback `on_line` untuk satu halaman: meneruskan setiap baris sebagai
+    event "line" dan mengirim "box_done" (berisi `box_result`) begitu baris
+    terakhir sebuah kotak selesai (kotak tanpa baris langsung dilaporkan
+    selesai).
+    """
+    line_bboxes = line_bboxes or [[None] * len(lines) for lines in boxes_lines]
+    lines_results = [[None] * len(lines) for lines in boxes_lines]
+    remaining = [len(lines) for lines in boxes_lines]
+    for box_idx, n_lines in enumerate(remaining):
+        if n_lines == 0:
+            on_event({"type": "box_done", "page": page_number, **box_result(box_idx, [])})
+
+    def on_line(pos, text, confidence):
+        _, box_idx, line_idx = pos
+        bbox = line_bboxes[box_idx][line_idx]
+        on_event({"type": "line", "page": page_number, "box": box_idx, "line": line_idx, "text": text,
+                  "bbox": list(bbox) if bbox else None, "confidence": confidence})
+        lines_results[box_idx][line_idx] = (text, confidence)
+        remaining[box_idx] -= 1
+        if remaining[box_idx] == 0:
+            on_event({"type": "box_done", "page": page_number,
+                      **box_result(box_idx, lines_results[box_idx], line_bboxes[box_idx])})
+    return on_line
+
+
+def result_text(result):
+    """Teks gabungan hasil `ocr_pdf` (satu blok per kotak jawaban, urut halaman)."""
+    return "\n".join(format_box_text(box["text"]) for page in result["pages"] for box in page["boxes"])
+
+
+def ocr_pdf(pdf_path, save_dir=None, layout_dpi=None, model_name=DEFAULT_OCR_MODEL, engine=OCR_ENGINE, cache=None,
+            skip_log=None, page_meta=None, template=None, on_event=None):
+    """
+    Menjalankan pipeline OCR lengkap untuk satu PDF dan mengembalikan hasil
+    terstruktur, urut halaman lalu kotak jawaban:
+
+        {"pages": [{"page", "source", "boxes": [box_result, ...]}], "text"}
+
+    dengan `box_result` berisi teks kotak dan tiap baris beserta bbox dan
+    confidence-nya (lihat `box_result`), dan "text" gabungan semua kotak
+    (sama dengan `process_pdf`). Tidak menulis file hasil; PNG halaman hanya
+    disimpan jika `save_dir` diisi.
+
+    Jika cache aktif (`cache` atau OCR_CACHE_DIR), hasil disimpan per PDF,
+    per halaman (crop baris), dan per baris (teks), sehingga upload ulang
+    langsung kembali dan perubahan parameter hanya menjalankan ulang tahap
+    yang terpengaruh.
 
-    print("[INFO] Mengubah PDF ke gambar...")
-    images = pdf_to_images(pdf_path)
+    Kotak kosong dan baris noise dilewati tanpa OCR; jika `skip_log` (list)
+    diberikan, alasan tiap region yang dilewati ditambahkan ke dalamnya
+    beserta nomor halaman dan kotak (hanya untuk halaman yang tidak diambil
+    dari cache). Dengan cara yang sama, `page_meta` (list) diisi
+    `{"page", "source", "skew_angle", "box_detection", "boxes": [info deskew
+    per kotak], "lines": jumlah crop baris}` (`source` "cache" untuk halaman
+    yang segmentasinya diambil dari cache halaman);
+    `box_detection` berisi jumlah kontur dan waktu deteksi kotak (kosong jika
+    kotak diambil dari template).
 
-    all_text = []
+    Halaman yang punya text layer asli (PDF ketikan, lihat `text_layer`)
+    tidak dirasterisasi maupun di-OCR: teks tiap kotak diambil langsung dari
+    PDF (`source` "text_layer" dengan confidence 1.0, sisanya "ocr"). Hasil
+    akhir tetap urut halaman.
+
+    `template` (SheetTemplate, opsional) menggantikan deteksi kotak per scan
+    dengan registrasi ke template lembar jawaban.
+
+    `on_event(event)` (opsional) menerima progres selama pemrosesan, berupa
+    dict dengan `type`:
+    - "page_started": `{page}`
+    - "boxes_detected": `{page, boxes, lines}` (jumlah kotak dan baris per kotak)
+    - "line": `{page, box, line, text, bbox, confidence}` begitu satu baris selesai di-OCR
+    - "box_done": `{page, **box_result}` begitu semua baris kotak selesai,
+      sehingga jawaban per soal bisa diproses sebelum seluruh PDF selesai
+    - "page_done": `{page}`
+    Jika hasil PDF diambil dari cache, tidak ada event yang dikirim.
+    """
+    cache = cache or get_ocr_cache()
+    max_boxes = 2
+    preprocess_params = {"dpi": RENDER_DPI, "layout_dpi": layout_dpi, "max_boxes": max_boxes, "ink_filter": filter_id(),
+                         "deskew": deskew_id(), "template": template.template_id if template else None,
+                         "text_layer": text_layer_id(), "low_memory": OCR_LOW_MEMORY}
+
+    if cache:
+        pdf_key = content_key(file_key(pdf_path), preprocess_params, f"{engine}:{model_name}",
+                              get_decoding_policy().cache_id, "structured")
+        cached = cache.get_pdf(pdf_key)
+        if cached is not None:
+            print("[INFO] Hasil OCR diambil dari cache.")
+            return cached
+
+    pages = {}
+
+    # Halaman PDF ketikan: teks per kotak langsung dari text layer
+    text_pages = text_layer_pages(pdf_path)
+    for page_number, boxes_lines in iter_text_layer_pages(pdf_path, text_pages, max_boxes=max_boxes, template=template):
+        print(f"[INFO] Halaman {page_number+1} punya text layer; teks diambil tanpa OCR.")
+        boxes = [box_result(box_idx, [(text, 1.0) for text, _ in lines], [bbox for _, bbox in lines])
+                 for box_idx, lines in enumerate(boxes_lines)]
+        if on_event:
+            on_event({"type": "page_started", "page": page_number})
+            on_event({"type": "boxes_detected", "page": page_number, "boxes": len(boxes),
+                      "lines": [len(lines) for lines in boxes_lines]})
+            for box in boxes:
+                on_event({"type": "box_done", "page": page_number, **box})
+            on_event({"type": "page_done", "page": page_number})
+        if page_meta is not None:
+            page_meta.append({"page": page_number, "source": "text_layer", "skew_angle": None, "box_detection": {},
+                              "boxes": [], "lines": sum(len(lines) for lines in boxes_lines)})
+        pages[page_number] = {"page": page_number, "source": "text_layer", "boxes": boxes}
+
+    for page_number, raster, find_boxes in iter_page_sources(pdf_path, max_boxes=max_boxes, save_dir=save_dir, layout_dpi=layout_dpi,
+                                                                 template=template, skip_pages=text_pages):
+        print(f"[INFO] Memproses halaman {page_number+1}...")
+        if on_event: on_event({"type": "page_started", "page": page_number})
+
+        page_key = content_key(raster, preprocess_params) if cache else None
+        cached_page = cache.get_page(page_key) if cache else None
+
+        if cached_page is not None:
+            boxes_lines, line_bboxes = cached_page
+            if page_meta is not None:
+                page_meta.append({"page": page_number, "source": "cache", "skew_angle": None, "box_detection": {},
+                                  "boxes": [], "lines": sum(len(lines) for lines in boxes_lines)})
+        else:
+            # 3. Segmentasi baris tiap kotak jawaban
+            box_stats = {}
+            crops, skew_angle = find_boxes(box_stats)
+            if skew_angle is not None:
+                print(f"[INFO] Sudut kemiringan halaman {page_number+1}: {skew_angle:.2f} derajat")
+            if box_stats:
+                print(f"[INFO] Deteksi kotak halaman {page_number+1}: {box_stats['contours']} kontur, "
+                      f"{box_stats['candidates']} kandidat, {box_stats['unique']} kotak "
+                      f"({sum(box_stats['timings'].values()):.0f} ms)")
+            boxes_lines, line_bboxes, boxes_meta = [], [], []
+            for box_idx, crop in enumerate(crops):
+                skipped, meta = [], {}
+                boxes_lines.append(extract_line_crops(crop, debug_dir=f"page_{page_number+1}/box_{box_idx}",
+                                                      skip_log=skipped, page_angle=skew_angle, meta=meta) or [])
+                line_bboxes.append(meta.get("line_bboxes", []))
+                boxes_meta.append(meta.get("deskew"))
+                if skipped:
+                    print(f"[INFO] Halaman {page_number+1} kotak {box_idx}: {len(skipped)} region dilewati "
+                          f"({', '.join(sorted({s['reason'] for s in skipped}))})")
+                if skip_log is not None:
+                    skip_log.extend({"page": page_number, "box": box_idx, **s} for s in skipped)
+            # Crop kotak tidak dipakai lagi setelah segmentasi; bebaskan sebelum OCR
+            crops = crop = None
+            if page_meta is not None:
+                page_meta.append({"page": page_number, "source": "ocr", "skew_angle": skew_angle, "box_detection": box_stats,
+                                  "boxes": boxes_meta, "lines": sum(len(lines) for lines in boxes_lines)})
+            if cache: cache.put_page(page_key, boxes_lines, line_bboxes)
+
+        on_line = None
+        if on_event:
+            on_event({"type": "boxes_detected", "page": page_number, "boxes": len(boxes_lines),
+                      "lines": [len(lines) for lines in boxes_lines]})
+            on_line = box_progress(page_number, boxes_lines, on_event, line_bboxes)
+
+        # 4. OCR semua baris dari semua kotak jawaban di halaman ini (batched)
+        boxes_results = ocr_pages_line_results([boxes_lines], batch_size=OCR_BATCH_SIZE, model_name=model_name,
+                                               engine=engine, cache=cache, on_line=on_line)[0]
+        line_bboxes = line_bboxes or [None] * len(boxes_results)
+        pages[page_number] = {"page": page_number, "source": "ocr",
+                              "boxes": [box_result(box_idx, lines, line_bboxes[box_idx])
+                                        for box_idx, lines in enumerate(boxes_results)]}
+        if on_event: on_event({"type": "page_done", "page": page_number})
+
+    result = {"pages": [pages[page_number] for page_number in sorted(pages)]}
+    result["text"] = result_text(result)
+    if cache: cache.put_pdf(pdf_key, result)
+    return result
+
+
+def process_pdf(pdf_path, save_dir=None, layout_dpi=None, model_name=DEFAULT_OCR_MODEL, engine=OCR_ENGINE, cache=None,
+                skip_log=None, page_meta=None, template=None, on_event=None):
+    """
+    Seperti `ocr_pdf`, tetapi hanya mengembalikan teks hasil OCR (satu blok
+    per kotak jawaban, baris kosong di antaranya).
+    """
+    return ocr_pdf(pdf_path, save_dir=save_dir, layout_dpi=layout_dpi, model_name=model_name, engine=engine,
+                   cache=cache, skip_log=skip_log, page_meta=page_meta, template=template, on_event=on_event)["text"]
+
+
+def process_pdf_parallel(pdf_path, workers, torch_threads, model_name=DEFAULT_OCR_MODEL, engine=OCR_ENGINE):
+    """
+    Seperti `process_pdf`, tetapi halaman diproses paralel di pool proses
+    (policy decoding dan cache OCR ikut; lihat `PageParallelExecutor`).
+    Worker hanya mengembalikan teks per kotak: hasil terstruktur
+    (`box_result` dengan confidence dan bbox baris) dan OCR_LOW_MEMORY tidak
+    tersedia di jalur ini.
+    """
+    from parallel_pages import PageParallelExecutor
+
+    with PageParallelExecutor(workers=workers, torch_threads=torch_threads, engine=engine,
+                              model_name=model_name) as executor:
+        pages_texts = executor.process_pdf(pdf_path)
+    return "\n".join(format_box_text(text) for box_texts in pages_texts for text in box_texts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR jawaban esai dari PDF hasil scan")
+    parser.add_argument("pdf_path", nargs="?", default="files/test10.pdf",
+                        help="file PDF, atau folder/ZIP berisi satu PDF per siswa (ingest massal, lihat bulk_ingest.py)")
+    parser.add_argument("--out", metavar="DIR", default="hasil_ocr",
+                        help="folder hasil per siswa untuk ingest massal (default: hasil_ocr)")
+    parser.add_argument("--save-images", metavar="DIR", default=None,
+                        help="simpan PNG tiap halaman ke folder ini (default: tidak disimpan)")
+    parser.add_argument("--debug", metavar="DIR", default=None,
+                        help="simpan gambar debug pipeline OCR ke folder ini (ditulis di background)")
+    parser.add_argument("--fast-layout", action="store_true",
+                        help=f"analisis layout di {LAYOUT_DPI} DPI, render 300 DPI hanya untuk kotak jawaban")
+    parser.add_argument("--engine", choices=["torch", "onnx"], default=OCR_ENGINE,
+                        help="backend inferensi OCR (onnx = ONNX Runtime int8)")
+    parser.add_argument("--decoding", choices=["greedy", "beam"], default=None,
+                        help="strategi decoding OCR (default: OCR_DECODING)")
+    parser.add_argument("--page-workers", type=int, default=0,
+                        help="proses halaman secara paralel dengan N proses worker (hanya teks: tanpa confidence/"
+                             "hasil terstruktur per kotak, dan OCR_LOW_MEMORY diabaikan)")
+    parser.add_argument("--torch-threads", type=int, default=0,
+                        help="jumlah thread torch per worker (dengan --page-workers; default: core dibagi rata)")
+    parser.add_argument("--template", metavar="PATH", default=None,
+                        help="template lembar jawaban (.npz dari sheet_template.py) untuk melewati deteksi kotak")
+    args = parser.parse_args()
 
-    for img_path in images:
-        print(f"[INFO] Memproses {img_path}...")
+    if args.engine == "onnx" and args.decoding == "beam":
+        parser.error("--decoding beam tidak didukung engine onnx (hanya greedy)")
+    if args.page_workers > 0:
+        unsupported = [flag for flag, value in (("--fast-layout", args.fast_layout), ("--template", args.template),
+                                                ("--save-images", args.save_images)) if value]
+        if unsupported:
+            parser.error(f"{', '.join(unsupported)} tidak didukung bersama --page-workers")
 
-        # 1. Load gambar
-        image = cv2.imread(img_path)
+    if args.debug:
+        enable_debug(args.debug)
+    if args.decoding:
+        set_decoding_policy(DecodingPolicy(strategy=args.decoding))
 
-        # 2. Koreksi perspektif
-        processed_img = correct_perspective(image)
+    template = SheetTemplate.load(args.template) if args.template else None
 
-        # 3. Deteksi kotak jawaban
-        answer_boxes = detect_answer_boxes(processed_img, max_boxes=2, visualize=False)
+    if os.path.isdir(args.pdf_path) or args.pdf_path.lower().endswith(".zip"):
+        from bulk_ingest import ingest_to_dir
+        ingest_to_dir(args.pdf_path, args.out, template=template, engine=args.engine)
+        disable_debug()
+        return
 
-        # 4. OCR tiap kotak jawaban
-        for i, crop in enumerate(answer_boxes):
-            text = segment_and_ocr(crop, debug_dir=f"debug_{i}")
-            text = re.sub(r'\n+', '\n', text).strip()  
-            text += "\n"
-            all_text.append(text)
- 
-    final_text = "\n".join(all_text)
+    if args.page_workers > 0:
+        final_text = process_pdf_parallel(args.pdf_path, args.page_workers, args.torch_threads, engine=args.engine)
+    else:
+        final_text = process_pdf(args.pdf_path, save_dir=args.save_images,
+                                 layout_dpi=LAYOUT_DPI if args.fast_layout else None,
+                                 engine=args.engine, template=template)
 
     # 5. Simpan hasil ke file
     with open("hasil_ocr.txt", "w", encoding="utf-8") as f:
         f.write(final_text)
 
+    disable_debug()
     print("[INFO] OCR selesai. Hasil tersimpan di hasil_ocr.txt")
 
 
@@ -0,0 +1,207 @@
+import os
+import threading
+import time
+import numpy as np
+
+from instrumentation import count, is_tracing
+
+DEFAULT_OCR_MODEL = os.getenv("OCR_MODEL", "microsoft/trocr-large-handwritten")
+# "torch" (PyTorch fp32) atau "onnx" (ONNX Runtime, int8 dinamis)
+OCR_ENGINE = os.getenv("OCR_ENGINE", "torch")
+
+# Cache in-process: model_name -> (processor, model)
+_MODELS = {}
+# Cache in-process: (engine, model_name) -> engine
+_ENGINES = {}
+_LOCK = threading.RLock()
+
+def get_trocr(model_name=DEFAULT_OCR_MODEL):
+    """
+    Mengembalikan `(processor, model)` TrOCR untuk `model_name`. Model
+    (dan library transformers) baru dimuat saat pertama kali diminta,
+    lalu disimpan di cache sehingga beberapa engine bisa hidup bersamaan.
+    """
+    entry = _MODELS.get(model_name)
+    if entry is not None:
+        return entry
+
+    with _LOCK:
+        entry = _MODELS.get(model_name)
+        if entry is None:
+            from transformers import TrOCRProcessor, VisionEncoderDecoderModel
+
+            print(f"\n🧠 Memuat model OCR {model_name}...")
+            start_load = time.time()
+            processor = TrOCRProcessor.from_pretrained(model_name)
+            model = VisionEncoderDecoderModel.from_pretrained(model_name)
+            model.eval()
+            entry = (processor, model)
+            _MODELS[model_name] = entry
+            print(f"✅ Model OCR siap digunakan (load time {round(time.time() - start_load, 2)} detik)")
+    return entry
+
+def sequence_confidence(token_logprobs, token_ids, pad_id):
+    """
+    Confidence per baris = rata-rata geometris probabilitas token hasil
+    decode (exp dari rata-rata log-prob), 0..1. `token_logprobs` dan
+    `token_ids` berbentuk (batch, langkah); posisi padding setelah EOS
+    tidak dihitung, EOS sendiri dihitung.
+    """
+    token_logprobs = np.asarray(token_logprobs, dtype=np.float64)
+    mask = np.asarray(token_ids) != pad_id
+    n_tokens = np.maximum(mask.sum(axis=1), 1)
+    mean_logprob = np.where(mask, token_logprobs, 0.0).sum(axis=1) / n_tokens
+    return [round(float(c), 4) for c in np.exp(mean_logprob)]
+
+class _TokenLogprobs:
+    """
+    Logits processor yang hanya merekam log-prob token terpilih di setiap
+    langkah greedy (argmax skor yang sudah diproses), tanpa menyimpan skor
+    seluruh vocabulary seperti `output_scores=True`.
+    """
+
+    def __init__(self):
+        self.steps = []
+
+    def __call__(self, input_ids, scores):
+        import torch
+        self.steps.append(torch.log_softmax(scores.float(), dim=-1).max(dim=-1).values)
+        return scores
+
+class TorchTrOCREngine:
+    """
+    Engine OCR default: TrOCR PyTorch dari `get_trocr`. Generate berjalan di
+    `torch.inference_mode()`; autocast bf16 dan `torch.compile` encoder
+    mengikuti profil inferensi proses ini (lihat `inference_profile`).
+    """
+
+    name = "torch"
+
+    def __init__(self, model_name=DEFAULT_OCR_MODEL):
+        from inference_profile import bf16_supported, current_profile
+
+        self.model_name = model_name
+        self.processor, self.model = get_trocr(model_name)
+        profile = current_profile()
+        self.bf16 = profile["bf16"] and bf16_supported()
+        if profile["bf16"] and not self.bf16:
+            print("⚠️ [Inference] CPU tidak mendukung bf16 native; tetap memakai fp32.")
+        if profile["compile"]:
+            self._compile_encoder()
+
+    def _inference(self):
+        import torch
+        from contextlib import ExitStack
+
+        stack = ExitStack()
+        stack.enter_context(torch.inference_mode())
+        if self.bf16:
+            stack.enter_context(torch.autocast("cpu", dtype=torch.bfloat16))
+        return stack
+
+    def _compile_encoder(self):
+        """
+        `torch.compile` encoder (bagian termahal, input berukuran tetap),
+        langsung dipicu dengan satu batch dummy. Jika compile gagal (mis. tidak
+        ada compiler C di host), encoder kembali ke mode eager.
+        """
+        import torch
+
+        encoder = self.model.encoder
+        size = self.processor.image_processor.size
+        print("🔧 [Inference] Compile encoder TrOCR...")
+        start = time.time()
+        compiled = torch.compile(encoder.forward, dynamic=True)
+        try:
+            with self._inference():
+                compiled(pixel_values=torch.zeros(2, 3, size["height"], size["width"]))
+        except Exception as e:
+            print(f"⚠️ [Inference] torch.compile encoder gagal, memakai mode eager: {e}")
+            return
+        encoder.forward = compiled
+        print(f"✅ [Inference] Encoder ter-compile ({round(time.time() - start, 2)} detik)")
+
+    def recognize(self, images_pil, max_new_tokens=None, num_beams=1, with_confidence=False):
+        """
+        OCR satu batch gambar PIL RGB; mengembalikan list teks, atau list
+        `(teks, confidence)` jika `with_confidence` (lihat
+        `sequence_confidence`; untuk beam search dipakai skor beam). Generate
+        berhenti begitu semua anggota batch menghasilkan EOS (atau
+        `max_new_tokens` tercapai).
+        """
+        pixel_values = self.processor(images=images_pil, return_tensors="pt").pixel_values
+        kwargs = {"num_beams": num_beams, "do_sample": False}
+        if max_new_tokens:
+            kwargs["max_new_tokens"] = max_new_tokens
+        if num_beams > 1:
+            kwargs["early_stopping"] = True
+
+        pad_id = self.model.config.pad_token_id
+        with self._inference():
+            generated_ids, confidences = self._generate(pixel_values, kwargs, with_confidence, num_beams, pad_id)
+        if is_tracing():
+            # Kolom pertama adalah decoder_start_token, sisanya token hasil generate
+            count("tokens_generated", int((generated_ids[:, 1:] != pad_id).sum()))
+            count("padding_tokens", int((generated_ids[:, 1:] == pad_id).sum()))
+        texts = self.processor.batch_decode(generated_ids, skip_special_tokens=True)
+        return texts if confidences is None else list(zip(texts, confidences))
+
+    def _generate(self, pixel_values, kwargs, with_confidence, num_beams, pad_id):
+        confidences = None
+        if with_confidence and num_beams > 1:
+            output = self.model.generate(pixel_values, output_scores=True, return_dict_in_generate=True, **kwargs)
+            generated_ids = output.sequences
+            confidences = [round(float(c), 4) for c in output.sequences_scores.exp()]
+        elif with_confidence:
+            from transformers import LogitsProcessorList
+            recorder = _TokenLogprobs()
+            generated_ids = self.model.generate(pixel_values, logits_processor=LogitsProcessorList([recorder]), **kwargs)
+            # Kolom pertama adalah decoder_start_token; langkah ke-i menghasilkan kolom i+1
+            confidences = sequence_confidence(np.stack([step.numpy() for step in recorder.steps], axis=1),
+                                              generated_ids[:, 1:].numpy(), pad_id)
+        else:
+            generated_ids = self.model.generate(pixel_values, **kwargs)
+        return generated_ids, confidences
+
+def get_engine(engine=OCR_ENGINE, model_name=DEFAULT_OCR_MODEL):
+    """
+    Mengembalikan engine OCR (`recognize(images)`) untuk `engine` dan
+    `model_name`, dimuat saat pertama kali diminta lalu di-cache.
+    """
+    key = (engine, model_name)
+    instance = _ENGINES.get(key)
+    if instance is not None:
+        return instance
+
+    with _LOCK:
+        instance = _ENGINES.get(key)
+        if instance is None:
+            if engine == "torch":
+                instance = TorchTrOCREngine(model_name)
+            elif engine == "onnx":
+                from onnx_engine import OnnxTrOCREngine
+                instance = OnnxTrOCREngine(model_name)
+            else:
+                raise ValueError(f"OCR engine tidak dikenal: {engine}")
+            _ENGINES[key] = instance
+    return instance
+
+def warmup(model_name=DEFAULT_OCR_MODEL, engine=OCR_ENGINE):
+    """
+    Memuat model dan menjalankan satu inferensi dummy, supaya request OCR
+    pertama tidak menanggung biaya load/inisialisasi.
+    """
+    from PIL import Image
+
+    instance = get_engine(engine, model_name)
+    instance.recognize([Image.new("RGB", (384, 64), "white")], max_new_tokens=2)
+    return instance
+
+def is_loaded(model_name=DEFAULT_OCR_MODEL, engine=OCR_ENGINE):
+    return (engine, model_name) in _ENGINES or (engine == "torch" and model_name in _MODELS)
+
+def unload(model_name=DEFAULT_OCR_MODEL):
+    with _LOCK:
+        _MODELS.pop(model_name, None)
+        for key in [k for k in _ENGINES if k[1] == model_name]:
+            _ENGINES.pop(key)
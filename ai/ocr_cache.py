@@ -0,0 +1,178 @@
+import hashlib
+import io
+import json
+import os
+import threading
+import uuid
+import numpy as np
+
+# Cache nonaktif secara default. Set OCR_CACHE_DIR untuk mengaktifkan.
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR")
+OCR_CACHE_MAX_MB = int(os.getenv("OCR_CACHE_MAX_MB", "2048"))
+
+def content_key(*parts):
+    """
+    Hash sha256 dari gabungan `parts`. Array numpy di-hash berdasarkan
+    isi + shape + dtype, bytes apa adanya, dan nilai lain sebagai JSON
+    (key terurut) sehingga parameter yang sama selalu menghasilkan key sama.
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            h.update(f"{part.shape}{part.dtype.str}".encode())
+            h.update(np.ascontiguousarray(part).data)
+        elif isinstance(part, (bytes, bytearray, memoryview)):
+            h.update(part)
+        else:
+            h.update(json.dumps(part, sort_keys=True, default=str).encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+def file_key(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class OCRCache:
+    """
+    Cache hasil OCR di disk, di-address berdasarkan isi, dengan tiga level:
+
+    - "pdf":  hash byte PDF + parameter pipeline -> teks akhir
+    - "page": hash raster halaman + parameter preprocessing -> crop baris per kotak
+    - "line": hash crop baris + model/decoding -> teks baris
+
+    Ukuran total dibatasi `max_bytes`; entri yang paling lama tidak diakses
+    (mtime, diperbarui saat dibaca) dihapus lebih dulu.
+    """
+
+    def __init__(self, root_dir, max_bytes=OCR_CACHE_MAX_MB * 1024 * 1024):
+        self.root_dir = root_dir
+        self.max_bytes = max_bytes
+        self.hits = {"pdf": 0, "page": 0, "line": 0}
+        self.misses = {"pdf": 0, "page": 0, "line": 0}
+        self._lock = threading.Lock()
+        for level in self.hits:
+            os.makedirs(os.path.join(root_dir, level), exist_ok=True)
+        self._size = sum(size for _, _, size in self._entries())
+
+    # ---------------------------------------------------------------- storage
+    def _path(self, level, key, ext):
+        return os.path.join(self.root_dir, level, f"{key}.{ext}")
+
+    def _entries(self):
+        for level in self.hits:
+            level_dir = os.path.join(self.root_dir, level)
+            for name in os.listdir(level_dir):
+                path = os.path.join(level_dir, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, st.st_mtime, st.st_size
+
+    def _read(self, level, key, ext):
+        path = self._path(level, key, ext)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # tandai baru diakses (LRU)
+        except FileNotFoundError:
+            self.misses[level] += 1
+            return None
+        self.hits[level] += 1
+        return data
+
+    def _write(self, level, key, ext, data):
+        path = self._path(level, key, ext)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        with self._lock:
+            # Entri yang ditimpa (key sama) tidak boleh terhitung dua kali
+            try:
+                old_size = os.stat(path).st_size
+            except FileNotFoundError:
+                old_size = 0
+            os.replace(tmp_path, path)  # atomik: pembaca tidak pernah melihat file setengah jadi
+            self._size += len(data) - old_size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Hapus entri paling lama sampai ukuran turun ke 90% batas
+        entries = sorted(self._entries(), key=lambda e: e[1])
+        self._size = sum(size for _, _, size in entries)
+        target = self.max_bytes * 0.9
+        for path, _, size in entries:
+            if self._size <= target:
+                break
+            try:
+                os.remove(path)
+                self._size -= size
+            except FileNotFoundError:
+                pass
+
+    # ---------------------------------------------------------------- levels
+    def get_pdf(self, key):
+        data = self._read("pdf", key, "json")
+        return None if data is None else json.loads(data)
+
+    def put_pdf(self, key, value):
+        self._write("pdf", key, "json", json.dumps(value).encode())
+
+    def get_page(self, key):
+        """
+        Mengembalikan `(boxes_lines, line_bboxes)`: list per kotak berisi
+        list crop baris dan bbox `(x, y, w, h)` tiap crop (None untuk entri
+        lama tanpa bbox), atau None jika tidak ada di cache.
+        """
+        data = self._read("page", key, "npz")
+        if data is None:
+            return None
+        with np.load(io.BytesIO(data)) as npz:
+            counts = npz["counts"].tolist()
+            boxes_lines = [[npz[f"b{b}_l{l}"] for l in range(n)] for b, n in enumerate(counts)]
+            line_bboxes = None
+            if "bboxes" in npz:
+                flat = [tuple(int(v) for v in bbox) for bbox in npz["bboxes"]]
+                offsets = np.cumsum([0] + counts).tolist()
+                line_bboxes = [flat[offsets[b]:offsets[b + 1]] for b in range(len(counts))]
+            return boxes_lines, line_bboxes
+
+    def put_page(self, key, boxes_lines, line_bboxes=None):
+        arrays = {"counts": np.array([len(lines) for lines in boxes_lines], dtype=np.int64)}
+        for b, lines in enumerate(boxes_lines):
+            for l, crop in enumerate(lines):
+                arrays[f"b{b}_l{l}"] = crop
+        if line_bboxes is not None:
+            arrays["bboxes"] = np.array([bbox for bboxes in line_bboxes for bbox in bboxes], dtype=np.int64).reshape(-1, 4)
+        buf = io.BytesIO()
+        np.savez_compressed(buf, **arrays)
+        self._write("page", key, "npz", buf.getvalue())
+
+    def get_line(self, key):
+        """Mengembalikan `(teks, confidence)` hasil OCR satu crop baris, atau None."""
+        data = self._read("line", key, "json")
+        if data is None:
+            return None
+        entry = json.loads(data)
+        return entry["text"], entry["confidence"]
+
+    def put_line(self, key, text, confidence=None):
+        self._write("line", key, "json", json.dumps({"text": text, "confidence": confidence}).encode("utf-8"))
+
+    def stats(self):
+        return {"size_bytes": self._size, "max_bytes": self.max_bytes, "hits": dict(self.hits), "misses": dict(self.misses)}
+
+
+OCR_CACHE = None
+
+def get_ocr_cache():
+    """Cache global dari OCR_CACHE_DIR, atau None jika cache tidak diaktifkan."""
+    global OCR_CACHE
+    if OCR_CACHE is None and OCR_CACHE_DIR:
+        OCR_CACHE = OCRCache(OCR_CACHE_DIR)
+    return OCR_CACHE
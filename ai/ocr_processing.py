@@ -2,8 +2,16 @@ import cv2
 import numpy as np
 import os
 from PIL import Image
-from transformers import TrOCRProcessor, VisionEncoderDecoderModel
 import matplotlib.pyplot as plt
+from debug_writer import get_debug_writer
+from model_registry import get_engine, DEFAULT_OCR_MODEL, OCR_ENGINE
+from ocr_cache import content_key
+from decoding_policy import get_decoding_policy
+from batch_scheduler import plan_batches
+from ink_filter import box_skip_reason, line_skip_reason
+from deskew import deskew_crop, estimate_skew_angle, rotate_image
+from page_context import as_page_context
+from instrumentation import count, timed
 
 # ========================================================================
 #  SALIN BAGIAN 1, 2, DAN 3 DARI KODE ASLI ANDA KE SINI
@@ -11,42 +19,69 @@ import matplotlib.pyplot as plt
 # (Fungsi ocr_single_line, deskew_image_hough, remove_horizontal_lines_morphological)
 
 # ... (kode BAGIAN 1, 2, 3 Anda di sini) ...
-processor = TrOCRProcessor.from_pretrained("microsoft/trocr-large-handwritten")
-model = VisionEncoderDecoderModel.from_pretrained("microsoft/trocr-large-handwritten")
+# Model TrOCR dimuat secara lazy lewat model_registry saat OCR pertama
+# dijalankan, sehingga import modul ini tidak lagi memblokir.
 
-def ocr_single_line(image_pil):
+OCR_BATCH_SIZE = int(os.getenv("OCR_BATCH_SIZE", "8"))
+
+def ocr_single_line(image_pil, model_name=DEFAULT_OCR_MODEL, engine=OCR_ENGINE):
     if image_pil.mode != 'RGB':
         image_pil = image_pil.convert('RGB')
-    pixel_values = processor(images=image_pil, return_tensors="pt").pixel_values
-    generated_ids = model.generate(pixel_values)
-    return processor.batch_decode(generated_ids, skip_special_tokens=True)[0]
+    decoding = get_decoding_policy().generate_kwargs([image_pil.size])
+    return get_engine(engine, model_name).recognize([image_pil], **decoding)[0]
+
+@timed("ocr")
+def ocr_batch(images_pil, batch_size=OCR_BATCH_SIZE, model_name=DEFAULT_OCR_MODEL, engine=OCR_ENGINE, policy=None,
+              with_confidence=False):
+    """
+    Menjalankan TrOCR untuk banyak gambar baris sekaligus.
+    Gambar diproses per batch berukuran `batch_size`; hasil decode
+    dikembalikan dengan urutan yang sama dengan input. `engine` memilih
+    backend inferensi ("torch" atau "onnx", lihat model_registry).
+    Dengan `with_confidence`, tiap hasil berupa `(teks, confidence)`.
+
+    Panjang maksimum dan strategi decoding tiap batch ditentukan oleh
+    `policy` (default: `decoding_policy.get_decoding_policy()`) berdasarkan
+    rasio lebar/tinggi crop. Anggota tiap batch dipilih oleh
+    `batch_scheduler.plan_batches` (bucket rasio/budget token).
+    """
+    if not images_pil:
+        return []
+
+    ocr_engine = get_engine(engine, model_name)
+    policy = policy or get_decoding_policy()
+    texts = [None] * len(images_pil)
+    for batch_idx in plan_batches([img.size for img in images_pil], batch_size, policy=policy):
+        batch = [images_pil[i] if images_pil[i].mode == 'RGB' else images_pil[i].convert('RGB') for i in batch_idx]
+        # Processor me-resize semua gambar ke ukuran input encoder yang sama,
+        # sedangkan generate mem-padding token output antar anggota batch.
+        decoding = policy.generate_kwargs([img.size for img in batch])
+        outputs = ocr_engine.recognize(batch, with_confidence=with_confidence, **decoding)
+        for i, output in zip(batch_idx, outputs):
+            texts[i] = output
+        count("model_calls")
+    return texts
 
 def deskew_image_hough(color_image):
-    gray = cv2.cvtColor(color_image, cv2.COLOR_BGR2GRAY)
-    edges = cv2.Canny(gray, 50, 150, apertureSize=3)
-    lines = cv2.HoughLinesP(edges, 1, np.pi / 180, 100, minLineLength=50, maxLineGap=10)
-    if lines is None: return color_image
-    angles = [np.rad2deg(np.arctan2(l[0][3] - l[0][1], l[0][2] - l[0][0])) for l in lines]
-    valid_angles = [a for a in angles if -15 < a < 15]
-    median_angle = np.median(valid_angles) if len(valid_angles) > 0 else 0
-    (h, w) = color_image.shape[:2]
-    center = (w // 2, h // 2)
-    M = cv2.getRotationMatrix2D(center, median_angle, 1.0)
-    return cv2.warpAffine(color_image, M, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
+    angle = estimate_skew_angle(color_image, max_side=None)
+    return rotate_image(color_image, angle or 0.0)
 
+@timed("line_removal")
 def remove_horizontal_lines_morphological(color_image):
-    hsv = cv2.cvtColor(color_image, cv2.COLOR_BGR2HSV)
-    lower_blue = np.array([90, 20, 120]); upper_blue = np.array([120, 180, 255])
-    blue_mask = cv2.inRange(hsv, lower_blue, upper_blue)
-    gray = cv2.cvtColor(color_image, cv2.COLOR_BGR2GRAY)
-    black_mask = cv2.inRange(gray, 0, 70)
-    combined_mask = cv2.bitwise_or(blue_mask, black_mask)
+    # Menerima array BGR atau PageContext (HSV/gray dipakai ulang); untuk
+    # gambar grayscale hanya garis gelap yang bisa dikenali
+    page = as_page_context(color_image)
+    gray = page.gray
+    combined_mask = cv2.inRange(gray, 0, 70)
+    if page.image.ndim == 3:
+        lower_blue = np.array([90, 20, 120]); upper_blue = np.array([120, 180, 255])
+        combined_mask = cv2.bitwise_or(cv2.inRange(page.hsv, lower_blue, upper_blue), combined_mask)
     cols = combined_mask.shape[1]
     horizontal_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (cols // 30, 1))
     detected_lines = cv2.morphologyEx(combined_mask, cv2.MORPH_OPEN, horizontal_kernel, iterations=2)
     mask_inv = cv2.bitwise_not(detected_lines)
-    no_lines_color = cv2.bitwise_and(color_image, color_image, mask=mask_inv)
-    gray_no_lines = cv2.cvtColor(no_lines_color, cv2.COLOR_BGR2GRAY)
+    # Sama dengan gray dari gambar berwarna yang garisnya di-nol-kan, tanpa copy BGR
+    gray_no_lines = cv2.bitwise_and(gray, gray, mask=mask_inv)
     thresh = cv2.threshold(gray_no_lines, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1]
     thresh[detected_lines > 0] = 0
     return thresh
@@ -56,123 +91,281 @@ def remove_horizontal_lines_morphological(color_image):
 #  BAGIAN 4: SEGMENTASI DAN OCR (VERSI IMPROVISASI)
 # ========================================================================
 # Tambahkan fungsi baru ini di mana saja sebelum fungsi 'segment_lines_with_contours'
-def segment_lines_with_contours(binary_image, min_w=5, min_h=5):
+def component_boxes(binary_image, use_components=False):
+    """
+    Bounding box `(x, y, w, h)` setiap blob pada gambar biner sebagai array
+    numpy (N, 4), dalam urutan kontur OpenCV.
+
+    Default: kontur eksternal (`RETR_EXTERNAL`) dengan bounding rect dihitung
+    sekaligus lewat `reduceat`, identik dengan `cv2.boundingRect` per kontur.
+    `use_components=True` memakai `connectedComponentsWithStats` (lebih
+    cepat, tetapi blob di dalam lubang huruf ikut terhitung).
+    """
+    if use_components:
+        _, _, stats, _ = cv2.connectedComponentsWithStats(binary_image, connectivity=8)
+        return stats[1:, :4].astype(np.int64)
+
+    contours, _ = cv2.findContours(binary_image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return np.empty((0, 4), dtype=np.int64)
+
+    lengths = np.fromiter((len(c) for c in contours), dtype=np.int64, count=len(contours))
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    points = np.concatenate(contours).reshape(-1, 2).astype(np.int64)
+    mins = np.minimum.reduceat(points, starts, axis=0)
+    maxs = np.maximum.reduceat(points, starts, axis=0)
+    return np.hstack([mins, maxs - mins + 1])
+
+@timed("segmentation")
+def segment_lines_with_contours(binary_image, min_w=5, min_h=5, use_components=False):
     """
     Segmentasi baris teks dan memfilter noise langsung pada level kontur.
     
     Logika ini mengelompokkan kontur menjadi baris, kemudian memvalidasi setiap
     baris untuk memastikan itu bukan noise (misalnya, titik tunggal) sebelum
     mengembalikannya.
-    """
-    # 1. Temukan dan filter kontur awal
-    contours, _ = cv2.findContours(binary_image.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    initial_boxes = sorted(
-        [cv2.boundingRect(c) for c in contours if cv2.boundingRect(c)[2] > min_w and cv2.boundingRect(c)[3] > min_h],
-        key=lambda b: b[1]
-    )
 
-    if not initial_boxes:
+    Semua box diproses sebagai array numpy dalam satu lintasan (O(n) setelah
+    sort), dengan hasil identik dengan versi per-kontur sebelumnya.
+    """
+    # 1. Temukan dan filter kontur awal (sort stabil berdasarkan y)
+    boxes = component_boxes(binary_image, use_components=use_components)
+    boxes = boxes[(boxes[:, 2] > min_w) & (boxes[:, 3] > min_h)]
+    if len(boxes) == 0:
         return []
+    boxes = boxes[np.argsort(boxes[:, 1], kind="stable")]
 
-    # 2. Logika Inti: Kelompokkan box menjadi baris-baris secara dinamis
-    lines = []
-    if initial_boxes:
-        current_line_group = [initial_boxes[0]]
-        for box in initial_boxes[1:]:
-            min_y_in_group = min(b[1] for b in current_line_group)
-            max_y_in_group = max(b[1] + b[3] for b in current_line_group)
-            current_box_center_y = box[1] + box[3] / 2
-            
-            if min_y_in_group <= current_box_center_y <= max_y_in_group:
-                current_line_group.append(box)
-            else:
-                lines.append(current_line_group)
-                current_line_group = [box]
-        lines.append(current_line_group)
+    # 2. Logika Inti: Kelompokkan box menjadi baris-baris secara dinamis.
+    # Karena box terurut berdasarkan y, batas atas grup selalu y box pertama
+    # dan cukup batas bawah grup (running max) yang perlu dilacak.
+    ys = boxes[:, 1].tolist()
+    bottoms = (boxes[:, 1] + boxes[:, 3]).tolist()
+    centers = (boxes[:, 1] + boxes[:, 3] / 2).tolist()
+
+    group_starts = [0]
+    max_y_in_group = bottoms[0]
+    for i in range(1, len(ys)):
+        if centers[i] <= max_y_in_group:
+            max_y_in_group = max(max_y_in_group, bottoms[i])
+        else:
+            group_starts.append(i)
+            max_y_in_group = bottoms[i]
 
     # 3. Gabungkan dan VALIDASI setiap grup menjadi ROI yang bersih
-    final_line_rois = []
-    
     # Atur ambang batas untuk dianggap sebagai baris yang valid
     MIN_COMPONENTS_PER_LINE = 2  # Harus terdiri dari minimal 2 kontur (misal: dua huruf, atau huruf 'i' dan titiknya)
     MIN_WIDTH_PER_LINE = 40      # Atau, lebarnya harus minimal 40 piksel (untuk kata pendek seperti "dan")
 
-    for line_group in lines:
-        if not line_group: continue
-        
-        # Dapatkan koordinat ekstrem untuk membuat satu kotak besar
-        min_x = min(b[0] for b in line_group)
-        min_y = min(b[1] for b in line_group)
-        max_x = max(b[0] + b[2] for b in line_group)
-        max_y = max(b[1] + b[3] for b in line_group)
-        
-        width = max_x - min_x
-        height = max_y - min_y
-        num_components = len(line_group)
-        
-        # (LANGKAH BARU) Filter noise di sini
-        # Baris dianggap valid jika memenuhi salah satu kondisi:
-        # 1. Terdiri dari cukup banyak komponen/kontur.
-        # 2. Memiliki lebar yang signifikan.
-        if num_components >= MIN_COMPONENTS_PER_LINE or width >= MIN_WIDTH_PER_LINE:
-            final_line_rois.append((min_x, min_y, width, height))
+    # Dapatkan koordinat ekstrem tiap grup untuk membuat satu kotak besar
+    group_starts = np.array(group_starts)
+    min_x = np.minimum.reduceat(boxes[:, 0], group_starts)
+    min_y = np.minimum.reduceat(boxes[:, 1], group_starts)
+    max_x = np.maximum.reduceat(boxes[:, 0] + boxes[:, 2], group_starts)
+    max_y = np.maximum.reduceat(boxes[:, 1] + boxes[:, 3], group_starts)
+    num_components = np.diff(np.append(group_starts, len(boxes)))
+
+    width = max_x - min_x
+    height = max_y - min_y
+
+    # Baris dianggap valid jika memenuhi salah satu kondisi:
+    # 1. Terdiri dari cukup banyak komponen/kontur.
+    # 2. Memiliki lebar yang signifikan.
+    valid = (num_components >= MIN_COMPONENTS_PER_LINE) | (width >= MIN_WIDTH_PER_LINE)
+    rois = np.stack([min_x, min_y, width, height], axis=1)[valid]
 
     # Urutkan ROI final sekali lagi berdasarkan posisi Y untuk memastikan urutan benar
-    final_line_rois.sort(key=lambda r: r[1])
-    
-    return final_line_rois
+    rois = rois[np.argsort(rois[:, 1], kind="stable")]
+    return [tuple(int(v) for v in r) for r in rois]
 
-def segment_and_ocr(image_input, debug_dir="debug_results"):
+def extract_line_crops(image_input, debug_dir=None, skip_log=None, page_angle=None, meta=None):
     """
-    Membaca gambar, meluruskan, membersihkan, melakukan segmentasi
-    berbasis kontur, dan menjalankan OCR.
+    Menjalankan deskew, penghapusan garis, dan segmentasi baris pada satu
+    kotak jawaban, lalu mengembalikan list crop baris (teks hitam, latar
+    putih) yang siap dikirim ke TrOCR.
+
+    Kotak kosong dan baris yang hanya berisi noise tidak dikembalikan
+    (lihat `ink_filter`); alasannya ditambahkan ke `skip_log` jika diberikan,
+    sebagai dict `{"region", "reason", "bbox"}`.
+
+    `page_angle` adalah sudut kemiringan halaman (`deskew.estimate_skew_angle`);
+    jika diberikan, crop cukup diputar dengan sudut itu dan Hough per crop
+    hanya dijalankan bila pemeriksaan residual gagal. Info deskew
+    (`deskew.deskew_crop`) disimpan di `meta["deskew"]` jika `meta` diberikan,
+    beserta `meta["line_bboxes"]`: bbox `(x, y, w, h)` tiap crop baris yang
+    dikembalikan, dalam koordinat kotak setelah deskew.
+
+    `image_input` boleh berupa path, array BGR, atau PageContext (misalnya
+    crop dari `detect_answer_boxes`).
+
+    Gambar debug hanya dikirim ke writer background jika debug aktif
+    (`debug_writer.enable_debug` / OCR_DEBUG_DIR); `debug_dir` adalah
+    subfolder di dalam folder debug tersebut.
     """
     if isinstance(image_input, str):
-        color_image = cv2.imread(image_input)
-        if color_image is None: return "⚠️ Gambar tidak ditemukan."
-    else:
-        color_image = image_input.copy()
+        image_input = cv2.imread(image_input)
+        if image_input is None: return None
+    box = as_page_context(image_input)
 
-    if not os.path.exists(debug_dir): os.makedirs(debug_dir)
+    debug = get_debug_writer()
+    debug_dir = debug_dir or ""
 
-    # === Langkah 1 & 2: Deskew dan Hapus Garis (Sama seperti sebelumnya) ===
-    deskewed_color_image = deskew_image_hough(color_image)
-    cv2.imwrite(os.path.join(debug_dir, "debug_deskewed.png"), deskewed_color_image)
+    # Kotak tanpa tulisan tidak perlu di-deskew/segmentasi sama sekali
+    count("boxes")
+    reason = box_skip_reason(box)
+    if reason:
+        count("boxes_skipped")
+        if skip_log is not None:
+            skip_log.append({"region": "box", "reason": reason, "bbox": (0, 0, box.shape[1], box.shape[0])})
+        if meta is not None: meta["line_bboxes"] = []
+        return []
+
+    # === Langkah 1 & 2: Deskew dan Hapus Garis ===
+    deskewed, deskew_info = deskew_crop(box, page_angle)
+    deskewed_color_image = deskewed.image
+    if meta is not None: meta["deskew"] = deskew_info
+    if debug: debug.save(os.path.join(debug_dir, "debug_deskewed.png"), deskewed_color_image)
 
-    image_no_lines = remove_horizontal_lines_morphological(deskewed_color_image)
-    cv2.imwrite(os.path.join(debug_dir, "debug_cleaned_binary.png"), image_no_lines)
+    image_no_lines = remove_horizontal_lines_morphological(deskewed)
+    if debug: debug.save(os.path.join(debug_dir, "debug_cleaned_binary.png"), image_no_lines)
 
     # === Langkah 3: Segmentasi dengan Kontur (Metode Baru) ===
     line_bounding_boxes = segment_lines_with_contours(image_no_lines)
 
-    # Gambar kotak-kotak baris yang terdeteksi untuk debugging
-    debug_img_contours = deskewed_color_image.copy()
-    for x, y, w, h in line_bounding_boxes:
-        cv2.rectangle(debug_img_contours, (x, y), (x + w, y + h), (0, 255, 0), 2)
-    cv2.imwrite(os.path.join(debug_dir, "debug_line_detection.png"), debug_img_contours)
-
+    # Kotak-kotak baris digambar oleh thread writer untuk debugging
+    if debug: debug.save(os.path.join(debug_dir, "debug_line_detection.png"), deskewed_color_image, boxes=line_bounding_boxes)
 
-    # === Langkah 4: OCR per baris yang tersegmentasi ===
-    final_text = []
+    # === Langkah 4: Potong setiap baris yang tersegmentasi ===
+    line_crops, line_bboxes = [], []
     padding = 5 # Beri sedikit ruang di sekitar teks saat memotong
-    for i, (x, y, w, h) in enumerate(line_bounding_boxes):
+    for x, y, w, h in line_bounding_boxes:
         # Crop dari gambar biner yang sudah bersih
-        roi_cleaned_binary = image_no_lines[max(0, y - padding):y + h + padding, 
-                                            max(0, x - padding):x + w + padding]
+        x0, y0 = max(0, x - padding), max(0, y - padding)
+        roi_cleaned_binary = image_no_lines[y0:y + h + padding, x0:x + w + padding]
         
         if roi_cleaned_binary.size == 0: continue
 
         # Invert warna (teks menjadi hitam, background putih) untuk model TrOCR
         roi_final = cv2.bitwise_not(roi_cleaned_binary)
-        
-        # Konversi ke format yang bisa dibaca TrOCR dan jalankan OCR
-        roi_pil = Image.fromarray(roi_final)
-        text = ocr_single_line(roi_pil)
-        final_text.append(text)
 
-        cv2.imwrite(os.path.join(debug_dir, f"debug_crop_{i}.png"), roi_final)
+        reason = line_skip_reason(roi_final)
+        if reason:
+            if skip_log is not None:
+                skip_log.append({"region": "line", "reason": reason, "bbox": (x, y, w, h)})
+            count("lines_skipped")
+            continue
+
+        if debug: debug.save(os.path.join(debug_dir, f"debug_crop_{len(line_crops)}.png"), roi_final)
+        line_crops.append(roi_final)
+        line_bboxes.append((x0, y0, roi_final.shape[1], roi_final.shape[0]))
+
+    if meta is not None: meta["line_bboxes"] = line_bboxes
+    count("lines", len(line_crops))
+    return line_crops
 
-    return "\n".join(final_text)
+def segment_and_ocr(image_input, debug_dir=None, batch_size=OCR_BATCH_SIZE, model_name=DEFAULT_OCR_MODEL, engine=OCR_ENGINE):
+    """
+    Membaca gambar, meluruskan, membersihkan, melakukan segmentasi
+    berbasis kontur, dan menjalankan OCR.
+    """
+    line_crops = extract_line_crops(image_input, debug_dir=debug_dir)
+    if line_crops is None: return "⚠️ Gambar tidak ditemukan."
+
+    # Konversi ke format yang bisa dibaca TrOCR dan jalankan OCR per batch
+    texts = ocr_batch([Image.fromarray(roi) for roi in line_crops], batch_size=batch_size, model_name=model_name, engine=engine)
+    return "\n".join(texts)
+
+def ocr_line_crops(line_crops, batch_size=OCR_BATCH_SIZE, model_name=DEFAULT_OCR_MODEL, engine=OCR_ENGINE, cache=None,
+                   on_line=None):
+    """
+    Menjalankan OCR untuk list pasangan `(posisi, crop)` dan mengembalikan
+    dict `{posisi: (teks, confidence)}`. Posisi biasanya tuple
+    `(page, box, line)`. Jika `cache` (OCRCache) diberikan, hanya crop yang
+    belum pernah di-OCR dengan model yang sama yang dikirim ke model.
+
+    `on_line(posisi, teks, confidence)` (opsional) dipanggil begitu teks
+    sebuah baris tersedia: langsung untuk hit cache, lalu per batch model.
+    """
+    results = {}
+    todo = []
+    cache_id = f"{engine}:{model_name}:{get_decoding_policy().cache_id}"
+    for pos, roi in line_crops:
+        key = content_key(roi, cache_id) if cache else None
+        cached = cache.get_line(key) if cache else None
+        if cached is None:
+            todo.append((pos, roi, key))
+        else:
+            results[pos] = cached
+            if on_line: on_line(pos, *cached)
+
+    # Dipotong per batch di sini (bukan hanya di ocr_batch) supaya hasil tiap
+    # batch bisa dilaporkan lewat `on_line` sebelum batch berikutnya jalan.
+    # Batch di-bucket menurut ukuran crop, jadi baris sebuah kotak bisa
+    # selesai tidak berurutan.
+    for batch_idx in plan_batches([(roi.shape[1], roi.shape[0]) for _, roi, _ in todo], batch_size):
+        chunk = [todo[i] for i in batch_idx]
+        outputs = ocr_batch([Image.fromarray(roi) for _, roi, _ in chunk], batch_size=batch_size, model_name=model_name,
+                            engine=engine, with_confidence=True)
+        for (pos, _, key), (text, confidence) in zip(chunk, outputs):
+            results[pos] = (text, confidence)
+            if cache: cache.put_line(key, text, confidence)
+            if on_line: on_line(pos, text, confidence)
+    return results
+
+def ocr_pages_line_results(pages_lines, batch_size=OCR_BATCH_SIZE, model_name=DEFAULT_OCR_MODEL, engine=OCR_ENGINE,
+                           cache=None, on_line=None):
+    """
+    OCR untuk crop baris yang sudah tersegmentasi: `pages_lines[page][box]`
+    adalah list crop baris. Semua baris di-OCR dalam batch lalu dipetakan
+    kembali ke posisi `(page, box, line)`; hasilnya `result[page][box]`
+    berupa list `(teks, confidence)` per baris. `on_line` diteruskan ke
+    `ocr_line_crops`.
+    """
+    line_crops = [
+        ((page_idx, box_idx, line_idx), roi)
+        for page_idx, boxes in enumerate(pages_lines)
+        for box_idx, rois in enumerate(boxes)
+        for line_idx, roi in enumerate(rois)
+    ]
+    results = ocr_line_crops(line_crops, batch_size=batch_size, model_name=model_name, engine=engine, cache=cache,
+                             on_line=on_line)
+
+    return [
+        [[results[(page_idx, box_idx, line_idx)] for line_idx in range(len(rois))]
+         for box_idx, rois in enumerate(boxes)]
+        for page_idx, boxes in enumerate(pages_lines)
+    ]
+
+def ocr_pages_lines(pages_lines, batch_size=OCR_BATCH_SIZE, model_name=DEFAULT_OCR_MODEL, engine=OCR_ENGINE, cache=None,
+                    on_line=None):
+    """Seperti `ocr_pages_line_results`, tetapi `result[page][box]` berupa teks (baris dipisah "\n")."""
+    pages_results = ocr_pages_line_results(pages_lines, batch_size=batch_size, model_name=model_name, engine=engine,
+                                           cache=cache, on_line=on_line)
+    return [["\n".join(text for text, _ in lines) for lines in boxes] for boxes in pages_results]
+
+def segment_and_ocr_batch(pages_boxes, batch_size=OCR_BATCH_SIZE, debug_dir=None, model_name=DEFAULT_OCR_MODEL, engine=OCR_ENGINE, cache=None,
+                          page_angles=None):
+    """
+    Versi batch dari `segment_and_ocr` untuk banyak halaman sekaligus.
+
+    `pages_boxes` adalah list per halaman yang berisi list crop kotak jawaban
+    (output `detect_answer_boxes`). Semua baris dari semua kotak dan halaman
+    dikumpulkan lalu di-OCR dalam batch berukuran `batch_size`, kemudian
+    dipetakan kembali ke posisi `(page, box, line)`.
+
+    `page_angles` (opsional) berisi sudut kemiringan tiap halaman untuk
+    dipakai ulang oleh semua kotak di halaman tersebut.
+
+    Mengembalikan list per halaman berisi teks per kotak
+    (`result[page][box]`, baris dipisah "\n").
+    """
+    page_angles = page_angles or [None] * len(pages_boxes)
+    pages_lines = [
+        [extract_line_crops(crop, debug_dir=os.path.join(debug_dir or "", f"page_{page_idx}_box_{box_idx}"),
+                            page_angle=page_angles[page_idx]) or []
+         for box_idx, crop in enumerate(boxes)]
+        for page_idx, boxes in enumerate(pages_boxes)
+    ]
+    return ocr_pages_lines(pages_lines, batch_size=batch_size, model_name=model_name, engine=engine, cache=cache)
 
 
 
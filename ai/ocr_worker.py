@@ -0,0 +1,385 @@
+import os
+import threading
+import time
+import traceback
+import uuid
+import asyncio
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from instrumentation import OCR_JOB_MEMORY_MB, OCR_METRICS, MetricsRegistry
+
+# 0 = dari hasil auto-tuner (inference_profile.py), atau 1
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "0"))
+# > 0: analisis layout di DPI ini dan render 300 DPI hanya untuk kotak jawaban
+OCR_LAYOUT_DPI = int(os.getenv("OCR_LAYOUT_DPI", "0"))
+# Job yang sudah selesai (hasil + riwayat event) disimpan selama sekian detik
+# untuk polling/SSE, dan paling banyak sekian job; sisanya dilupakan
+OCR_JOB_TTL = int(os.getenv("OCR_JOB_TTL", "3600"))
+OCR_MAX_FINISHED_JOBS = int(os.getenv("OCR_MAX_FINISHED_JOBS", "1000"))
+
+TERMINAL_EVENTS = ("done", "failed")
+
+# ========================================================================
+#  SISI WORKER (berjalan di proses anak)
+# ========================================================================
+_EVENTS = None  # mp.Queue ke proses backend untuk event progres job
+
+def _init_worker(events=None, profile=None):
+    """
+    Dipanggil sekali saat proses worker dibuat: profil inferensi (thread
+    torch/OpenCV, bf16, compile) diterapkan, lalu model TrOCR dimuat dan
+    di-warmup di sini dan dipakai ulang untuk semua job berikutnya.
+    `events` adalah queue tempat event progres job dikirim ke backend.
+    """
+    global _EVENTS
+    _EVENTS = events
+    from inference_profile import apply_profile
+    from model_registry import warmup
+    if profile:
+        apply_profile(profile)
+    warmup()
+    print(f"✅ [OCRWorker] Worker {os.getpid()} siap"
+          + (f" ({profile['torch_threads']} thread torch)." if profile else "."))
+
+
+_TEMPLATES = {}  # path -> (mtime, SheetTemplate), per proses worker
+
+def _load_template(template_path):
+    """Template lembar jawaban di-cache per path; dimuat ulang jika file diganti."""
+    from sheet_template import SheetTemplate
+
+    mtime = os.path.getmtime(template_path)
+    cached = _TEMPLATES.get(template_path)
+    if cached is None or cached[0] != mtime:
+        cached = _TEMPLATES[template_path] = (mtime, SheetTemplate.load(template_path))
+    return cached[1]
+
+
+def _emit(job_id, event):
+    if _EVENTS is not None:
+        _EVENTS.put((job_id, event))
+
+
+def _run_job(job_id, pdf_path, template_path=None):
+    """
+    Menjalankan satu job OCR; mengembalikan `{"text", "result", "trace"}`
+    dengan `result` hasil terstruktur per halaman/kotak/baris (lihat
+    `main.ocr_pdf`). Trace
+    (waktu per tahap + counter) hanya direkam jika OCR_METRICS=1, dan
+    sekaligus dicetak sebagai log JSON.
+
+    Dengan OCR_JOB_MEMORY_MB > 0, peak memori job dan per tahap juga diukur
+    (dicetak di akhir job, juga saat gagal) dan job dihentikan dengan
+    MemoryBudgetExceeded begitu melewati batas.
+
+    Progres (lihat `ocr_pdf(on_event=...)`) dikirim ke backend selama job
+    berjalan, diakhiri event "done" (berisi `result_text` dan `result`) atau
+    "failed".
+    """
+    from instrumentation import log_trace, memory_report, trace
+    from main import ocr_pdf
+
+    def on_event(event):
+        _emit(job_id, event)
+
+    try:
+        template = _load_template(template_path) if template_path else None
+        if not OCR_METRICS and not OCR_JOB_MEMORY_MB:
+            result = ocr_pdf(pdf_path, layout_dpi=OCR_LAYOUT_DPI or None, template=template, on_event=on_event)
+            record = None
+        else:
+            with trace(memory_limit_mb=OCR_JOB_MEMORY_MB, job_id=job_id, pdf=os.path.basename(pdf_path),
+                       worker=os.getpid()) as job_trace:
+                try:
+                    result = ocr_pdf(pdf_path, layout_dpi=OCR_LAYOUT_DPI or None, template=template, on_event=on_event)
+                finally:
+                    report = memory_report(job_trace.as_dict())
+                    if report:
+                        print(f"[INFO] Job {job_id}: {report}")
+            record = job_trace.as_dict()
+            if OCR_METRICS:
+                log_trace(record)
+    except Exception as e:
+        _emit(job_id, {"type": "failed", "error": "".join(traceback.format_exception_only(type(e), e)).strip()})
+        raise
+    _emit(job_id, {"type": "done", "result_text": result["text"], "result": result})
+    return {"text": result["text"], "result": result, "trace": record}
+
+
+def _build_template(pdf_path, out_path, boxes=None):
+    from sheet_template import build_template_from_pdf
+
+    template = build_template_from_pdf(pdf_path, boxes=boxes)
+    template.save(out_path)
+    return template.describe()
+
+
+# ========================================================================
+#  SISI CLIENT (berjalan di proses backend)
+# ========================================================================
+class OCRWorkerPool:
+    """
+    Pool proses OCR yang berumur panjang. Job dikirim lewat `submit()` dan
+    mendapat `job_id`; hasilnya bisa di-poll dengan `get_job()` atau
+    ditunggu dengan `wait()`. Tidak ada file hasil bersama antar job.
+
+    Progres job (kotak terdeteksi, baris selesai OCR, teks kotak final)
+    dikirim worker lewat satu queue bersama; thread pump di backend
+    menomorinya per job (`seq`) dan meneruskannya ke `stream_events()`.
+
+    Job yang sudah selesai dilupakan (`forget`) setelah `job_ttl` detik atau
+    jika jumlahnya melebihi `max_finished_jobs` (yang terlama dulu); setelah
+    itu `get_job()` mengembalikan None.
+
+    Jika sebuah worker mati mendadak (OOM kill, segfault torch/onnxruntime),
+    semua job yang sedang berjalan atau mengantre di pool itu gagal dengan
+    BrokenProcessPool, lalu pool proses dibuat ulang untuk job berikutnya.
+    """
+
+    def __init__(self, num_workers=OCR_WORKERS, job_ttl=OCR_JOB_TTL, max_finished_jobs=OCR_MAX_FINISHED_JOBS):
+        from inference_profile import resolve_profile
+
+        # Core dibagi rata antar worker (atau sesuai hasil auto-tuner)
+        self.profile = resolve_profile(workers=num_workers or None)
+        self.num_workers = self.profile["workers"]
+        # "spawn" supaya worker tidak mewarisi state thread torch dari parent
+        self._ctx = mp.get_context("spawn")
+        self._events = self._ctx.Queue()
+        self._executor = self._new_executor()
+        self.job_ttl = job_ttl
+        self.max_finished_jobs = max_finished_jobs
+        self._jobs = {}
+        self._finished = {}     # job_id -> waktu selesai (urut selesai)
+        self._history = {}      # job_id -> list event (dengan "seq")
+        self._subscribers = {}  # job_id -> list (loop, asyncio.Queue)
+        self._lock = threading.Lock()
+        self.metrics = MetricsRegistry()
+        self._pump = threading.Thread(target=self._pump_events, name="ocr-events", daemon=True)
+        self._pump.start()
+
+    def _new_executor(self):
+        return ProcessPoolExecutor(
+            max_workers=self.num_workers,
+            mp_context=self._ctx,
+            initializer=_init_worker,
+            initargs=(self._events, self.profile),
+        )
+
+    def _replace_executor_locked(self, broken):
+        """Mengganti pool proses yang rusak (panggil sambil memegang `_lock`)."""
+        if self._executor is not broken:
+            return  # sudah diganti oleh job lain yang gagal bersamaan
+        print("⚠️ [OCRWorker] Worker OCR mati mendadak; pool proses dibuat ulang.")
+        broken.shutdown(wait=False, cancel_futures=True)
+        self._executor = self._new_executor()
+
+    def _submit_locked(self, fn, *args):
+        """`executor.submit` yang membuat ulang pool sekali jika pool sudah rusak."""
+        try:
+            return self._executor, self._executor.submit(fn, *args)
+        except BrokenProcessPool:
+            self._replace_executor_locked(self._executor)
+            return self._executor, self._executor.submit(fn, *args)
+
+    def start(self):
+        """Menyalakan semua worker sekarang (load + warmup model), bukan saat job pertama."""
+        with self._lock:
+            for _ in range(self.num_workers):
+                self._submit_locked(os.getpid)
+
+    def submit(self, pdf_path, template_path=None, delete_pdf=False):
+        """
+        Mengirim job OCR. `template_path` (opsional) adalah template lembar
+        jawaban (.npz) yang dipakai untuk melewati deteksi kotak per scan.
+        Dengan `delete_pdf`, file PDF dihapus begitu job selesai atau gagal.
+        """
+        self.prune()
+        job_id = uuid.uuid4().hex
+        pdf_path = os.path.abspath(pdf_path)
+        template_path = os.path.abspath(template_path) if template_path else None
+        with self._lock:
+            # Di dalam lock supaya event pertama job tidak mendahului pendaftarannya
+            executor, future = self._submit_locked(_run_job, job_id, pdf_path, template_path)
+            self._jobs[job_id] = future
+        future.add_done_callback(lambda done: self._observe(job_id, done, executor))
+        future.add_done_callback(lambda _: self._finish(job_id, pdf_path if delete_pdf else None))
+        return job_id
+
+    async def build_template(self, pdf_path, out_path, boxes=None):
+        """
+        Membangun template lembar jawaban dari PDF di proses worker, lalu
+        menyimpannya ke `out_path`. Mengembalikan ringkasan layout
+        (`SheetTemplate.describe()`).
+        """
+        with self._lock:
+            executor, future = self._submit_locked(_build_template, os.path.abspath(pdf_path),
+                                                   os.path.abspath(out_path), boxes)
+        future.add_done_callback(lambda done: self._observe(None, done, executor))
+        return await asyncio.wrap_future(future)
+
+    def _finish(self, job_id, pdf_path=None):
+        with self._lock:
+            if job_id in self._jobs:
+                self._finished[job_id] = time.monotonic()
+        if pdf_path:
+            try:
+                os.remove(pdf_path)
+            except OSError as e:
+                print(f"⚠️ [OCRWorker] Gagal menghapus {pdf_path}: {e}")
+
+    def prune(self):
+        """Melupakan job selesai yang melewati `job_ttl` atau batas `max_finished_jobs`."""
+        now = time.monotonic()
+        with self._lock:
+            # Job yang event-nya masih di-stream tidak dilupakan dulu
+            finished = [job_id for job_id in self._finished if job_id not in self._subscribers]
+            expired = [job_id for job_id in finished if now - self._finished[job_id] > self.job_ttl]
+            kept = [job_id for job_id in finished if job_id not in expired]
+            expired += kept[:max(0, len(kept) - self.max_finished_jobs)]
+        for job_id in expired:
+            self.forget(job_id)
+        return expired
+
+    def _observe(self, job_id, future, executor):
+        if future.cancelled():
+            return
+        error = future.exception()
+        if isinstance(error, BrokenProcessPool):
+            with self._lock:
+                self._replace_executor_locked(executor)
+            if job_id is not None:
+                # Worker mati sebelum sempat mengirim event terminal
+                self._publish(job_id, {"type": "failed", "error": f"Worker OCR mati mendadak: {error}"})
+        if job_id is None:
+            return
+        if error is not None:
+            self.metrics.observe(status="failed")
+        else:
+            self.metrics.observe(future.result()["trace"], status="done")
+
+    # --- event progres ---------------------------------------------------
+    def _pump_events(self):
+        while True:
+            item = self._events.get()
+            if item is None:
+                return
+            self._publish(*item)
+
+    def _publish(self, job_id, event):
+        with self._lock:
+            if job_id not in self._jobs:
+                return  # job sudah dilupakan
+            history = self._history.setdefault(job_id, [])
+            event = {"seq": len(history) + 1, **event}
+            history.append(event)
+            subscribers = list(self._subscribers.get(job_id, ()))
+        for loop, events in subscribers:
+            loop.call_soon_threadsafe(events.put_nowait, event)
+
+    async def stream_events(self, job_id, since=0, keepalive=15.0):
+        """
+        Async generator event progres job: event lama dengan `seq > since`
+        diputar ulang dulu, lalu event baru begitu dikirim worker, sampai
+        event terminal ("done"/"failed"). Menghasilkan None setiap
+        `keepalive` detik tanpa event (untuk ping koneksi SSE).
+        """
+        with self._lock:
+            future = self._jobs.get(job_id)
+            if future is None:
+                raise KeyError(job_id)
+            events = asyncio.Queue()
+            subscriber = (asyncio.get_running_loop(), events)
+            self._subscribers.setdefault(job_id, []).append(subscriber)
+            backlog = [event for event in self._history.get(job_id, ()) if event["seq"] > since]
+        try:
+            for event in backlog:
+                yield event
+                if event["type"] in TERMINAL_EVENTS:
+                    return
+            last_seq = backlog[-1]["seq"] if backlog else since
+            idle = 0.0
+            while True:
+                try:
+                    event = await asyncio.wait_for(events.get(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    idle += 1.0
+                    if future.done() and idle >= 2.0:
+                        # Worker mati sebelum sempat mengirim event terminal
+                        yield self._terminal_event(job_id, last_seq)
+                        return
+                    if idle >= keepalive:
+                        idle = 0.0
+                        yield None
+                    continue
+                idle = 0.0
+                if event["seq"] <= last_seq:
+                    continue  # sudah terkirim dari backlog
+                last_seq = event["seq"]
+                yield event
+                if event["type"] in TERMINAL_EVENTS:
+                    return
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(job_id, [])
+                if subscriber in subscribers:
+                    subscribers.remove(subscriber)
+                if not subscribers:
+                    self._subscribers.pop(job_id, None)
+
+    def _terminal_event(self, job_id, last_seq):
+        job = self.get_job(job_id) or {"status": "failed", "error": "job tidak ditemukan"}
+        if job["status"] == "done":
+            return {"seq": last_seq + 1, "type": "done", "result_text": job["result_text"], "result": job["result"]}
+        return {"seq": last_seq + 1, "type": "failed", "error": job.get("error")}
+
+    def metrics_text(self):
+        """Metrik agregat semua job dalam format teks Prometheus."""
+        return self.metrics.prometheus_text()
+
+    def get_job(self, job_id):
+        with self._lock:
+            future = self._jobs.get(job_id)
+        if future is None:
+            return None
+
+        if not future.done():
+            return {"job_id": job_id, "status": "running" if future.running() else "queued"}
+
+        error = future.exception()
+        if error is not None:
+            return {
+                "job_id": job_id,
+                "status": "failed",
+                "error": "".join(traceback.format_exception_only(type(error), error)).strip(),
+            }
+        result = future.result()
+        return {"job_id": job_id, "status": "done", "result_text": result["text"], "result": result["result"],
+                "trace": result["trace"]}
+
+    async def wait(self, job_id, timeout=None):
+        with self._lock:
+            future = self._jobs.get(job_id)
+        if future is None:
+            raise KeyError(job_id)
+        try:
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout=timeout)
+        except asyncio.TimeoutError:
+            raise
+        except Exception:
+            # Error job dilaporkan lewat status "failed" di get_job()
+            pass
+        return self.get_job(job_id)
+
+    def forget(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+            self._finished.pop(job_id, None)
+            self._history.pop(job_id, None)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+        self._events.put(None)
+        if wait:
+            self._pump.join()
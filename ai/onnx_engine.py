@@ -0,0 +1,319 @@
+import json
+import os
+import uuid
+import numpy as np
+
+from inference_profile import current_profile
+from instrumentation import count, is_tracing
+from model_registry import DEFAULT_OCR_MODEL, sequence_confidence
+
+OCR_ONNX_DIR = os.getenv("OCR_ONNX_DIR", "onnx_models")
+OCR_ONNX_THREADS = int(os.getenv("OCR_ONNX_THREADS", "0"))  # 0 = dari profil inferensi worker
+
+# ========================================================================
+#  EXPORT + KUANTISASI (sekali per model)
+# ========================================================================
+def onnx_model_dir(model_name=DEFAULT_OCR_MODEL, root_dir=OCR_ONNX_DIR):
+    return os.path.join(root_dir, model_name.replace("/", "__"))
+
+
+def onnx_model_ready(model_dir, quantized=True):
+    """True jika export di `model_dir` lengkap (generation.json ditulis paling akhir)."""
+    suffix = ".int8.onnx" if quantized else ".onnx"
+    return all(os.path.exists(os.path.join(model_dir, name))
+               for name in (f"encoder{suffix}", f"decoder_init{suffix}", f"decoder_step{suffix}", "generation.json"))
+
+
+def export_trocr_onnx(model_name=DEFAULT_OCR_MODEL, root_dir=OCR_ONNX_DIR, quantize=True):
+    """
+    Export TrOCR ke tiga graph ONNX, lalu kuantisasi dinamis int8 untuk
+    bobot Linear/MatMul:
+
+    - encoder: pixel_values -> hidden state encoder
+    - decoder_init: langkah pertama; logits posisi terakhir + KV-cache
+      self-attention dan cross-attention tiap layer
+    - decoder_step: satu token baru + KV-cache -> logits + KV-cache
+      self-attention yang diperpanjang (KV cross-attention dipakai ulang)
+
+    Processor dan token id khusus ikut disimpan supaya runtime tidak perlu
+    memuat model PyTorch. Export ditulis ke folder sementara lalu dipindah
+    ke tempatnya sekaligus, jadi folder model tidak pernah setengah jadi.
+    """
+    import shutil
+    import torch
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    from transformers.cache_utils import DynamicCache, EncoderDecoderCache
+    from model_registry import get_trocr
+
+    out_dir = onnx_model_dir(model_name, root_dir)
+    os.makedirs(root_dir, exist_ok=True)
+    tmp_dir = f"{out_dir}.{uuid.uuid4().hex}.tmp"
+    os.makedirs(tmp_dir)
+    processor, model = get_trocr(model_name)
+    n_layers = model.config.decoder.decoder_layers
+
+    class Encoder(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.encoder = model.encoder
+            # Proyeksi hidden encoder -> decoder (hanya ada jika ukurannya beda)
+            self.enc_to_dec_proj = getattr(model, "enc_to_dec_proj", None)
+
+        def forward(self, pixel_values):
+            hidden = self.encoder(pixel_values=pixel_values).last_hidden_state
+            return hidden if self.enc_to_dec_proj is None else self.enc_to_dec_proj(hidden)
+
+    def flatten(cache, cross=True):
+        flat = []
+        for layer in range(n_layers):
+            flat += [cache.self_attention_cache.layers[layer].keys, cache.self_attention_cache.layers[layer].values]
+            if cross:
+                flat += [cache.cross_attention_cache.layers[layer].keys,
+                         cache.cross_attention_cache.layers[layer].values]
+        return flat
+
+    class DecoderInit(torch.nn.Module):
+        def __init__(self, decoder):
+            super().__init__()
+            self.decoder = decoder
+
+        def forward(self, input_ids, encoder_hidden_states):
+            cache = EncoderDecoderCache(DynamicCache(), DynamicCache())
+            out = self.decoder(input_ids=input_ids, encoder_hidden_states=encoder_hidden_states,
+                               past_key_values=cache, use_cache=True)
+            # Hanya logits posisi terakhir yang keluar dari graph
+            return (out.logits[:, -1, :], *flatten(out.past_key_values))
+
+    class DecoderStep(torch.nn.Module):
+        def __init__(self, decoder):
+            super().__init__()
+            self.decoder = decoder
+
+        def forward(self, input_ids, encoder_hidden_states, *past):
+            cache = EncoderDecoderCache([tuple(past[4 * layer:4 * layer + 4]) for layer in range(n_layers)])
+            out = self.decoder(input_ids=input_ids, encoder_hidden_states=encoder_hidden_states,
+                               past_key_values=cache, use_cache=True)
+            return (out.logits[:, -1, :], *flatten(out.past_key_values, cross=False))
+
+    past_names = [f"past.{layer}.{kind}" for layer in range(n_layers)
+                  for kind in ("key", "value", "cross_key", "cross_value")]
+    present_names = [f"present.{layer}.{kind}" for layer in range(n_layers)
+                     for kind in ("key", "value", "cross_key", "cross_value")]
+    step_present_names = [name for name in present_names if "cross" not in name]
+
+    size = processor.image_processor.size
+    pixel_values = torch.zeros(2, 3, size["height"], size["width"])
+    encoder = Encoder(model).eval()
+    decoder_init = DecoderInit(model.decoder).eval()
+    # no_grad (bukan inference_mode): tensor contoh dipakai ulang saat tracing export
+    with torch.no_grad():
+        hidden = encoder(pixel_values)
+        input_ids = torch.full((2, 1), model.config.decoder_start_token_id, dtype=torch.long)
+        past = decoder_init(input_ids, hidden)[1:]
+
+    def kv_axes(names):
+        # KV-cache: (batch, head, panjang, dim); panjang self-attention bertambah per langkah
+        return {name: {0: "batch", 2: "cross_sequence" if "cross" in name else "past_sequence"} for name in names}
+
+    print(f"🔧 [ONNX] Export {model_name} ke {out_dir}...")
+    try:
+        torch.onnx.export(
+            encoder, (pixel_values,), os.path.join(tmp_dir, "encoder.onnx"),
+            input_names=["pixel_values"], output_names=["last_hidden_state"],
+            dynamic_axes={"pixel_values": {0: "batch"}, "last_hidden_state": {0: "batch"}},
+            opset_version=17, dynamo=False,
+        )
+        torch.onnx.export(
+            decoder_init, (input_ids, hidden), os.path.join(tmp_dir, "decoder_init.onnx"),
+            input_names=["input_ids", "encoder_hidden_states"], output_names=["logits", *present_names],
+            dynamic_axes={"input_ids": {0: "batch", 1: "sequence"}, "encoder_hidden_states": {0: "batch"},
+                          "logits": {0: "batch"}, **kv_axes(present_names)},
+            opset_version=17, dynamo=False,
+        )
+        torch.onnx.export(
+            DecoderStep(model.decoder).eval(), (input_ids, hidden, *past), os.path.join(tmp_dir, "decoder_step.onnx"),
+            input_names=["input_ids", "encoder_hidden_states", *past_names],
+            output_names=["logits", *step_present_names],
+            dynamic_axes={"input_ids": {0: "batch"}, "encoder_hidden_states": {0: "batch"}, "logits": {0: "batch"},
+                          **kv_axes(past_names), **kv_axes(step_present_names)},
+            opset_version=17, dynamo=False,
+        )
+
+        if quantize:
+            print("🔧 [ONNX] Kuantisasi dinamis int8...")
+            for part in ("encoder", "decoder_init", "decoder_step"):
+                quantize_dynamic(
+                    os.path.join(tmp_dir, f"{part}.onnx"),
+                    os.path.join(tmp_dir, f"{part}.int8.onnx"),
+                    weight_type=QuantType.QInt8,
+                )
+
+        processor.save_pretrained(tmp_dir)
+        config = model.config
+        with open(os.path.join(tmp_dir, "generation.json"), "w") as f:
+            json.dump({
+                "decoder_start_token_id": config.decoder_start_token_id,
+                "eos_token_id": config.eos_token_id if config.eos_token_id is not None else config.decoder.eos_token_id,
+                "pad_token_id": config.pad_token_id,
+                "max_length": model.generation_config.max_length or 64,
+                "decoder_layers": n_layers,
+            }, f, indent=2)
+
+        if os.path.exists(out_dir):
+            # Export lama (mis. format tanpa KV-cache) diganti seluruhnya
+            shutil.rmtree(out_dir)
+        os.replace(tmp_dir, out_dir)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    print("✅ [ONNX] Export selesai.")
+    return out_dir
+
+
+# ========================================================================
+#  ENGINE RUNTIME
+# ========================================================================
+class OnnxTrOCREngine:
+    """
+    Engine OCR TrOCR di ONNX Runtime (CPU), dengan interface yang sama
+    dengan `TorchTrOCREngine`. Model harus sudah di-export sekali dengan
+    `python onnx_engine.py --model <nama>` (tidak di-export otomatis, supaya
+    beberapa worker tidak meng-export ke folder yang sama bersamaan).
+
+    Decoding greedy dengan KV-cache: langkah pertama lewat `decoder_init`,
+    berikutnya `decoder_step` hanya menghitung token baru. Hidden state
+    encoder dan KV-cache tetap berupa OrtValue yang di-bind langsung antar
+    langkah (IO binding); yang di-copy ke numpy hanya logits posisi
+    terakhir. Langkah berhenti saat semua baris di batch sudah EOS.
+    Beam search tidak didukung (num_beams > 1 tetap decoding greedy).
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_name=DEFAULT_OCR_MODEL, root_dir=OCR_ONNX_DIR, quantized=True):
+        import onnxruntime as ort
+        from transformers import TrOCRProcessor
+
+        self.model_name = model_name
+        self.quantized = quantized
+        self._warned_beams = False
+
+        model_dir = onnx_model_dir(model_name, root_dir)
+        if not onnx_model_ready(model_dir, quantized):
+            raise FileNotFoundError(
+                f"Model ONNX {model_name} belum di-export ke {model_dir} (atau masih format lama tanpa KV-cache). "
+                f"Jalankan sekali: python onnx_engine.py --model {model_name} --out {root_dir}"
+                + ("" if quantized else " --no-quantize")
+            )
+        suffix = ".int8.onnx" if quantized else ".onnx"
+
+        # Thread mengikuti profil worker (core dibagi rata antar worker), sama
+        # seperti engine torch, supaya beberapa worker tidak saling berebut core
+        profile = current_profile()
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = OCR_ONNX_THREADS or profile["torch_threads"]
+        options.inter_op_num_threads = profile["interop_threads"]
+        providers = ["CPUExecutionProvider"]
+        self.encoder = ort.InferenceSession(os.path.join(model_dir, f"encoder{suffix}"), options, providers=providers)
+        self.decoder_init = ort.InferenceSession(os.path.join(model_dir, f"decoder_init{suffix}"), options,
+                                                 providers=providers)
+        self.decoder_step = ort.InferenceSession(os.path.join(model_dir, f"decoder_step{suffix}"), options,
+                                                 providers=providers)
+        self.processor = TrOCRProcessor.from_pretrained(model_dir)
+        with open(os.path.join(model_dir, "generation.json")) as f:
+            self.generation = json.load(f)
+        self._init_outputs = [output.name for output in self.decoder_init.get_outputs()]
+        self._step_outputs = [output.name for output in self.decoder_step.get_outputs()]
+        # encoder_hidden_states bisa terbuang dari graph step (KV cross-attention sudah di cache)
+        self._step_hidden = "encoder_hidden_states" in {i.name for i in self.decoder_step.get_inputs()}
+
+    def _encode(self, pixel_values):
+        binding = self.encoder.io_binding()
+        binding.bind_cpu_input("pixel_values", pixel_values)
+        binding.bind_output("last_hidden_state", "cpu")
+        self.encoder.run_with_iobinding(binding)
+        return binding.get_outputs()[0]  # OrtValue, tidak di-copy ke numpy
+
+    def _run(self, session, output_names, inputs, cpu_inputs):
+        """Menjalankan satu langkah decoder; `inputs` berupa OrtValue, `cpu_inputs` array numpy."""
+        binding = session.io_binding()
+        for name, value in inputs.items():
+            binding.bind_ortvalue_input(name, value)
+        for name, value in cpu_inputs.items():
+            binding.bind_cpu_input(name, value)
+        for name in output_names:
+            binding.bind_output(name, "cpu")
+        session.run_with_iobinding(binding)
+        return dict(zip(output_names, binding.get_outputs()))
+
+    def generate(self, pixel_values, max_new_tokens=None, with_logprobs=False):
+        """
+        Decoding greedy; mengembalikan id token `(batch, 1 + langkah)`, atau
+        `(id token, log-prob token terpilih per langkah)` jika `with_logprobs`.
+        Tanpa `max_new_tokens` (biasanya dari DecodingPolicy), batasnya
+        `max_length` model dikurangi token start, seperti `generate` HF.
+        """
+        max_new_tokens = max_new_tokens or self.generation["max_length"] - 1
+        start_id = self.generation["decoder_start_token_id"]
+        eos_id = self.generation["eos_token_id"]
+        pad_id = self.generation["pad_token_id"]
+
+        hidden = self._encode(pixel_values)
+        batch = pixel_values.shape[0]
+        input_ids = np.full((batch, 1), start_id, dtype=np.int64)
+        finished = np.zeros(batch, dtype=bool)
+        logprobs = []
+
+        outputs = self._run(self.decoder_init, self._init_outputs, {"encoder_hidden_states": hidden},
+                            {"input_ids": input_ids})
+        # KV cross-attention tetap sama untuk semua langkah
+        past = {name.replace("present.", "past."): value for name, value in outputs.items() if name != "logits"}
+        for step in range(max_new_tokens):
+            step_logits = outputs["logits"].numpy()
+            next_ids = step_logits.argmax(axis=-1)
+            if with_logprobs:
+                # log-softmax token terpilih = logit maksimum - logsumexp
+                top = step_logits.max(axis=-1)
+                logprobs.append(-np.log(np.exp(step_logits - top[:, None]).sum(axis=-1)))
+            next_ids = np.where(finished, pad_id, next_ids)
+            input_ids = np.concatenate([input_ids, next_ids[:, None]], axis=1)
+            finished |= next_ids == eos_id
+            if finished.all() or step == max_new_tokens - 1:
+                break
+            inputs = {"encoder_hidden_states": hidden, **past} if self._step_hidden else past
+            outputs = self._run(self.decoder_step, self._step_outputs, inputs,
+                                {"input_ids": next_ids[:, None].astype(np.int64)})
+            past.update({name.replace("present.", "past."): value for name, value in outputs.items()
+                         if name != "logits"})
+        if with_logprobs:
+            return input_ids, np.stack(logprobs, axis=1)
+        return input_ids
+
+    def recognize(self, images_pil, max_new_tokens=None, num_beams=1, with_confidence=False):
+        if num_beams > 1 and not self._warned_beams:
+            print(f"⚠️ [ONNX] Engine ONNX hanya mendukung decoding greedy; num_beams={num_beams} diabaikan.")
+            self._warned_beams = True
+        pixel_values = self.processor(images=images_pil, return_tensors="np").pixel_values.astype(np.float32)
+        pad_id = self.generation["pad_token_id"]
+        confidences = None
+        if with_confidence:
+            generated_ids, logprobs = self.generate(pixel_values, max_new_tokens=max_new_tokens, with_logprobs=True)
+            confidences = sequence_confidence(logprobs, generated_ids[:, 1:], pad_id)
+        else:
+            generated_ids = self.generate(pixel_values, max_new_tokens=max_new_tokens)
+        if is_tracing():
+            count("tokens_generated", int((generated_ids[:, 1:] != pad_id).sum()))
+            count("padding_tokens", int((generated_ids[:, 1:] == pad_id).sum()))
+        texts = self.processor.batch_decode(generated_ids, skip_special_tokens=True)
+        return texts if confidences is None else list(zip(texts, confidences))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export + kuantisasi TrOCR ke ONNX")
+    parser.add_argument("--model", default=DEFAULT_OCR_MODEL)
+    parser.add_argument("--out", default=OCR_ONNX_DIR)
+    parser.add_argument("--no-quantize", action="store_true")
+    args = parser.parse_args()
+    export_trocr_onnx(args.model, args.out, quantize=not args.no_quantize)
@@ -0,0 +1,119 @@
+import cv2
+import numpy as np
+
+class PageContext:
+    """
+    Satu gambar halaman (atau crop) BGR beserta turunan-turunannya yang
+    dihitung sekali lalu di-cache: grayscale, blur, threshold adaptif, HSV.
+    Gambar boleh juga sudah grayscale (2D, mis. render hemat memori); `gray`
+    lalu memakai gambar itu sendiri dan HSV tidak tersedia.
+    Fungsi preprocessing (`correct_perspective`, `detect_answer_boxes`,
+    `remove_horizontal_lines_morphological`, dst.) menerima PageContext
+    selain array biasa, sehingga beberapa tahap pada halaman yang sama tidak
+    mengulang konversi warna/threshold dan tidak menyalin halaman penuh.
+
+    `matrix` adalah homografi 3x3 dari halaman sumber (hasil render) ke
+    gambar ini; ikut diperbarui oleh `warp`, `rotate`, dan `crop`.
+
+    Gambar diperlakukan read-only: view yang di-cache tidak akan valid lagi
+    jika `image` diubah di tempat.
+    """
+
+    def __init__(self, image, matrix=None):
+        self.image = image
+        self.matrix = np.eye(3) if matrix is None else matrix
+        self._views = {}
+
+    @property
+    def shape(self):
+        return self.image.shape
+
+    def _view(self, key, compute):
+        view = self._views.get(key)
+        if view is None:
+            view = self._views[key] = compute()
+        return view
+
+    # ---------------------------------------------------------------- views
+    @property
+    def gray(self):
+        if self.image.ndim == 2:
+            return self.image
+        return self._view("gray", lambda: cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY))
+
+    @property
+    def hsv(self):
+        return self._view("hsv", lambda: cv2.cvtColor(self.image, cv2.COLOR_BGR2HSV))
+
+    def blurred(self, ksize=5):
+        return self._view(("blur", ksize), lambda: cv2.GaussianBlur(self.gray, (ksize, ksize), 0))
+
+    def adaptive_binary(self, block_size, C, blur=None, method=cv2.ADAPTIVE_THRESH_GAUSSIAN_C):
+        """Threshold adaptif (tinta = 255) dari gray, atau gray yang di-blur `blur`."""
+        def compute():
+            source = self.blurred(blur) if blur else self.gray
+            return cv2.adaptiveThreshold(source, 255, method, cv2.THRESH_BINARY_INV, block_size, C)
+        return self._view(("binary", block_size, C, blur, method), compute)
+
+    def release(self, *keys):
+        """Membuang view yang di-cache (semua jika `keys` kosong) untuk menekan memori."""
+        if not keys:
+            self._views.clear()
+        for key in keys:
+            self._views.pop(key, None)
+
+    # ---------------------------------------------------------------- geometry
+    def warp(self, M, size, **kwargs):
+        """Context baru hasil `warpPerspective` dengan homografi `M` ke ukuran `size`."""
+        M = np.asarray(M, dtype=np.float64)
+        return PageContext(cv2.warpPerspective(self.image, M, size, **kwargs), M @ self.matrix)
+
+    def rotate(self, angle):
+        """Context baru yang diputar `angle` derajat terhadap pusat (ukuran tetap)."""
+        if not angle:
+            return self
+        h, w = self.image.shape[:2]
+        R = cv2.getRotationMatrix2D((w // 2, h // 2), angle, 1.0)
+        rotated = cv2.warpAffine(self.image, R, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
+        return PageContext(rotated, np.vstack([R, [0, 0, 1]]) @ self.matrix)
+
+    def crop(self, x, y, w, h):
+        """
+        Context untuk area `(x, y, w, h)`. Gambar berupa view tanpa copy, dan
+        gray/HSV yang sudah dihitung untuk halaman ikut dipakai (di-slice).
+        """
+        T = np.array([[1, 0, -x], [0, 1, -y], [0, 0, 1]], dtype=np.float64)
+        child = PageContext(self.image[y:y + h, x:x + w], T @ self.matrix)
+        for key in ("gray", "hsv"):
+            if key in self._views:
+                child._views[key] = self._views[key][y:y + h, x:x + w]
+        return child
+
+    def to_source(self, points):
+        """Memetakan titik `(N, 2)` di gambar ini kembali ke koordinat halaman sumber."""
+        pts = np.asarray(points, dtype=np.float64).reshape(1, -1, 2)
+        return cv2.perspectiveTransform(pts, np.linalg.inv(self.matrix))[0]
+
+
+def as_page_context(image_input):
+    """PageContext dari path, array BGR, atau PageContext (dikembalikan apa adanya)."""
+    if isinstance(image_input, PageContext):
+        return image_input
+    if isinstance(image_input, str):
+        image = cv2.imread(image_input)
+        if image is None:
+            raise FileNotFoundError(f"Gagal membaca gambar dari {image_input}")
+        return PageContext(image)
+    return PageContext(image_input)
+
+
+def like_input(image_input, ctx):
+    """Mengembalikan `ctx` jika input berupa PageContext, atau array gambarnya."""
+    return ctx if isinstance(image_input, PageContext) else ctx.image
+
+
+def gray_of(image):
+    """Grayscale dari PageContext (di-cache), array BGR, atau array yang sudah gray."""
+    if isinstance(image, PageContext):
+        return image.gray
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
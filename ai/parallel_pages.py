@@ -0,0 +1,159 @@
+import os
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from multiprocessing import shared_memory
+import numpy as np
+
+from model_registry import DEFAULT_OCR_MODEL, OCR_ENGINE
+from pdf_processing import iter_pdf_pages
+from text_layer import iter_text_layer_pages, text_layer_pages
+
+OCR_PAGE_WORKERS = int(os.getenv("OCR_PAGE_WORKERS", str(max(1, (os.cpu_count() or 1) // 4))))
+
+# ========================================================================
+#  SISI WORKER
+# ========================================================================
+_OCR_OPTIONS = {}  # engine/model OCR proses worker ini
+
+def _init_page_worker(profile, engine, model_name, policy):
+    # Batasi thread torch/OpenCV per worker supaya total thread tidak
+    # melebihi jumlah core (workers x torch_threads).
+    from inference_profile import apply_profile
+    apply_profile(profile)
+    from decoding_policy import set_decoding_policy
+    from model_registry import warmup
+    # Proses spawn tidak mewarisi policy decoding yang diset di parent
+    set_decoding_policy(policy)
+    _OCR_OPTIONS.update(engine=engine, model_name=model_name)
+    warmup(model_name=model_name, engine=engine)  # model dimuat sekali per worker
+
+
+def _process_shared_page(shm_name, shape, dtype, max_boxes):
+    from image_processing import correct_perspective, detect_answer_boxes
+    from ocr_processing import segment_and_ocr_batch, OCR_BATCH_SIZE
+    from ocr_cache import get_ocr_cache
+    from deskew import estimate_skew_angle
+    from page_context import PageContext
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    image = page = answer_boxes = None
+    try:
+        # View langsung ke shared memory, tanpa unpickle array halaman
+        image = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        page = correct_perspective(PageContext(image))
+        image = None
+        answer_boxes = detect_answer_boxes(page, max_boxes=max_boxes, visualize=False)
+        skew_angle = estimate_skew_angle(page, min_line_length=100)
+        return segment_and_ocr_batch([answer_boxes], batch_size=OCR_BATCH_SIZE, page_angles=[skew_angle],
+                                     cache=get_ocr_cache(), **_OCR_OPTIONS)[0]
+    finally:
+        # View ke shared memory (halaman, crop kotak) dilepas dulu. Jika masih
+        # dirujuk traceback exception, close() gagal dengan BufferError; error
+        # itu diabaikan supaya exception aslinya yang sampai ke parent (mapping
+        # ditutup saat view-nya di-GC).
+        image = page = answer_boxes = None
+        try:
+            shm.close()
+        except BufferError:
+            pass
+
+
+# ========================================================================
+#  SISI PARENT
+# ========================================================================
+class PageParallelExecutor:
+    """
+    Menyebar halaman-halaman PDF ke pool proses. Halaman hasil rasterisasi
+    dikirim lewat shared memory (hanya nama blok yang di-pickle) dan hasil
+    disusun ulang sesuai urutan halaman/kotak.
+
+    Jumlah halaman yang sedang diproses dibatasi `max_in_flight` supaya
+    shared memory tidak menampung seluruh batch PDF sekaligus.
+
+    Engine, model, dan policy decoding (default: policy proses ini) serta
+    cache OCR (OCR_CACHE_DIR) sama dengan jalur satu proses. Halaman yang
+    punya text layer (lihat `text_layer`) diekstrak langsung di parent dan
+    tidak dikirim ke worker. Analisis layout cepat dan template lembar
+    jawaban tidak didukung.
+    """
+
+    def __init__(self, workers=OCR_PAGE_WORKERS, torch_threads=None, max_in_flight=None, engine=OCR_ENGINE,
+                 model_name=DEFAULT_OCR_MODEL, policy=None):
+        from decoding_policy import get_decoding_policy
+        from inference_profile import resolve_profile
+
+        self.workers = workers
+        self.max_in_flight = max_in_flight or workers * 2
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=mp.get_context("spawn"),
+            initializer=_init_page_worker,
+            initargs=(resolve_profile(workers=workers, torch_threads=torch_threads), engine, model_name,
+                      policy or get_decoding_policy()),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+    def _submit_page(self, image, max_boxes):
+        shm = shared_memory.SharedMemory(create=True, size=image.nbytes)
+        np.ndarray(image.shape, dtype=image.dtype, buffer=shm.buf)[:] = image
+        future = self._executor.submit(_process_shared_page, shm.name, image.shape, image.dtype.str, max_boxes)
+        return future, shm
+
+    def process_pdfs(self, pdf_paths, max_boxes=2):
+        """
+        Memproses banyak PDF sekaligus; semua halaman dari semua PDF berbagi
+        satu pool. Mengembalikan dict `{pdf_path: [[teks kotak, ...], ...]}`
+        dengan list per halaman sesuai urutan.
+        """
+        results = {pdf_path: {} for pdf_path in pdf_paths}
+        pending = {}
+
+        def collect(done):
+            for future in done:
+                pdf_path, page_number, shm = pending.pop(future)
+                shm.close()
+                shm.unlink()
+                results[pdf_path][page_number] = future.result()
+
+        try:
+            for pdf_path in pdf_paths:
+                # Halaman PDF ketikan: teks per kotak langsung dari text layer
+                text_pages = text_layer_pages(pdf_path)
+                for page_number, boxes_lines in iter_text_layer_pages(pdf_path, text_pages, max_boxes=max_boxes):
+                    results[pdf_path][page_number] = ["\n".join(text for text, _ in lines) for lines in boxes_lines]
+
+                for page_number, image in iter_pdf_pages(pdf_path, skip_pages=text_pages):
+                    if len(pending) >= self.max_in_flight:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(done)
+                    future, shm = self._submit_page(image, max_boxes)
+                    pending[future] = (pdf_path, page_number, shm)
+                    del image
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+        finally:
+            # Halaman yang sudah dikerjakan worker tidak bisa dibatalkan; blok
+            # shared memory-nya baru dilepas setelah worker selesai memakainya
+            running = [future for future in pending if not future.cancel()]
+            wait(running)
+            for _, _, shm in pending.values():
+                shm.close()
+                shm.unlink()
+
+        return {
+            pdf_path: [pages[i] for i in sorted(pages)]
+            for pdf_path, pages in results.items()
+        }
+
+    def process_pdf(self, pdf_path, max_boxes=2):
+        return self.process_pdfs([pdf_path], max_boxes=max_boxes)[pdf_path]
@@ -1,9 +1,202 @@
+import os
+import queue
+import threading
 import fitz
+import cv2
+import numpy as np
+from image_processing import analyze_layout, box_source_rect, crop_answer_boxes
+from instrumentation import reserve_memory, timed
 
-doc = fitz.open("example.pdf")
-print("Jumlah halaman:", len(doc))
+RENDER_DPI = 300
+LAYOUT_DPI = 100
+# Mode hemat memori untuk scan besar: halaman dianalisis sebagai grayscale
+# 300 DPI (1/3 ukuran BGR), turunannya dibebaskan begitu layout ditemukan,
+# lalu hanya area kotak jawaban yang dirender ulang berwarna (warna dipakai
+# untuk mengenali garis bantu biru). Halaman penuh BGR tidak pernah ada di
+# memori. Lihat juga OCR_JOB_MEMORY_MB (instrumentation).
+OCR_LOW_MEMORY = os.getenv("OCR_LOW_MEMORY", "0") == "1"
 
-# akses halaman pertama
-page = doc[0]
-text = page.get_text()
-print(text)
\ No newline at end of file
+# ========================================================================
+#  RASTERISASI PDF (IN-MEMORY)
+# ========================================================================
+def pixmap_to_array(pix):
+    """
+    Membungkus buffer pixmap fitz sebagai array numpy (H, W, n) tanpa copy.
+    Array yang dihasilkan hanya valid selama `pix` masih hidup.
+    """
+    return np.ndarray(
+        shape=(pix.height, pix.width, pix.n),
+        dtype=np.uint8,
+        buffer=pix.samples_mv,
+        strides=(pix.stride, pix.n, 1),
+    )
+
+
+def reserve_render(rect, dpi, channels):
+    """Memeriksa batas memori job sebelum merender `rect` (point) di `dpi`: pixmap + array hasilnya."""
+    zoom = dpi / 72.0
+    nbytes = int(round(rect.width * zoom)) * int(round(rect.height * zoom)) * channels * 2
+    reserve_memory(nbytes, f"render {dpi} DPI")
+
+
+@timed("rasterize")
+def render_page(page, dpi=RENDER_DPI, gray=False):
+    """
+    Render satu halaman fitz menjadi gambar BGR (format OpenCV), atau
+    grayscale 2D jika `gray` (untuk analisis yang tidak butuh warna).
+    """
+    reserve_render(page.rect, dpi, 1 if gray else 3)
+    if gray:
+        pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+        return pixmap_to_array(pix)[:, :, 0].copy()
+    pix = page.get_pixmap(dpi=dpi, alpha=False)
+    # Satu-satunya copy: konversi RGB -> BGR langsung dari buffer pixmap,
+    # menggantikan round trip encode/decode PNG ke disk.
+    return cv2.cvtColor(pixmap_to_array(pix), cv2.COLOR_RGB2BGR)
+
+
+def _render_pages(pdf_path, dpi, save_dir, skip_pages=()):
+    doc = fitz.open(pdf_path)
+    try:
+        for page_number in range(len(doc)):
+            if page_number in skip_pages:
+                continue
+            image = render_page(doc[page_number], dpi=dpi)
+            if save_dir:
+                cv2.imwrite(os.path.join(save_dir, f"page_{page_number+1}.png"), image)
+            yield page_number, image
+    finally:
+        doc.close()
+
+
+def iter_pdf_pages(pdf_path, dpi=RENDER_DPI, save_dir=None, prefetch=1, skip_pages=()):
+    """
+    Generator yang menghasilkan `(page_number, image_bgr)` per halaman.
+    Halaman di `skip_pages` tidak dirender sama sekali.
+
+    Dengan `prefetch > 0`, halaman berikutnya dirender di thread terpisah
+    (antrian dibatasi `prefetch` halaman) sehingga preprocessing dan OCR
+    halaman 1 bisa jalan sementara halaman selanjutnya masih dirender.
+    PNG hanya ditulis jika `save_dir` diisi.
+    """
+    if save_dir and not os.path.exists(save_dir):
+        os.makedirs(save_dir)
+
+    if prefetch <= 0:
+        yield from _render_pages(pdf_path, dpi, save_dir, skip_pages)
+        return
+
+    pages = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+    done = object()
+
+    def producer():
+        try:
+            for item in _render_pages(pdf_path, dpi, save_dir, skip_pages):
+                while not stop.is_set():
+                    try:
+                        pages.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+            pages.put(done)
+        except Exception as e:
+            pages.put(e)
+
+    thread = threading.Thread(target=producer, name="pdf-rasterizer", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = pages.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Consumer berhenti lebih awal: hentikan producer dan kosongkan antrian
+        stop.set()
+        while not pages.empty():
+            pages.get_nowait()
+        thread.join()
+
+
+def pdf_to_images(pdf_path, output_folder="output_images", dpi=RENDER_DPI):
+    """Render semua halaman ke PNG di `output_folder` dan kembalikan path-nya."""
+    image_paths = []
+    for page_number, _ in iter_pdf_pages(pdf_path, dpi=dpi, save_dir=output_folder, prefetch=0):
+        image_paths.append(os.path.join(output_folder, f"page_{page_number+1}.png"))
+    return image_paths
+
+
+# ========================================================================
+#  PIPELINE DUA RESOLUSI LANGSUNG DARI PDF
+# ========================================================================
+@timed("rasterize")
+def render_clip(page, rect_px, dpi=RENDER_DPI):
+    """
+    Render hanya area `rect_px` = (x0, y0, x1, y1) dalam piksel pada `dpi`.
+    Mengembalikan `(image_bgr, origin)` dengan origin = posisi piksel kiri
+    atas potongan pada halaman penuh.
+    """
+    zoom = 72.0 / dpi
+    clip = fitz.Rect(*(v * zoom for v in rect_px)) & page.rect
+    reserve_render(clip, dpi, 3)
+    pix = page.get_pixmap(dpi=dpi, clip=clip, alpha=False)
+    return cv2.cvtColor(pixmap_to_array(pix), cv2.COLOR_RGB2BGR), (pix.x, pix.y)
+
+
+def crop_page_answer_boxes(page, layout, dpi=RENDER_DPI):
+    """
+    Render ulang hanya area tiap kotak jawaban dari `layout` di `dpi` lewat
+    clip rect fitz, lalu warp ke bentuk akhirnya.
+    """
+    answer_boxes = []
+    for box in layout["boxes"]:
+        clip_image, origin = render_clip(page, box_source_rect(layout, box), dpi=dpi)
+        answer_boxes.extend(crop_answer_boxes(clip_image, {**layout, "boxes": [box]}, origin=origin))
+    return answer_boxes
+
+
+def iter_pdf_layout_pages(pdf_path, layout_dpi=LAYOUT_DPI, skip_pages=()):
+    """
+    Generator `(page_number, page, proxy)` dengan proxy grayscale dirender di
+    `layout_dpi`, kecuali `skip_pages`. Proxy hanya untuk analisis layout;
+    kotak jawaban dirender ulang berwarna dari `page` (`crop_page_answer_boxes`).
+    """
+    doc = fitz.open(pdf_path)
+    try:
+        for page_number in range(len(doc)):
+            if page_number in skip_pages:
+                continue
+            page = doc[page_number]
+            yield page_number, page, render_page(page, dpi=layout_dpi, gray=True)
+    finally:
+        doc.close()
+
+
+def iter_pdf_answer_boxes(pdf_path, max_boxes=4, dpi=RENDER_DPI, layout_dpi=LAYOUT_DPI, deskew=False):
+    """
+    Generator `(page_number, answer_boxes, layout)` per halaman.
+
+    Halaman dirender di `layout_dpi` untuk analisis layout (sudut halaman,
+    deskew, deteksi kotak); lalu hanya area tiap kotak jawaban yang dirender
+    ulang di `dpi` lewat clip rect fitz dan di-warp ke bentuk akhirnya.
+    Halaman penuh tidak pernah dirasterisasi di resolusi tinggi.
+    """
+    scale = layout_dpi / dpi
+    for page_number, page, proxy in iter_pdf_layout_pages(pdf_path, layout_dpi=layout_dpi):
+        layout = analyze_layout(proxy, scale, max_boxes=max_boxes, deskew=deskew)
+        yield page_number, crop_page_answer_boxes(page, layout, dpi=dpi), layout
+
+
+if __name__ == "__main__":
+    doc = fitz.open("example.pdf")
+    print("Jumlah halaman:", len(doc))
+
+    # akses halaman pertama
+    page = doc[0]
+    text = page.get_text()
+    print(text)
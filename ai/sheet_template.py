@@ -0,0 +1,304 @@
+import io
+import json
+import os
+import cv2
+import numpy as np
+
+from deskew import estimate_skew_angle
+from image_processing import correct_perspective, find_answer_box_rects
+from ocr_cache import content_key
+from page_context import PageContext, gray_of
+from instrumentation import timed
+
+# Template lembar jawaban: layout kotak dideteksi sekali per Assignment,
+# lalu setiap scan cukup diregistrasi ke template (ORB + homografi RANSAC).
+OCR_TEMPLATE_FEATURES = int(os.getenv("OCR_TEMPLATE_FEATURES", "2000"))
+OCR_TEMPLATE_MAX_SIDE = int(os.getenv("OCR_TEMPLATE_MAX_SIDE", "1000"))
+# Registrasi dianggap berhasil hanya jika inlier cukup banyak DAN cukup
+# besar proporsinya; jika tidak, pipeline kembali ke deteksi kontur.
+OCR_TEMPLATE_MIN_INLIERS = int(os.getenv("OCR_TEMPLATE_MIN_INLIERS", "40"))
+OCR_TEMPLATE_MIN_INLIER_RATIO = float(os.getenv("OCR_TEMPLATE_MIN_INLIER_RATIO", "0.3"))
+# Verifikasi: proporsi titik di bingkai kotak template yang harus jatuh di
+# tinta pada scan. Menolak registrasi ke varian lembar yang berbeda.
+OCR_TEMPLATE_MIN_FRAME_SCORE = float(os.getenv("OCR_TEMPLATE_MIN_FRAME_SCORE", "0.8"))
+
+MATCH_RATIO = 0.75  # ratio test Lowe
+RANSAC_REPROJ_PX = 3.0  # di resolusi fitur
+MAX_SCALE_CHANGE = 1.5  # skala scan vs template yang masih masuk akal
+FRAME_PADDING = 50  # = padding default find_answer_box_rects (kotak -> bingkai tercetak)
+FRAME_STEP_PX = 10  # jarak titik sampel di sepanjang bingkai (resolusi penuh)
+FRAME_TOLERANCE = 3  # toleransi posisi bingkai, dalam piksel resolusi fitur (~10 px di 300 DPI)
+
+def _orb():
+    return cv2.ORB_create(nfeatures=OCR_TEMPLATE_FEATURES)
+
+def _small_gray(image, scale=1.0, max_side=OCR_TEMPLATE_MAX_SIDE):
+    """
+    Gray `image` yang diperkecil sampai sisi terpanjang `max_side`, beserta
+    skalanya relatif terhadap resolusi penuh (`scale` = skala `image`
+    sendiri, mis. proxy layout).
+    """
+    gray = gray_of(image)
+    factor = min(1.0, max_side / max(gray.shape[:2]))
+    if factor < 1.0:
+        gray = cv2.resize(gray, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA)
+    return gray, scale * factor
+
+def _features(gray, scale, mask=None):
+    """Keypoint ORB (koordinat resolusi penuh) dan descriptor dari gray berskala `scale`."""
+    keypoints, descriptors = _orb().detectAndCompute(gray, mask)
+    if descriptors is None:
+        return np.zeros((0, 2), np.float32), np.zeros((0, 32), np.uint8)
+    return np.array([kp.pt for kp in keypoints], dtype=np.float32) / scale, descriptors
+
+def _frame_points(boxes, size):
+    """Titik sampel di sepanjang bingkai tercetak tiap kotak (koordinat template)."""
+    W, H = size
+    points = []
+    for (x, y, w, h, _) in boxes:
+        x0, y0 = max(0, x - FRAME_PADDING), max(0, y - FRAME_PADDING)
+        x1, y1 = min(W - 1, x + w + FRAME_PADDING), min(H - 1, y + h + FRAME_PADDING)
+        xs = np.arange(x0, x1, FRAME_STEP_PX, dtype=np.float64)
+        ys = np.arange(y0, y1, FRAME_STEP_PX, dtype=np.float64)
+        points += [np.stack([xs, np.full_like(xs, y0)], 1), np.stack([xs, np.full_like(xs, y1)], 1),
+                   np.stack([np.full_like(ys, x0), ys], 1), np.stack([np.full_like(ys, x1), ys], 1)]
+    return np.concatenate(points) if points else np.zeros((0, 2))
+
+
+class PageTemplate:
+    """
+    Template satu halaman lembar jawaban, di koordinat halaman referensi
+    yang sudah dikoreksi perspektifnya (resolusi penuh):
+
+    - `size`: (W, H) halaman referensi
+    - `boxes`: list `(x, y, w, h, area)` kotak jawaban (sama seperti
+      `find_answer_box_rects`)
+    - `points` / `descriptors`: fitur ORB halaman referensi
+    - `skew`: sudut kemiringan halaman referensi (dipakai ulang untuk crop)
+    - `frames`: kotak hasil deteksi kontur yang bingkai tercetaknya dipakai
+      untuk verifikasi registrasi (default sama dengan `boxes`; berbeda jika
+      kotak ditentukan manual oleh pengajar)
+    """
+
+    def __init__(self, size, boxes, points, descriptors, skew=None, frames=None):
+        self.size = tuple(int(v) for v in size)
+        self.boxes = [tuple(int(v) for v in box) for box in boxes]
+        self.frames = self.boxes if frames is None else [tuple(int(v) for v in box) for box in frames]
+        self.points = np.asarray(points, dtype=np.float32)
+        self.descriptors = np.asarray(descriptors, dtype=np.uint8)
+        self.skew = skew
+
+    @classmethod
+    def from_page(cls, image, max_boxes=2, boxes=None):
+        """
+        Membangun template dari satu halaman scan (BGR atau PageContext).
+        Tanpa `boxes`, kotak dideteksi dengan `find_answer_box_rects`; jika
+        diberikan (dari pengajar), `boxes` adalah list `(x, y, w, h)` relatif
+        (0..1) terhadap halaman yang diberikan, sebelum koreksi perspektif.
+        """
+        page = image if isinstance(image, PageContext) else PageContext(image)
+        source_h, source_w = page.shape[:2]
+        corrected = correct_perspective(page)
+        W, H = corrected.shape[1], corrected.shape[0]
+
+        frames = find_answer_box_rects(corrected, max_boxes=max_boxes)
+        if boxes is None:
+            rects = frames
+        else:
+            rects = []
+            for (x, y, w, h) in boxes:
+                pts = np.array([[[x, y], [x + w, y], [x + w, y + h], [x, y + h]]], dtype=np.float64)
+                pts *= (source_w, source_h)
+                pts = cv2.perspectiveTransform(pts, corrected.matrix @ np.linalg.inv(page.matrix))[0]
+                x0, y0 = np.clip(pts.min(axis=0), 0, (W, H)).astype(int)
+                x1, y1 = np.clip(pts.max(axis=0), 0, (W, H)).astype(int)
+                rects.append((x0, y0, x1 - x0, y1 - y0, (x1 - x0) * (y1 - y0)))
+
+        # Fitur hanya dari bagian tercetak: isi kotak jawaban (tulisan tangan,
+        # berbeda di tiap scan) di-mask
+        gray, feature_scale = _small_gray(corrected)
+        mask = np.full(gray.shape, 255, np.uint8)
+        for (x, y, w, h, _) in rects + frames:
+            x0, y0 = int(x * feature_scale), int(y * feature_scale)
+            mask[y0:y0 + int(h * feature_scale), x0:x0 + int(w * feature_scale)] = 0
+        points, descriptors = _features(gray, feature_scale, mask)
+        skew = estimate_skew_angle(corrected, min_line_length=100)
+        return cls((W, H), rects, points, descriptors, skew=skew, frames=frames)
+
+    @timed("boxes")
+    def register(self, image, scale=1.0):
+        """
+        Meregistrasi scan ke template. `image` boleh berupa halaman penuh atau
+        proxy yang diperkecil dengan faktor `scale`.
+
+        Mengembalikan `(layout, confidence)`. `layout` berformat sama dengan
+        `analyze_layout` (matrix dari halaman scan resolusi penuh ke halaman
+        template, size, angle, skew, boxes), atau None jika registrasi gagal;
+        `confidence` berisi jumlah match, inlier, rasionya, dan `frame_score`
+        (proporsi bingkai kotak template yang ditemukan di scan).
+        """
+        confidence = {"matches": 0, "inliers": 0, "ratio": 0.0, "frame_score": 0.0}
+        if len(self.descriptors) < 2:
+            return None, confidence
+
+        gray, feature_scale = _small_gray(image, scale=scale)
+        points, descriptors = _features(gray, feature_scale)
+        if len(descriptors) < 2:
+            return None, confidence
+
+        matcher = cv2.BFMatcher(cv2.NORM_HAMMING)
+        pairs = matcher.knnMatch(descriptors, self.descriptors, k=2)
+        good = [p[0] for p in pairs if len(p) == 2 and p[0].distance < MATCH_RATIO * p[1].distance]
+        confidence["matches"] = len(good)
+        if len(good) < 4:
+            return None, confidence
+
+        src = points[[m.queryIdx for m in good]]
+        dst = self.points[[m.trainIdx for m in good]]
+        # Reprojection threshold dinyatakan di resolusi fitur template
+        reproj = RANSAC_REPROJ_PX * max(self.size) / OCR_TEMPLATE_MAX_SIDE
+        M, mask = cv2.findHomography(src, dst, cv2.RANSAC, reproj)
+        if M is None:
+            return None, confidence
+
+        inliers = int(mask.sum())
+        confidence.update(inliers=inliers, ratio=inliers / len(good))
+        if inliers < OCR_TEMPLATE_MIN_INLIERS or confidence["ratio"] < OCR_TEMPLATE_MIN_INLIER_RATIO:
+            return None, confidence
+        # Refit least-squares pada semua inlier: homografi RANSAC cenderung
+        # bergeser beberapa piksel di tepi halaman
+        inlier_mask = mask.ravel().astype(bool)
+        M, _ = cv2.findHomography(src[inlier_mask], dst[inlier_mask], 0)
+        if M is None:
+            return None, confidence
+
+        # Tolak homografi yang membalik atau mengubah skala secara tidak wajar
+        det = np.linalg.det(M[:2, :2])
+        if not (1 / MAX_SCALE_CHANGE ** 2 < det < MAX_SCALE_CHANGE ** 2):
+            return None, confidence
+
+        confidence["frame_score"] = self.frame_score(gray, feature_scale, M)
+        if confidence["frame_score"] < OCR_TEMPLATE_MIN_FRAME_SCORE:
+            return None, confidence
+
+        layout = {"matrix": M, "size": self.size, "angle": 0.0, "skew": self.skew, "boxes": list(self.boxes)}
+        return layout, confidence
+
+
+    def frame_score(self, gray, scale, M):
+        """
+        Proporsi titik bingkai `frames` template yang, setelah dipetakan ke scan
+        lewat invers `M`, jatuh di tinta (toleransi `FRAME_TOLERANCE` piksel di
+        `gray`; bingkai tebal/berbayang tidak selalu pas di tepi kontur).
+        """
+        points = _frame_points(self.frames, self.size)
+        if not len(points):
+            return 1.0
+        scan = cv2.perspectiveTransform(points.reshape(1, -1, 2), np.linalg.inv(M))[0] * scale
+        ink = cv2.adaptiveThreshold(gray, 1, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 15, 10)
+        ink = cv2.dilate(ink, np.ones((2 * FRAME_TOLERANCE + 1,) * 2, np.uint8))
+        xs, ys = np.rint(scan).astype(np.int64).T
+        inside = (xs >= 0) & (ys >= 0) & (xs < ink.shape[1]) & (ys < ink.shape[0])
+        hits = np.zeros(len(points), dtype=bool)
+        hits[inside] = ink[ys[inside], xs[inside]] > 0
+        return float(hits.mean())
+
+
+class SheetTemplate:
+    """
+    Template satu lembar jawaban (satu atau beberapa halaman). Halaman scan
+    ke-i diregistrasi ke halaman template ke-i (halaman terakhir dipakai
+    untuk halaman scan berikutnya).
+    """
+
+    def __init__(self, pages, source="detected"):
+        self.pages = pages
+        self.source = source
+        self.template_id = content_key(
+            source, *[(p.size, p.boxes) for p in pages], *[p.descriptors for p in pages]
+        )
+
+    def page(self, page_number):
+        return self.pages[min(page_number, len(self.pages) - 1)] if self.pages else None
+
+    def layout_for(self, image, page_number, scale=1.0):
+        """Layout hasil registrasi untuk halaman scan ke-`page_number`, atau None."""
+        page_template = self.page(page_number)
+        if page_template is None:
+            return None
+        layout, confidence = page_template.register(image, scale=scale)
+        if layout is None:
+            print(f"⚠️ [Template] Registrasi halaman {page_number+1} gagal "
+                  f"({confidence['inliers']}/{confidence['matches']} inlier, "
+                  f"bingkai {confidence['frame_score']:.2f}). Kembali ke deteksi kontur.")
+        return layout
+
+    def describe(self):
+        """Ringkasan layout (kotak relatif 0..1 terhadap halaman template)."""
+        return {
+            "template_id": self.template_id,
+            "source": self.source,
+            "pages": [
+                {"size": list(p.size),
+                 "boxes": [[x / p.size[0], y / p.size[1], w / p.size[0], h / p.size[1]] for (x, y, w, h, _) in p.boxes]}
+                for p in self.pages
+            ],
+        }
+
+    # ---------------------------------------------------------------- storage
+    def save(self, path):
+        arrays = {"meta": np.array(json.dumps({
+            "source": self.source,
+            "pages": [{"size": p.size, "boxes": p.boxes, "frames": p.frames, "skew": p.skew} for p in self.pages],
+        }))}
+        for i, p in enumerate(self.pages):
+            arrays[f"p{i}_points"] = p.points
+            arrays[f"p{i}_descriptors"] = p.descriptors
+        buf = io.BytesIO()
+        np.savez_compressed(buf, **arrays)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(buf.getvalue())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as npz:
+            meta = json.loads(str(npz["meta"]))
+            pages = [
+                PageTemplate(p["size"], p["boxes"], npz[f"p{i}_points"], npz[f"p{i}_descriptors"], skew=p["skew"],
+                             frames=p.get("frames"))
+                for i, p in enumerate(meta["pages"])
+            ]
+        return cls(pages, source=meta["source"])
+
+
+def build_template_from_pdf(pdf_path, max_boxes=2, boxes=None):
+    """
+    Membangun SheetTemplate dari PDF lembar jawaban (kosong atau sudah
+    diisi). `boxes` (opsional, dari pengajar) adalah list per halaman berisi
+    kotak `(x, y, w, h)` relatif terhadap halaman PDF.
+    """
+    from pdf_processing import iter_pdf_pages
+
+    pages = []
+    for page_number, image in iter_pdf_pages(pdf_path):
+        page_boxes = boxes[page_number] if boxes is not None and page_number < len(boxes) else None
+        if boxes is not None and page_boxes is None:
+            break
+        pages.append(PageTemplate.from_page(image, max_boxes=max_boxes, boxes=page_boxes))
+    return SheetTemplate(pages, source="detected" if boxes is None else "manual")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Bangun template lembar jawaban dari PDF")
+    parser.add_argument("pdf_path")
+    parser.add_argument("out_path")
+    parser.add_argument("--max-boxes", type=int, default=2)
+    args = parser.parse_args()
+
+    template = build_template_from_pdf(args.pdf_path, max_boxes=args.max_boxes)
+    template.save(args.out_path)
+    print(json.dumps(template.describe(), indent=2))
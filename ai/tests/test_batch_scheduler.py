@@ -0,0 +1,37 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch_scheduler import plan_batches
+from decoding_policy import DecodingPolicy
+
+# Budget token = 6 + ceil(lebar / tinggi), maksimum 64
+POLICY = DecodingPolicy(tokens_per_aspect=1.0, base_tokens=6, max_tokens=64)
+
+SHORT = (64, 32)   # 1-2 kata: budget 8
+LONG = (1200, 32)  # selebar halaman: budget 44
+
+
+def test_without_bucketing_keeps_input_order():
+    sizes = [LONG, SHORT, LONG, SHORT, SHORT]
+    assert plan_batches(sizes, 2, POLICY, bucketing=False) == [[0, 1], [2, 3], [4]]
+
+
+def test_short_and_long_lines_are_not_mixed():
+    sizes = [LONG, SHORT, LONG, SHORT, LONG, SHORT, LONG, SHORT]
+    batches = plan_batches(sizes, 4, POLICY, bucketing=True, bucket_tokens=4)
+    assert batches == [[1, 3, 5, 7], [0, 2, 4, 6]]
+
+
+def test_every_index_is_scheduled_once_within_batch_size():
+    sizes = [(40 + 37 * i, 32) for i in range(23)]
+    batches = plan_batches(sizes, 5, POLICY, bucketing=True, bucket_tokens=4)
+    assert sorted(i for batch in batches for i in batch) == list(range(len(sizes)))
+    assert all(1 <= len(batch) <= 5 for batch in batches)
+
+
+def test_small_bucket_is_topped_up_from_the_next_bucket():
+    # Satu baris pendek saja tidak membuat batch berisi satu crop
+    sizes = [SHORT, LONG, LONG, LONG]
+    assert plan_batches(sizes, 4, POLICY, bucketing=True, bucket_tokens=4) == [[0, 1, 2, 3]]
@@ -0,0 +1,45 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import decoding_policy
+from decoding_policy import DecodingPolicy
+
+
+def test_token_budget_grows_with_aspect_ratio_and_is_capped():
+    policy = DecodingPolicy(tokens_per_aspect=1.0, base_tokens=6, max_tokens=20)
+    assert policy.token_budget(64, 32) == 8
+    assert policy.token_budget(65, 32) == 9
+    assert policy.token_budget(3000, 32) == 20
+    # Tinggi 0 tidak membuat pembagian nol
+    assert policy.token_budget(10, 0) == 16
+
+
+def test_batch_uses_largest_budget():
+    policy = DecodingPolicy(tokens_per_aspect=1.0, base_tokens=6, max_tokens=64)
+    assert policy.generate_kwargs([(64, 32), (320, 32)]) == {"max_new_tokens": 16, "num_beams": 1}
+
+
+def test_num_beams_only_applies_to_beam_strategy():
+    assert DecodingPolicy(strategy="greedy", num_beams=4).num_beams == 1
+    assert DecodingPolicy(strategy="beam", num_beams=4).num_beams == 4
+    with pytest.raises(ValueError):
+        DecodingPolicy(strategy="sampling")
+
+
+def test_cache_id_changes_with_every_parameter():
+    base = dict(strategy="greedy", num_beams=4, tokens_per_aspect=1.0, base_tokens=6, max_tokens=64)
+    ids = {DecodingPolicy(**base).cache_id}
+    for key, value in (("strategy", "beam"), ("tokens_per_aspect", 2.0), ("base_tokens", 8), ("max_tokens", 32)):
+        ids.add(DecodingPolicy(**{**base, key: value}).cache_id)
+    assert len(ids) == 5
+
+
+def test_set_decoding_policy_replaces_process_policy(monkeypatch):
+    policy = DecodingPolicy(strategy="beam")
+    monkeypatch.setattr(decoding_policy, "DECODING_POLICY", decoding_policy.DECODING_POLICY)
+    decoding_policy.set_decoding_policy(policy)
+    assert decoding_policy.get_decoding_policy() is policy
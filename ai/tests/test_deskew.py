@@ -0,0 +1,43 @@
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from deskew import deskew_crop, estimate_skew_angle, residual_skew_angle, rotate_image
+
+
+def ruled_crop():
+    """Crop kotak jawaban sintetis: garis bantu horizontal lurus."""
+    image = np.full((300, 800), 255, np.uint8)
+    for y in range(40, 300, 40):
+        cv2.line(image, (20, y), (780, y), 0, 2)
+    return image
+
+
+@pytest.mark.parametrize("skew", [-3.0, -1.0, 2.0, 4.0])
+def test_residual_angle_uses_same_sign_as_hough_estimate(skew):
+    # rotate_image(x, a) meluruskan crop bersudut a, jadi -skew membuat crop bersudut skew
+    skewed = rotate_image(ruled_crop(), -skew)
+    residual = residual_skew_angle(skewed)
+    assert residual == pytest.approx(skew, abs=0.2)
+    assert residual == pytest.approx(estimate_skew_angle(skewed, max_side=None), abs=0.2)
+    # Memutar dengan sudut residual meluruskan crop
+    assert residual_skew_angle(rotate_image(skewed, residual)) == pytest.approx(0.0, abs=0.2)
+
+
+def test_blank_crop_has_no_residual():
+    assert residual_skew_angle(np.full((100, 400), 255, np.uint8)) is None
+
+
+def test_crop_is_redeskewed_only_when_page_angle_is_off():
+    skewed = rotate_image(ruled_crop(), -3.0)
+    _, info = deskew_crop(skewed, page_angle=2.8)
+    assert info["source"] == "page" and info["angle"] == 2.8
+    _, info = deskew_crop(skewed, page_angle=0.0)
+    assert info["source"] == "crop"
+    assert info["residual"] == pytest.approx(3.0, abs=0.2)
+    assert info["angle"] == pytest.approx(3.0, abs=0.5)
@@ -0,0 +1,60 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ocr_cache import OCRCache, content_key
+
+
+def test_content_key_depends_on_array_content_shape_and_params():
+    image = np.zeros((4, 4), np.uint8)
+    assert content_key(image, {"dpi": 300}) == content_key(image.copy(), {"dpi": 300})
+    assert content_key(image, {"dpi": 300}) != content_key(image, {"dpi": 200})
+    assert content_key(image) != content_key(image.reshape(2, 8))
+    assert content_key(image) != content_key(image + 1)
+
+
+def test_overwriting_an_entry_does_not_grow_size(tmp_path):
+    cache = OCRCache(str(tmp_path))
+    cache.put_line("k", "teks pertama")
+    size = cache.stats()["size_bytes"]
+    cache.put_line("k", "teks pertama")
+    cache.put_line("k", "teks pertama")
+    assert cache.stats()["size_bytes"] == size
+    cache.put_line("k", "teks")
+    assert cache.stats()["size_bytes"] < size
+    assert cache.get_line("k") == ("teks", None)
+
+
+def test_size_is_restored_from_disk(tmp_path):
+    cache = OCRCache(str(tmp_path))
+    cache.put_pdf("a", {"text": "x"})
+    cache.put_line("b", "y", 0.5)
+    assert OCRCache(str(tmp_path)).stats()["size_bytes"] == cache.stats()["size_bytes"]
+
+
+def test_least_recently_read_entry_is_evicted_first(tmp_path):
+    cache = OCRCache(str(tmp_path), max_bytes=10**6)
+    for i, key in enumerate("abc"):
+        cache.put_line(key, key * 100)
+        os.utime(cache._path("line", key, "json"), (1000 + i, 1000 + i))
+    cache.get_line("a")  # "a" jadi yang paling baru diakses
+    cache.max_bytes = cache.stats()["size_bytes"]
+    cache.put_line("d", "d" * 100)
+    assert cache.get_line("b") is None
+    assert cache.get_line("a") is not None
+    assert cache.stats()["size_bytes"] <= cache.max_bytes
+
+
+def test_page_entry_round_trip(tmp_path):
+    cache = OCRCache(str(tmp_path))
+    crops = [[np.full((8, 20), 7, np.uint8), np.zeros((8, 30), np.uint8)], []]
+    cache.put_page("p", crops, [[(0, 0, 20, 8), (0, 10, 30, 8)], []])
+    boxes_lines, line_bboxes = cache.get_page("p")
+    assert [len(lines) for lines in boxes_lines] == [2, 0]
+    assert np.array_equal(boxes_lines[0][0], crops[0][0])
+    assert line_bboxes == [[(0, 0, 20, 8), (0, 10, 30, 8)], []]
+    assert cache.get_page("tidak-ada") is None
+    assert cache.stats()["hits"]["page"] == 1 and cache.stats()["misses"]["page"] == 1
@@ -0,0 +1,107 @@
+import os
+import sys
+import threading
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ocr_worker
+from instrumentation import MetricsRegistry
+
+
+class FakeExecutor:
+    """Pengganti ProcessPoolExecutor: future diselesaikan manual oleh test."""
+
+    def __init__(self):
+        self.futures = []
+        self.shut_down = False
+
+    def submit(self, fn, *args):
+        if self.shut_down:
+            raise BrokenProcessPool("pool rusak")
+        future = Future()
+        self.futures.append(future)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+def make_pool(job_ttl=3600, max_finished_jobs=1000):
+    # Tanpa __init__: tidak ada proses worker maupun thread pump event
+    pool = ocr_worker.OCRWorkerPool.__new__(ocr_worker.OCRWorkerPool)
+    pool.num_workers = 1
+    pool.job_ttl = job_ttl
+    pool.max_finished_jobs = max_finished_jobs
+    pool._jobs, pool._finished, pool._history, pool._subscribers = {}, {}, {}, {}
+    pool._lock = threading.Lock()
+    pool.metrics = MetricsRegistry()
+    pool._executor = FakeExecutor()
+    pool._new_executor = FakeExecutor
+    return pool
+
+
+def finish(future):
+    future.set_result({"text": "", "result": {"pages": []}, "trace": None})
+
+
+def test_finished_jobs_over_limit_are_forgotten_oldest_first(tmp_path):
+    pool = make_pool(max_finished_jobs=2)
+    pdf = tmp_path / "a.pdf"
+    pdf.write_bytes(b"%PDF")
+    job_ids = [pool.submit(str(pdf)) for _ in range(4)]
+    for future in pool._executor.futures[:3]:
+        finish(future)
+    pool._publish(job_ids[0], {"type": "done"})
+
+    assert pool.prune() == [job_ids[0]]
+    assert pool.get_job(job_ids[0]) is None
+    assert job_ids[0] not in pool._history
+    # Job yang masih berjalan tidak pernah dilupakan
+    assert pool.get_job(job_ids[3])["status"] == "queued"
+    # Event job yang sudah dilupakan diabaikan
+    pool._publish(job_ids[0], {"type": "line"})
+    assert job_ids[0] not in pool._history
+
+
+def test_expired_jobs_are_forgotten_unless_streamed(tmp_path):
+    pool = make_pool(job_ttl=60)
+    pdf = tmp_path / "a.pdf"
+    pdf.write_bytes(b"%PDF")
+    job_ids = [pool.submit(str(pdf)) for _ in range(2)]
+    for future in pool._executor.futures:
+        finish(future)
+    for job_id in job_ids:
+        pool._finished[job_id] -= 120
+    pool._subscribers[job_ids[1]] = [object()]
+
+    assert pool.prune() == [job_ids[0]]
+    assert pool.get_job(job_ids[1])["status"] == "done"
+
+
+def test_delete_pdf_removes_upload_after_job(tmp_path):
+    pool = make_pool()
+    pdf = tmp_path / "a.pdf"
+    pdf.write_bytes(b"%PDF")
+    pool.submit(str(pdf), delete_pdf=True)
+    assert pdf.exists()
+    pool._executor.futures[0].set_exception(RuntimeError("rusak"))
+    assert not pdf.exists()
+
+
+def test_broken_pool_fails_job_and_is_replaced(tmp_path):
+    pool = make_pool()
+    pdf = tmp_path / "a.pdf"
+    pdf.write_bytes(b"%PDF")
+    broken = pool._executor
+    job_id = pool.submit(str(pdf))
+    broken.futures[0].set_exception(BrokenProcessPool("worker mati"))
+
+    assert pool.get_job(job_id)["status"] == "failed"
+    assert pool._history[job_id][-1]["type"] == "failed"
+    assert broken.shut_down and pool._executor is not broken
+    # Job berikutnya langsung masuk ke pool baru
+    next_id = pool.submit(str(pdf))
+    assert pool.get_job(next_id)["status"] == "queued"
+    assert len(pool._executor.futures) == 1
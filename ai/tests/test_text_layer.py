@@ -0,0 +1,56 @@
+import os
+import sys
+
+import fitz
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import text_layer
+from pdf_processing import RENDER_DPI
+from text_layer import clip_lines, has_text_layer, text_layer_pages, visible_text_chars
+
+TYPED = "Fotosintesis mengubah cahaya menjadi energi kimia"
+
+
+def test_invisible_ocr_text_is_not_counted():
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 100), "Halo dunia", fontsize=12)
+    page.insert_text((72, 300), "teks OCR scanner", fontsize=12, render_mode=3)
+    assert visible_text_chars(page) == len("Halo dunia")
+
+
+def test_clip_lines_are_in_reading_order_relative_to_clip():
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 130), "baris dua", fontsize=12)
+    page.insert_text((72, 100), "baris satu", fontsize=12)
+    page.insert_text((72, 400), "di luar kotak", fontsize=12)
+    clip = fitz.Rect(60, 80, 400, 140)
+
+    lines = clip_lines(page, clip)
+    assert [text for text, _ in lines] == ["baris satu", "baris dua"]
+    x, y, w, h = lines[0][1]
+    # Bbox dalam piksel RENDER_DPI, relatif ke pojok kiri atas clip
+    assert x == round((72 - 60) * RENDER_DPI / 72)
+    assert 0 <= y < lines[1][1][1] and w > 0 and h > 0
+
+
+def test_text_layer_pages_skip_scans(tmp_path, monkeypatch):
+    monkeypatch.setattr(text_layer, "OCR_TEXT_LAYER", True)
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 100), TYPED, fontsize=12)
+    scan = doc.new_page()
+    pixmap = fitz.Pixmap(fitz.csGRAY, fitz.IRect(0, 0, 60, 80), False)
+    pixmap.set_rect(pixmap.irect, (255,))
+    scan.insert_image(scan.rect, pixmap=pixmap)
+    scan.insert_text((72, 100), TYPED, fontsize=12)  # header cetak di atas scan
+    doc.new_page()
+    path = str(tmp_path / "campuran.pdf")
+    doc.save(path)
+
+    with fitz.open(path) as saved:
+        assert [has_text_layer(page) for page in saved] == [True, False, False]
+    assert text_layer_pages(path) == [0]
+    monkeypatch.setattr(text_layer, "OCR_TEXT_LAYER", False)
+    assert text_layer_pages(path) == []
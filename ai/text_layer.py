@@ -0,0 +1,112 @@
+import os
+import fitz
+
+from image_processing import box_source_rect, find_answer_box_rects
+from instrumentation import count, stage
+from pdf_processing import LAYOUT_DPI, RENDER_DPI, render_page
+
+# Jalur cepat untuk halaman PDF yang punya text layer asli (dokumen ketikan
+# yang diekspor ke PDF): teks tiap kotak jawaban diambil langsung dari PDF
+# lewat clip rect fitz, tanpa rasterisasi 300 DPI dan tanpa TrOCR.
+# Set OCR_TEXT_LAYER=0 untuk selalu memakai OCR.
+OCR_TEXT_LAYER = os.getenv("OCR_TEXT_LAYER", "1") != "0"
+# Halaman dianggap punya text layer jika ada minimal sekian karakter teks
+# yang terlihat (teks tak terlihat hasil OCR scanner tidak dihitung)...
+OCR_TEXT_LAYER_MIN_CHARS = int(os.getenv("OCR_TEXT_LAYER_MIN_CHARS", "20"))
+# ...dan gambar menutupi kurang dari fraksi ini dari luas halaman (scan
+# dengan teks tambahan, mis. header cetak, tetap di-OCR)
+OCR_TEXT_LAYER_MAX_IMAGE_COVER = float(os.getenv("OCR_TEXT_LAYER_MAX_IMAGE_COVER", "0.5"))
+
+INVISIBLE_TEXT = 3  # text render mode "invisible" (lapisan OCR di atas scan)
+
+def text_layer_id():
+    """Identitas konfigurasi text layer untuk key cache PDF."""
+    if not OCR_TEXT_LAYER:
+        return "off"
+    return f"{OCR_TEXT_LAYER_MIN_CHARS}:{OCR_TEXT_LAYER_MAX_IMAGE_COVER}"
+
+def visible_text_chars(page):
+    """Jumlah karakter teks yang benar-benar tergambar di halaman."""
+    return sum(len(span["chars"]) for span in page.get_texttrace()
+               if span["type"] != INVISIBLE_TEXT and span.get("opacity", 1) > 0)
+
+def image_coverage(page):
+    """Fraksi luas halaman yang tertutup gambar (perkiraan atas: overlap dihitung ganda)."""
+    page_area = abs(page.rect)
+    if not page_area:
+        return 0.0
+    covered = sum(abs(fitz.Rect(info["bbox"]) & page.rect) for info in page.get_image_info())
+    return min(1.0, covered / page_area)
+
+def has_text_layer(page):
+    """True jika halaman cukup diekstrak dari text layer-nya (lihat OCR_TEXT_LAYER_*)."""
+    return (visible_text_chars(page) >= OCR_TEXT_LAYER_MIN_CHARS
+            and image_coverage(page) < OCR_TEXT_LAYER_MAX_IMAGE_COVER)
+
+def text_layer_pages(pdf_path):
+    """Nomor halaman (0-based) PDF yang punya text layer; kosong jika OCR_TEXT_LAYER=0."""
+    if not OCR_TEXT_LAYER:
+        return []
+    with fitz.open(pdf_path) as doc:
+        return [page_number for page_number in range(len(doc)) if has_text_layer(doc[page_number])]
+
+def answer_box_clips(page, page_number, max_boxes=2, template=None):
+    """
+    Rect kotak jawaban (koordinat PDF, point) pada halaman digital. Layout
+    dicari di render `LAYOUT_DPI` (murah) seperti halaman scan, tetapi tanpa
+    koreksi perspektif dan tanpa padding ke dalam: halaman PDF asli tidak
+    miring, dan teks yang menempel di bingkai tetap harus ikut.
+    """
+    scale = LAYOUT_DPI / RENDER_DPI
+    proxy = render_page(page, dpi=LAYOUT_DPI, gray=True)
+    layout = template.layout_for(proxy, page_number, scale=scale) if template else None
+    if layout is not None:
+        rects_px = [box_source_rect(layout, box) for box in layout["boxes"]]
+        zoom = 72.0 / RENDER_DPI
+    else:
+        boxes = find_answer_box_rects(proxy, max_boxes=max_boxes, block_size=max(3, int(round(15 * scale))) | 1, padding=0)
+        rects_px = [(x, y, x + w, y + h) for (x, y, w, h, _) in boxes]
+        zoom = 72.0 / LAYOUT_DPI
+    return [fitz.Rect(*(v * zoom for v in rect)) & page.rect for rect in rects_px]
+
+def clip_lines(page, clip):
+    """
+    Baris teks di dalam `clip` sebagai list `(teks, bbox)`, urut baca. Bbox
+    `(x, y, w, h)` relatif terhadap pojok kiri atas `clip`, dalam piksel
+    RENDER_DPI (satuan yang sama dengan bbox baris hasil OCR).
+    """
+    zoom = RENDER_DPI / 72.0
+    lines = []
+    for block in page.get_text("dict", clip=clip, sort=True)["blocks"]:
+        for line in block.get("lines", ()):
+            text = "".join(span["text"] for span in line["spans"]).strip()
+            if not text:
+                continue
+            x0, y0, x1, y1 = line["bbox"]
+            lines.append((text, (int(round((x0 - clip.x0) * zoom)), int(round((y0 - clip.y0) * zoom)),
+                                 int(round((x1 - x0) * zoom)), int(round((y1 - y0) * zoom)))))
+    return lines
+
+def extract_page_box_lines(page, page_number, max_boxes=2, template=None):
+    """
+    Baris teks tiap kotak jawaban dari text layer halaman (lihat
+    `clip_lines`), urut seperti hasil deteksi kotak. Jika tidak ada kotak
+    yang terdeteksi, seluruh halaman dikembalikan sebagai satu kotak.
+    """
+    clips = answer_box_clips(page, page_number, max_boxes=max_boxes, template=template)
+    if not clips:
+        print(f"⚠️ [TextLayer] Kotak jawaban halaman {page_number+1} tidak ditemukan; memakai seluruh teks halaman.")
+        clips = [page.rect]
+    with stage("text_layer"):
+        return [clip_lines(page, clip) for clip in clips]
+
+def iter_text_layer_pages(pdf_path, page_numbers, max_boxes=2, template=None):
+    """Generator `(page_number, boxes_lines)` untuk halaman `page_numbers` (dari `text_layer_pages`)."""
+    if not page_numbers:
+        return
+    with fitz.open(pdf_path) as doc:
+        for page_number in page_numbers:
+            count("pages")
+            count("text_layer_pages")
+            yield page_number, extract_page_box_lines(doc[page_number], page_number, max_boxes=max_boxes,
+                                                      template=template)
@@ -0,0 +1,22 @@
+def levenshtein(a, b):
+    """Jarak edit (insert/delete/substitute) antara dua string."""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+def normalize_text(text):
+    """Samakan spasi/baris kosong supaya CER hanya menghitung isi teks."""
+    return " ".join(text.split())
+
+def character_error_rate(hypothesis, reference):
+    """CER = jarak edit / panjang referensi (setelah normalisasi spasi)."""
+    hypothesis, reference = normalize_text(hypothesis), normalize_text(reference)
+    if not reference:
+        return 0.0 if not hypothesis else 1.0
+    return levenshtein(hypothesis, reference) / len(reference)
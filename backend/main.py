@@ -9,6 +9,7 @@ from routers import (
     grading,
     profile,
     dashboard,
+    ocr,
 )
 from core.db import create_tables
 
@@ -42,13 +43,25 @@ app.include_router(assignments.router, tags=["assignments"])
 
 app.include_router(grading.router, tags=["grading"])
 
-# app.include_router(ocr.router, tags=["ocr"])
+app.include_router(ocr.router, tags=["ocr"])
 
 @app.on_event("startup")
 async def on_startup():
     await create_tables()
     print("Database tables created successfully")
 
+    from services.ocr_service import start_ocr_pool
+    try:
+        start_ocr_pool()
+    except Exception as e:
+        print(f"Warning: Failed to start OCR workers: {e}")
+
+    from services.ocr_grading import resume_ocr_gradings
+    try:
+        await resume_ocr_gradings()
+    except Exception as e:
+        print(f"Warning: Failed to resume OCR grading: {e}")
+
     # NOTE: Uncomment kalo AI sudah full implemented
     # from services.grading_service import initialize_embedding_model
     # try:
@@ -57,6 +70,12 @@ async def on_startup():
     #     print(f"Warning: Failed to initialize embedding model: {e}")
 
 
+@app.on_event("shutdown")
+async def on_shutdown():
+    from services.ocr_service import shutdown_ocr_pool
+    shutdown_ocr_pool()
+
+
 @app.get("/")
 async def root():
     return {"message": "oke redi"}
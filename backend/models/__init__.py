@@ -6,6 +6,8 @@ from models.question import Question
 from models.assignment_submission import AssignmentSubmission, SubmissionType
 from models.question_answer import QuestionAnswer
 from models.nilai import Nilai
+from models.answer_sheet_template import AnswerSheetTemplate
+from models.ocr_grading import OCRGrading, OCRGradingStatus
 
 __all__ = [
     "User",
@@ -19,5 +21,8 @@ __all__ = [
     "SubmissionType",
     "QuestionAnswer",
     "Nilai",
+    "AnswerSheetTemplate",
+    "OCRGrading",
+    "OCRGradingStatus",
 ]
 
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text
+from sqlalchemy.orm import relationship
+from datetime import datetime
+from models.user_model import Base
+
+class AnswerSheetTemplate(Base):
+    __tablename__ = "answer_sheet_templates"
+
+    id = Column(Integer, primary_key=True, index=True)
+    assignment_id = Column(Integer, ForeignKey("assignments.id", ondelete="CASCADE"), unique=True, nullable=False)
+    file_path = Column(String, nullable=False)
+    source = Column(String, nullable=False, default="detected")
+    num_pages = Column(Integer, nullable=False, default=1)
+    layout_json = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    assignment = relationship("Assignment", back_populates="answer_sheet_template")
@@ -26,4 +26,5 @@ class Assignment(Base):
     kelas = relationship("Kelas", back_populates="assignments")
     questions = relationship("Question", back_populates="assignment", cascade="all, delete-orphan", order_by="Question.question_order")
     submissions = relationship("AssignmentSubmission", back_populates="assignment", cascade="all, delete-orphan")
+    answer_sheet_template = relationship("AnswerSheetTemplate", back_populates="assignment", uselist=False, cascade="all, delete-orphan")
 
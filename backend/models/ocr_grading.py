@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Enum as SQLEnum
+from sqlalchemy.orm import relationship
+from datetime import datetime
+import enum
+from models.user_model import Base
+
+class OCRGradingStatus(str, enum.Enum):
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+class OCRGrading(Base):
+    """Status penilaian background submission OCR; yang masih RUNNING dilanjutkan saat backend start."""
+    __tablename__ = "ocr_gradings"
+
+    id = Column(Integer, primary_key=True, index=True)
+    submission_id = Column(Integer, ForeignKey("assignment_submissions.id", ondelete="CASCADE"), unique=True, nullable=False)
+    job_id = Column(String, nullable=False)
+    status = Column(SQLEnum(OCRGradingStatus), nullable=False, default=OCRGradingStatus.RUNNING)
+    attempts = Column(Integer, nullable=False, default=1)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    submission = relationship("AssignmentSubmission", back_populates="ocr_grading")
@@ -1,10 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, delete
 from sqlalchemy.orm import selectinload
 from pydantic import BaseModel
 from typing import List, Optional, Dict
 from datetime import datetime
+import json
+import os
+import shutil
 
 from core.db import get_session
 from core.auth import get_current_user, get_current_dosen
@@ -16,8 +19,12 @@ from models.assignment_submission import AssignmentSubmission, SubmissionType
 from models.question_answer import QuestionAnswer
 from models.class_participant import ClassParticipant
 from models.nilai import Nilai
-# from services.ocr_service import process_uploaded_file
+from models.answer_sheet_template import AnswerSheetTemplate
+from models.ocr_grading import OCRGrading
+from services.ocr_service import AI_DIR, build_sheet_template, template_path_for
+from services.ocr_grading import question_payload, start_ocr_grading
 from services.grading_tunneling import grade_submission_batch_via_tunnel
+from routers.ocr import find_template_path, save_and_submit
 
 router = APIRouter(prefix="/api/assignments", tags=["assignments"])
 
@@ -96,6 +103,23 @@ class QuestionAnswerRead(BaseModel):
     class Config:
         from_attributes = True
 
+class AnswerSheetTemplateResponse(BaseModel):
+    assignment_id: int
+    source: str
+    num_pages: int
+    pages: List[Dict]
+    updated_at: datetime
+
+def template_response(template: AnswerSheetTemplate) -> AnswerSheetTemplateResponse:
+    layout = json.loads(template.layout_json or "{}")
+    return AnswerSheetTemplateResponse(
+        assignment_id=template.assignment_id,
+        source=template.source,
+        num_pages=template.num_pages,
+        pages=layout.get("pages", []),
+        updated_at=template.updated_at
+    )
+
 class SubmissionResponse(BaseModel):
     id: int
     assignment_id: int
@@ -391,6 +415,116 @@ async def delete_assignment(
 
     return None
 
+async def get_teacher_assignment(assignment_id: int, current_user: User, db: AsyncSession) -> Assignment:
+    result = await db.execute(
+        select(Assignment)
+        .options(selectinload(Assignment.kelas), selectinload(Assignment.answer_sheet_template))
+        .where(Assignment.id == assignment_id)
+    )
+    assignment = result.scalar_one_or_none()
+
+    if not assignment:
+        raise HTTPException(status_code=404, detail="Tugas tidak ditemukan")
+
+    if assignment.kelas.teacher_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Tidak punya permission untuk mengatur template tugas di kelas ini")
+
+    return assignment
+
+@router.post("/{assignment_id}/template", response_model=AnswerSheetTemplateResponse)
+async def upload_answer_sheet_template(
+    assignment_id: int,
+    file: UploadFile = File(...),
+    boxes: Optional[str] = Form(None),
+    current_user: User = Depends(get_current_dosen),
+    db: AsyncSession = Depends(get_session)
+):
+    """
+    Template lembar jawaban: PDF lembar (kosong atau contoh terisi), layout
+    kotak dideteksi sekali di sini. `boxes` (opsional, JSON) menentukan kotak
+    secara manual: list per halaman berisi `[x, y, w, h]` relatif (0..1).
+    Scan OCR untuk tugas ini lalu cukup diregistrasi ke template.
+    """
+    assignment = await get_teacher_assignment(assignment_id, current_user, db)
+
+    if not file.filename.endswith('.pdf'):
+        raise HTTPException(status_code=400, detail="Hanya file PDF yang diizinkan")
+
+    page_boxes = None
+    if boxes:
+        try:
+            page_boxes = json.loads(boxes)
+            if not isinstance(page_boxes, list) or not all(
+                isinstance(page, list) and all(isinstance(box, list) and len(box) == 4 for box in page)
+                for page in page_boxes
+            ):
+                raise ValueError
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Format boxes tidak valid: list per halaman berisi [x, y, w, h]")
+
+    template_path = template_path_for(assignment_id)
+    pdf_path = template_path[:-len(".npz")] + ".pdf"
+    os.makedirs(os.path.dirname(pdf_path), exist_ok=True)
+    with open(pdf_path, "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
+
+    try:
+        layout = await build_sheet_template(pdf_path, template_path, boxes=page_boxes)
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f"Gagal membangun template lembar jawaban: {e}")
+
+    if not layout["pages"] or not any(page["boxes"] for page in layout["pages"]):
+        raise HTTPException(status_code=422, detail="Tidak ada kotak jawaban yang terdeteksi di template")
+
+    template = assignment.answer_sheet_template
+    if template is None:
+        template = AnswerSheetTemplate(assignment_id=assignment_id)
+        db.add(template)
+    template.file_path = template_path
+    template.source = layout["source"]
+    template.num_pages = len(layout["pages"])
+    template.layout_json = json.dumps(layout)
+    template.updated_at = datetime.utcnow()
+
+    await db.commit()
+    await db.refresh(template)
+
+    return template_response(template)
+
+@router.get("/{assignment_id}/template", response_model=AnswerSheetTemplateResponse)
+async def get_answer_sheet_template(
+    assignment_id: int,
+    current_user: User = Depends(get_current_dosen),
+    db: AsyncSession = Depends(get_session)
+):
+    assignment = await get_teacher_assignment(assignment_id, current_user, db)
+
+    if assignment.answer_sheet_template is None:
+        raise HTTPException(status_code=404, detail="Template lembar jawaban belum dibuat")
+
+    return template_response(assignment.answer_sheet_template)
+
+@router.delete("/{assignment_id}/template", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_answer_sheet_template(
+    assignment_id: int,
+    current_user: User = Depends(get_current_dosen),
+    db: AsyncSession = Depends(get_session)
+):
+    assignment = await get_teacher_assignment(assignment_id, current_user, db)
+    template = assignment.answer_sheet_template
+
+    if template is None:
+        raise HTTPException(status_code=404, detail="Template lembar jawaban belum dibuat")
+
+    for path in (template.file_path, template.file_path[:-len(".npz")] + ".pdf"):
+        if os.path.exists(path):
+            os.remove(path)
+
+    await db.delete(template)
+    await db.commit()
+
+    return None
+
 @router.post("/{assignment_id}/submit/typing", status_code=status.HTTP_201_CREATED)
 async def submit_answer_typing(
     assignment_id: int,
@@ -541,59 +675,79 @@ async def submit_answer_typing(
             "submission_id": submission.id
         }
 
-# @router.post("/{assignment_id}/submit/ocr", status_code=status.HTTP_201_CREATED)
-# async def submit_answer_ocr(
-#     assignment_id: int,
-#     file: UploadFile = File(...),
-#     current_user: User = Depends(get_current_user),
-#     db: AsyncSession = Depends(get_session)
-# ):
-#     result = await db.execute(
-#         select(Assignment)
-#         .options(selectinload(Assignment.kelas), selectinload(Assignment.questions))
-#         .where(Assignment.id == assignment_id)
-#     )
-#     assignment = result.scalar_one_or_none()
-
-#     if not assignment:
-#         raise HTTPException(status_code=404, detail="Tugas tidak ditemukan")
-
-#     if not assignment.is_published:
-#         raise HTTPException(status_code=403, detail="Tugas belum diterbitkan")
-
-#     result = await db.execute(
-#         select(ClassParticipant).where(
-#             ClassParticipant.kelas_id == assignment.kelas_id,
-#             ClassParticipant.user_id == current_user.id
-#         )
-#     )
-#     is_participant = result.scalar_one_or_none() is not None
-
-#     if not is_participant:
-#         raise HTTPException(status_code=403, detail="Tidak punya permission untuk mengumpulkan tugas di kelas ini")
-
-#     if assignment.deadline and datetime.utcnow() > assignment.deadline:
-#         raise HTTPException(status_code=400, detail="Batas waktu pengumpulan tugas sudah lewat")
-
-#     result = await db.execute(
-#         select(AssignmentSubmission).where(
-#             AssignmentSubmission.assignment_id == assignment_id,
-#             AssignmentSubmission.student_id == current_user.id
-#         )
-#     )
-#     existing_submission = result.scalar_one_or_none()
-
-#     if existing_submission:
-#         raise HTTPException(status_code=400, detail="Anda sudah mengumpulkan tugas ini")
-
-#     extracted_text = await process_uploaded_file(file)
-
-#     return {
-#         "message": "File processed successfully",
-#         "extracted_text": extracted_text,
-#         "questions": [QuestionRead.model_validate(q) for q in assignment.questions],
-#         "note": "Silakan review teks yang diambil dan kirimkan jawaban menggunakan endpoint typing"
-#     }
+@router.post("/{assignment_id}/submit/ocr", status_code=status.HTTP_202_ACCEPTED)
+async def submit_answer_ocr(
+    assignment_id: int,
+    file: UploadFile = File(...),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_session)
+):
+    """
+    Mengumpulkan lembar jawaban hasil scan (PDF). OCR berjalan di background:
+    setiap kotak jawaban yang selesai dibaca langsung disimpan sebagai jawaban
+    soal berikutnya (urut question_order) dan dinilai, tanpa menunggu seluruh
+    PDF selesai. Progres bisa diikuti di /api/ocr/jobs/{job_id}/events dan
+    hasilnya di /{assignment_id}/my-submission.
+    """
+    result = await db.execute(
+        select(Assignment)
+        .options(selectinload(Assignment.kelas), selectinload(Assignment.questions))
+        .where(Assignment.id == assignment_id)
+    )
+    assignment = result.scalar_one_or_none()
+
+    if not assignment:
+        raise HTTPException(status_code=404, detail="Tugas tidak ditemukan")
+
+    if not assignment.is_published:
+        raise HTTPException(status_code=403, detail="Tugas belum diterbitkan")
+
+    result = await db.execute(
+        select(ClassParticipant).where(
+            ClassParticipant.kelas_id == assignment.kelas_id,
+            ClassParticipant.user_id == current_user.id
+        )
+    )
+    is_participant = result.scalar_one_or_none() is not None
+
+    if not is_participant:
+        raise HTTPException(status_code=403, detail="Tidak punya permission untuk mengumpulkan tugas di kelas ini")
+
+    if assignment.deadline and datetime.utcnow() > assignment.deadline:
+        raise HTTPException(status_code=400, detail="Batas waktu pengumpulan tugas sudah lewat")
+
+    result = await db.execute(
+        select(AssignmentSubmission).where(
+            AssignmentSubmission.assignment_id == assignment_id,
+            AssignmentSubmission.student_id == current_user.id
+        )
+    )
+    existing_submission = result.scalar_one_or_none()
+
+    if existing_submission:
+        raise HTTPException(status_code=400, detail="Anda sudah mengumpulkan tugas ini")
+
+    template_path = await find_template_path(assignment_id, db)
+    job_id, new_filename = await save_and_submit(file, current_user, template_path, keep_file=True)
+
+    submission = AssignmentSubmission(
+        assignment_id=assignment_id,
+        student_id=current_user.id,
+        submission_type=SubmissionType.OCR,
+        file_path=os.path.join(AI_DIR, "files", new_filename),
+        ocr_grading=OCRGrading(job_id=job_id)
+    )
+    db.add(submission)
+    await db.commit()
+
+    questions = sorted(assignment.questions, key=lambda q: q.question_order)
+    start_ocr_grading(submission.id, job_id, [question_payload(q) for q in questions])
+
+    return {
+        "message": "Lembar jawaban diterima; OCR dan penilaian berjalan per soal",
+        "submission_id": submission.id,
+        "job_id": job_id
+    }
 
 @router.get("/{assignment_id}/submissions", response_model=List[SubmissionResponse])
 async def get_assignment_submissions(
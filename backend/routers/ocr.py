@@ -1,176 +1,263 @@
-# from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
-# from sqlalchemy.ext.asyncio import AsyncSession
-# from typing import Optional
-# from datetime import datetime
-# import os
-# import shutil
-# import subprocess
-# import sys
-
-# from core.db import get_session
-# from core.auth import get_current_user
-# from models.user_model import User
-# from pydantic import BaseModel
-
-
-# router = APIRouter(prefix="/api/ocr", tags=["ocr"])
-
-
-# class OCRResultRead(BaseModel):
-#     success: bool
-#     message: str
-#     result_text: Optional[str] = None
-#     filename: Optional[str] = None
-#     processed_at: Optional[str] = None
-
-
-# @router.post("/upload", response_model=OCRResultRead)
-# async def upload_and_process_pdf(
-#     file: UploadFile = File(...),
-#     current_user: User = Depends(get_current_user),
-#     session: AsyncSession = Depends(get_session),
-# ):
-
-#     if not file.filename.endswith('.pdf'):
-#         raise HTTPException(
-#             status_code=status.HTTP_400_BAD_REQUEST,
-#             detail="Hanya file PDF yang diizinkan"
-#         )
-
-#     MAX_FILE_SIZE = 50 * 1024 * 1024
-
-#     file_content = await file.read()
-#     file_size = len(file_content)
-
-#     if file_size > MAX_FILE_SIZE:
-#         raise HTTPException(
-#             status_code=status.HTTP_400_BAD_REQUEST,
-#             detail=f"Ukuran file melebihi batas 50MB. File Anda adalah {file_size / (1024*1024):.2f}MB"
-#         )
-
-#     await file.seek(0)
-
-#     try:
-#         base_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-#         artificial_dir = os.path.join(base_dir, "artifcial")
-#         files_dir = os.path.join(artificial_dir, "files")
-
-#         if not os.path.exists(files_dir):
-#             os.makedirs(files_dir)
-
-#         timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-#         original_filename = file.filename.replace(" ", "_")
-#         new_filename = f"1-{timestamp}_{original_filename}"
-#         file_path = os.path.join(files_dir, new_filename)
-
-#         for existing_file in os.listdir(files_dir):
-#             if existing_file.endswith(f"_{original_filename}"):
-#                 old_file_path = os.path.join(files_dir, existing_file)
-#                 try:
-#                     os.remove(old_file_path)
-#                     print(f"[INFO] Deleted old file: {existing_file}")
-#                 except Exception as e:
-#                     print(f"[WARNING] Could not delete old file {existing_file}: {e}")
-
-#         with open(file_path, "wb") as buffer:
-#             shutil.copyfileobj(file.file, buffer)
-
-#         print(f"[INFO] File saved: {new_filename}")
-
-#         main_py_path = os.path.join(artificial_dir, "main.py")
-
-#         print("[INFO] Running OCR process...")
-
-#         venv_python = os.path.join(artificial_dir, ".venv", "Scripts", "python.exe")
-
-#         if not os.path.exists(venv_python):
-#             venv_python = sys.executable
-
-#         pdf_relative_path = f"files/{new_filename}"
-
-#         print(f"[INFO] Processing PDF: {pdf_relative_path}")
-
-#         result = subprocess.run(
-#             [venv_python, main_py_path, pdf_relative_path],
-#             cwd=artificial_dir,
-#             capture_output=True,
-#             text=True,
-#             timeout=300
-#         )
-
-#         if result.returncode != 0:
-#             print(f"[ERROR] OCR process failed: {result.stderr}")
-#             raise HTTPException(
-#                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-#                 detail=f"OCR processing failed: {result.stderr}"
-#             )
-
-#         print("[INFO] OCR process completed successfully")
-#         print(f"[OUTPUT] {result.stdout}")
-
-#         hasil_ocr_path = os.path.join(artificial_dir, "hasil_ocr.txt")
-
-#         if not os.path.exists(hasil_ocr_path):
-#             raise HTTPException(
-#                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-#                 detail="OCR result file not found"
-#             )
-
-#         with open(hasil_ocr_path, "r", encoding="utf-8") as f:
-#             ocr_result = f.read()
-
-#         return OCRResultRead(
-#             success=True,
-#             message="PDF processed successfully",
-#             result_text=ocr_result,
-#             filename=new_filename,
-#             processed_at=datetime.now().isoformat()
-#         )
-
-#     except subprocess.TimeoutExpired:
-#         raise HTTPException(
-#             status_code=status.HTTP_408_REQUEST_TIMEOUT,
-#             detail="OCR processing took too long (timeout after 5 minutes)"
-#         )
-#     except Exception as e:
-#         print(f"[ERROR] Upload and process failed: {str(e)}")
-#         raise HTTPException(
-#             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-#             detail=f"Failed to process PDF: {str(e)}"
-#         )
-
-
-# @router.get("/result", response_model=OCRResultRead)
-# async def get_latest_ocr_result(
-#     current_user: User = Depends(get_current_user),
-#     session: AsyncSession = Depends(get_session),
-# ):
-#     try:
-#         base_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-#         artificial_dir = os.path.join(base_dir, "artifcial")
-#         hasil_ocr_path = os.path.join(artificial_dir, "hasil_ocr.txt")
-
-#         if not os.path.exists(hasil_ocr_path):
-#             raise HTTPException(
-#                 status_code=status.HTTP_404_NOT_FOUND,
-#                 detail="No OCR result found"
-#             )
-
-#         with open(hasil_ocr_path, "r", encoding="utf-8") as f:
-#             ocr_result = f.read()
-
-#         mod_time = os.path.getmtime(hasil_ocr_path)
-#         processed_at = datetime.fromtimestamp(mod_time).isoformat()
-
-#         return OCRResultRead(
-#             success=True,
-#             message="OCR result retrieved successfully",
-#             result_text=ocr_result,
-#             processed_at=processed_at
-#         )
-
-#     except Exception as e:
-#         raise HTTPException(
-#             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-#             detail=f"Failed to retrieve OCR result: {str(e)}"
-#         )
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Header
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from typing import Dict, Optional
+from datetime import datetime
+from pydantic import BaseModel
+import asyncio
+import hmac
+import json
+import os
+import shutil
+
+from core.auth import get_current_user
+from core.db import get_session
+from models.user_model import User
+from models.answer_sheet_template import AnswerSheetTemplate
+from services.ocr_service import (
+    AI_DIR, OCR_METRICS, OCR_METRICS_TOKEN, OCR_TIMEOUT, submit_ocr_job, get_ocr_job, wait_ocr_job, ocr_metrics_text,
+    stream_ocr_events,
+)
+
+
+router = APIRouter(prefix="/api/ocr", tags=["ocr"])
+
+MAX_FILE_SIZE = 50 * 1024 * 1024
+
+# job_id -> user_id pemilik job, dan job terakhir tiap user (untuk /result).
+# Entri job yang sudah dilupakan pool OCR (OCR_JOB_TTL) ikut dibuang.
+JOB_OWNERS: Dict[str, int] = {}
+LATEST_JOB_BY_USER: Dict[int, str] = {}
+
+
+def prune_job_owners():
+    for job_id in [job_id for job_id in JOB_OWNERS if get_ocr_job(job_id) is None]:
+        del JOB_OWNERS[job_id]
+    for user_id in [user_id for user_id, job_id in LATEST_JOB_BY_USER.items() if job_id not in JOB_OWNERS]:
+        del LATEST_JOB_BY_USER[user_id]
+
+
+class OCRResultRead(BaseModel):
+    success: bool
+    message: str
+    result_text: Optional[str] = None
+    filename: Optional[str] = None
+    processed_at: Optional[str] = None
+    job_id: Optional[str] = None
+
+
+class OCRJobRead(BaseModel):
+    job_id: str
+    status: str
+    result_text: Optional[str] = None
+    result: Optional[Dict] = None
+    error: Optional[str] = None
+    trace: Optional[Dict] = None
+
+
+async def find_template_path(assignment_id: Optional[int], db: AsyncSession) -> Optional[str]:
+    """File template lembar jawaban milik Assignment, jika ada."""
+    if assignment_id is None:
+        return None
+    result = await db.execute(
+        select(AnswerSheetTemplate.file_path).where(AnswerSheetTemplate.assignment_id == assignment_id)
+    )
+    template_path = result.scalar_one_or_none()
+    if template_path and not os.path.exists(template_path):
+        print(f"[WARN] Template assignment {assignment_id} tidak ditemukan: {template_path}")
+        return None
+    return template_path
+
+
+async def save_and_submit(file: UploadFile, current_user: User, template_path: Optional[str] = None,
+                          keep_file: bool = False) -> tuple:
+    """
+    Menyimpan PDF upload ke ai/files lalu mengirim job OCR-nya. File upload
+    dihapus setelah job selesai, kecuali `keep_file` (mis. PDF submission
+    tugas yang path-nya disimpan di database).
+    """
+    if not file.filename.endswith('.pdf'):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Hanya file PDF yang diizinkan"
+        )
+
+    file_content = await file.read()
+    file_size = len(file_content)
+
+    if file_size > MAX_FILE_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Ukuran file melebihi batas 50MB. File Anda adalah {file_size / (1024*1024):.2f}MB"
+        )
+
+    await file.seek(0)
+
+    files_dir = os.path.join(AI_DIR, "files")
+    if not os.path.exists(files_dir):
+        os.makedirs(files_dir)
+
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    original_filename = file.filename.replace(" ", "_")
+    new_filename = f"{current_user.id}-{timestamp}_{original_filename}"
+    file_path = os.path.join(files_dir, new_filename)
+
+    with open(file_path, "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
+
+    print(f"[INFO] File saved: {new_filename}")
+
+    job_id = submit_ocr_job(file_path, template_path=template_path, delete_pdf=not keep_file)
+    prune_job_owners()
+    JOB_OWNERS[job_id] = current_user.id
+    LATEST_JOB_BY_USER[current_user.id] = job_id
+
+    print(f"[INFO] OCR job {job_id} submitted for {new_filename}")
+    return job_id, new_filename
+
+
+def get_owned_job(job_id: str, current_user: User) -> Dict:
+    if JOB_OWNERS.get(job_id) != current_user.id:
+        raise HTTPException(status_code=404, detail="OCR job tidak ditemukan")
+
+    job = get_ocr_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="OCR job tidak ditemukan")
+    return job
+
+
+@router.post("/jobs", response_model=OCRJobRead, status_code=status.HTTP_202_ACCEPTED)
+async def submit_pdf_job(
+    file: UploadFile = File(...),
+    assignment_id: Optional[int] = Form(None),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_session),
+):
+    template_path = await find_template_path(assignment_id, db)
+    job_id, _ = await save_and_submit(file, current_user, template_path)
+    return OCRJobRead(**get_owned_job(job_id, current_user))
+
+
+@router.get("/jobs/{job_id}", response_model=OCRJobRead)
+async def get_pdf_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+):
+    return OCRJobRead(**get_owned_job(job_id, current_user))
+
+
+def format_sse(event: Optional[Dict]) -> str:
+    if event is None:
+        return ": ping\n\n"
+    payload = {k: v for k, v in event.items() if k not in ("seq", "type")}
+    return f"id: {event['seq']}\nevent: {event['type']}\ndata: {json.dumps(payload)}\n\n"
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_pdf_job_events(
+    job_id: str,
+    last_event_id: Optional[int] = Header(None),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Progres job OCR sebagai Server-Sent Events selama job berjalan:
+    page_started, boxes_detected, line (teks, bbox, confidence), box_done
+    (teks kotak beserta barisnya), page_done, lalu done (berisi
+    result_text dan result terstruktur) atau failed. Klien yang tersambung ulang
+    dengan header Last-Event-ID hanya menerima event setelahnya.
+    """
+    get_owned_job(job_id, current_user)
+
+    async def event_source():
+        async for event in stream_ocr_events(job_id, since=last_event_id or 0):
+            yield format_sse(event)
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/upload", response_model=OCRResultRead)
+async def upload_and_process_pdf(
+    file: UploadFile = File(...),
+    assignment_id: Optional[int] = Form(None),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_session),
+):
+    template_path = await find_template_path(assignment_id, db)
+    job_id, new_filename = await save_and_submit(file, current_user, template_path)
+
+    try:
+        job = await wait_ocr_job(job_id, timeout=OCR_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_408_REQUEST_TIMEOUT,
+            detail=f"OCR processing took too long. Cek status di /api/ocr/jobs/{job_id}"
+        )
+
+    if job["status"] == "failed":
+        print(f"[ERROR] OCR job {job_id} failed: {job['error']}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"OCR processing failed: {job['error']}"
+        )
+
+    print(f"[INFO] OCR job {job_id} completed successfully")
+
+    return OCRResultRead(
+        success=True,
+        message="PDF processed successfully",
+        result_text=job["result_text"],
+        filename=new_filename,
+        processed_at=datetime.now().isoformat(),
+        job_id=job_id
+    )
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_ocr_metrics(authorization: Optional[str] = Header(None)):
+    """
+    Metrik pipeline OCR (waktu per tahap, counter) untuk di-scrape Prometheus.
+    Wajib header `Authorization: Bearer <OCR_METRICS_TOKEN>`.
+    """
+    if not OCR_METRICS:
+        raise HTTPException(status_code=404, detail="Metrik OCR tidak diaktifkan (OCR_METRICS=1)")
+    if not OCR_METRICS_TOKEN:
+        raise HTTPException(status_code=403, detail="OCR_METRICS_TOKEN belum diset")
+    if not hmac.compare_digest(authorization or "", f"Bearer {OCR_METRICS_TOKEN}"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token metrik OCR tidak valid",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    return PlainTextResponse(ocr_metrics_text(), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/result", response_model=OCRResultRead)
+async def get_latest_ocr_result(
+    current_user: User = Depends(get_current_user),
+):
+    job_id = LATEST_JOB_BY_USER.get(current_user.id)
+    if job_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No OCR result found"
+        )
+
+    job = get_owned_job(job_id, current_user)
+    if job["status"] != "done":
+        return OCRResultRead(
+            success=False,
+            message=f"OCR job {job['status']}",
+            job_id=job_id
+        )
+
+    return OCRResultRead(
+        success=True,
+        message="OCR result retrieved successfully",
+        result_text=job["result_text"],
+        job_id=job_id
+    )
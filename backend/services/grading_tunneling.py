@@ -1,5 +1,5 @@
-from typing import Dict
-import requests
+from typing import Dict, List
+import httpx
 import os
 
 AI_TUNNEL_URL = os.getenv("AI_TUNNEL_URL", "https://3775e9493c9d.ngrok-free.app/grade")
@@ -22,7 +22,9 @@ async def grade_question_via_tunnel(
     
     try:
         print(f"\n🔹 Calling AI tunnel for question grading...")
-        response = requests.post(AI_TUNNEL_URL, json=payload, timeout=TIMEOUT)
+        # Client async supaya menunggu tunnel tidak memblokir event loop backend
+        async with httpx.AsyncClient(timeout=TIMEOUT) as client:
+            response = await client.post(AI_TUNNEL_URL, json=payload)
         response.raise_for_status()
         result = response.json()
         
@@ -56,104 +58,66 @@ async def grade_question_via_tunnel(
             "similarity_time": similarity_time
         }
     
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         raise RuntimeError(f"AI tunnel request timed out after {TIMEOUT} seconds")
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         raise RuntimeError(f"Failed to connect to AI tunnel at {AI_TUNNEL_URL}: {e}")
     except Exception as e:
         raise RuntimeError(f"Error processing AI tunnel response: {e}")
 
 
-async def grade_submission_batch_via_tunnel(submission_data: Dict) -> Dict:
-    questions = submission_data.get("questions", [])
-    answers = submission_data.get("answers", [])
-    
-    answers_map = {a["question_id"]: a for a in answers}
-    
-    results = []
-    total_score = 0.0
-    total_points = 0
-    total_llm_time = 0.0
-    total_similarity_time = 0.0
-    
-    aggregate_pemahaman = []
-    aggregate_kelengkapan = []
-    aggregate_kejelasan = []
-    aggregate_analisis = []
-    aggregate_similarity = []
-    
-    print(f"\n{'='*60}")
-    print(f"🚀 Starting batch grading for {len(questions)} questions via AI tunnel")
-    print(f"{'='*60}")
-    
-    for idx, question in enumerate(questions, 1):
-        question_id = question["question_id"]
-        question_text = question["question_text"]
-        reference_answer = question["reference_answer"]
-        points = question["points"]
-        
-        answer_data = answers_map.get(question_id)
-        student_answer = answer_data["answer_text"] if answer_data else ""
-        
-        print(f"\n📝 Grading Question {idx}/{len(questions)} (ID: {question_id}, Points: {points})")
-        
-        try:
-            grading_result = await grade_question_via_tunnel(
-                question_text=question_text,
-                reference_answer=reference_answer,
-                student_answer=student_answer,
-                question_points=points
-            )
-            
-            results.append({
-                "question_id": question_id,
-                "final_score": grading_result["final_score"],
-                "feedback": grading_result["feedback"],
-                "rubric_scores": grading_result["rubric_scores"],
-                "embedding_similarity": grading_result["embedding_similarity"],
-                "llm_time": grading_result["llm_time"],
-                "similarity_time": grading_result["similarity_time"]
-            })
-            
-            total_score += grading_result["final_score"]
-            total_points += points
-            total_llm_time += grading_result["llm_time"]
-            total_similarity_time += grading_result["similarity_time"]
-            
-            aggregate_pemahaman.append(grading_result["rubric_scores"]["pemahaman"])
-            aggregate_kelengkapan.append(grading_result["rubric_scores"]["kelengkapan"])
-            aggregate_kejelasan.append(grading_result["rubric_scores"]["kejelasan"])
-            aggregate_analisis.append(grading_result["rubric_scores"]["analisis"])
-            aggregate_similarity.append(grading_result["embedding_similarity"])
-        
-        except Exception as e:
-            print(f"❌ Error grading question {question_id}: {e}")
-            results.append({
-                "question_id": question_id,
-                "final_score": 0.0,
-                "feedback": f"Grading failed: {str(e)}",
-                "rubric_scores": {
-                    "pemahaman": 0.0,
-                    "kelengkapan": 0.0,
-                    "kejelasan": 0.0,
-                    "analisis": 0.0,
-                    "rata_rata": 0.0
-                },
-                "embedding_similarity": 0.0,
-                "llm_time": 0.0,
-                "similarity_time": 0.0
-            })
-            total_points += points
-    
-    percentage = round((total_score / total_points * 100), 2) if total_points > 0 else 0.0
+def failed_grading_result(question_id: int, error: Exception) -> Dict:
+    return {
+        "question_id": question_id,
+        "final_score": 0.0,
+        "feedback": f"Grading failed: {str(error)}",
+        "rubric_scores": {
+            "pemahaman": 0.0,
+            "kelengkapan": 0.0,
+            "kejelasan": 0.0,
+            "analisis": 0.0,
+            "rata_rata": 0.0
+        },
+        "embedding_similarity": 0.0,
+        "llm_time": 0.0,
+        "similarity_time": 0.0
+    }
+
+
+async def grade_answer_via_tunnel(question: Dict, student_answer: str) -> Dict:
+    """Menilai satu jawaban; jika gagal, hasilnya bernilai 0 dengan pesan error di feedback."""
+    question_id = question["question_id"]
+    try:
+        grading_result = await grade_question_via_tunnel(
+            question_text=question["question_text"],
+            reference_answer=question["reference_answer"],
+            student_answer=student_answer,
+            question_points=question["points"]
+        )
+        return {"question_id": question_id, **grading_result}
+    except Exception as e:
+        print(f"❌ Error grading question {question_id}: {e}")
+        return failed_grading_result(question_id, e)
+
+
+def summarize_grading(questions: List[Dict], results: List[Dict]) -> Dict:
+    """Nilai total dan rata-rata rubrik dari hasil per soal (soal yang gagal dihitung 0)."""
+    total_score = sum(r["final_score"] for r in results)
+    total_points = sum(q["points"] for q in questions)
+    total_llm_time = sum(r["llm_time"] for r in results)
+    total_similarity_time = sum(r["similarity_time"] for r in results)
     num_questions = len(questions)
-    
-    avg_pemahaman = round(sum(aggregate_pemahaman) / num_questions, 2) if num_questions > 0 else 0.0
-    avg_kelengkapan = round(sum(aggregate_kelengkapan) / num_questions, 2) if num_questions > 0 else 0.0
-    avg_kejelasan = round(sum(aggregate_kejelasan) / num_questions, 2) if num_questions > 0 else 0.0
-    avg_analisis = round(sum(aggregate_analisis) / num_questions, 2) if num_questions > 0 else 0.0
-    avg_similarity = round(sum(aggregate_similarity) / num_questions, 2) if num_questions > 0 else 0.0
-    
+
+    def average(values):
+        return round(sum(values) / num_questions, 2) if num_questions > 0 else 0.0
+
+    percentage = round((total_score / total_points * 100), 2) if total_points > 0 else 0.0
+    avg_pemahaman = average(r["rubric_scores"]["pemahaman"] for r in results)
+    avg_kelengkapan = average(r["rubric_scores"]["kelengkapan"] for r in results)
+    avg_kejelasan = average(r["rubric_scores"]["kejelasan"] for r in results)
+    avg_analisis = average(r["rubric_scores"]["analisis"] for r in results)
+    avg_similarity = average(r["embedding_similarity"] for r in results)
+
     print(f"\n{'='*60}")
     print(f"🏁 BATCH GRADING COMPLETED")
     print(f"{'='*60}")
@@ -162,7 +126,7 @@ async def grade_submission_batch_via_tunnel(submission_data: Dict) -> Dict:
     print(f"📊 Avg Similarity: {avg_similarity}")
     print(f"⏱️  Total Time - LLM: {round(total_llm_time, 3)}s, Similarity: {round(total_similarity_time, 3)}s")
     print(f"{'='*60}\n")
-    
+
     return {
         "results": results,
         "total_score": round(total_score, 2),
@@ -179,3 +143,23 @@ async def grade_submission_batch_via_tunnel(submission_data: Dict) -> Dict:
         "total_similarity_time": round(total_similarity_time, 3)
     }
 
+
+async def grade_submission_batch_via_tunnel(submission_data: Dict) -> Dict:
+    questions = submission_data.get("questions", [])
+    answers = submission_data.get("answers", [])
+
+    answers_map = {a["question_id"]: a for a in answers}
+
+    print(f"\n{'='*60}")
+    print(f"🚀 Starting batch grading for {len(questions)} questions via AI tunnel")
+    print(f"{'='*60}")
+
+    results = []
+    for idx, question in enumerate(questions, 1):
+        answer_data = answers_map.get(question["question_id"])
+        student_answer = answer_data["answer_text"] if answer_data else ""
+
+        print(f"\n📝 Grading Question {idx}/{len(questions)} (ID: {question['question_id']}, Points: {question['points']})")
+        results.append(await grade_answer_via_tunnel(question, student_answer))
+
+    return summarize_grading(questions, results)
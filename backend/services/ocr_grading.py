@@ -0,0 +1,278 @@
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import os
+
+from sqlalchemy import select, delete
+from sqlalchemy.orm import selectinload
+
+from core.db import SessionLocal
+from models.assignment_submission import AssignmentSubmission
+from models.answer_sheet_template import AnswerSheetTemplate
+from models.question import Question
+from models.question_answer import QuestionAnswer
+from models.nilai import Nilai
+from models.ocr_grading import OCRGrading, OCRGradingStatus
+from services.ocr_service import stream_ocr_events, submit_ocr_job
+from services.grading_tunneling import grade_answer_via_tunnel, summarize_grading
+
+# Task background yang sedang berjalan (dijaga referensinya agar tidak di-GC)
+RUNNING_TASKS = set()
+# Batas percobaan penilaian satu submission (termasuk yang dilanjutkan saat startup)
+OCR_GRADING_MAX_ATTEMPTS = int(os.getenv("OCR_GRADING_MAX_ATTEMPTS", "3"))
+
+
+class BoxOrdinals:
+    """
+    Memetakan `(page, box)` ke nomor urut kotak jawaban di seluruh PDF.
+    Nomor urut baru bisa dihitung setelah jumlah kotak semua halaman
+    sebelumnya diketahui (event boxes_detected); halaman text layer dan
+    halaman OCR tidak selalu selesai berurutan.
+    """
+
+    def __init__(self):
+        self.boxes_per_page: Dict[int, int] = {}
+        self.pending: Dict[Tuple[int, int], Dict] = {}
+
+    def add_page(self, page: int, n_boxes: int):
+        self.boxes_per_page[page] = n_boxes
+
+    def add_box(self, event: Dict) -> List[Tuple[int, Dict]]:
+        """Menyimpan event box_done; mengembalikan `(ordinal, event)` yang sudah bisa dipetakan."""
+        self.pending[(event["page"], event["box"])] = event
+        ready = []
+        for (page, box), box_event in sorted(self.pending.items()):
+            if any(p not in self.boxes_per_page for p in range(page)):
+                break
+            ready.append((sum(self.boxes_per_page[p] for p in range(page)) + box, box_event))
+            del self.pending[(page, box)]
+        return ready
+
+
+def result_boxes(result: Dict) -> List[Tuple[int, Dict]]:
+    """`(ordinal, box)` semua kotak jawaban dari hasil terstruktur job OCR (urut halaman lalu kotak)."""
+    boxes = [box for page in sorted(result.get("pages", []), key=lambda p: p["page"]) for box in page["boxes"]]
+    return list(enumerate(boxes))
+
+
+def question_payload(question) -> Dict:
+    return {
+        "question_id": question.id,
+        "question_text": question.question_text,
+        "reference_answer": question.reference_answer,
+        "points": question.points
+    }
+
+
+async def save_answer(submission_id: int, question: Dict, answer_text: str) -> int:
+    async with SessionLocal() as db:
+        question_answer = QuestionAnswer(
+            submission_id=submission_id,
+            question_id=question["question_id"],
+            answer_text=answer_text
+        )
+        db.add(question_answer)
+        await db.commit()
+        return question_answer.id
+
+
+async def grade_answer(answer_id: int, question: Dict, answer_text: str) -> Dict:
+    """Menilai satu QuestionAnswer lalu menyimpan skor dan rubriknya."""
+    result_item = await grade_answer_via_tunnel(question, answer_text)
+    async with SessionLocal() as db:
+        question_answer = await db.get(QuestionAnswer, answer_id)
+        question_answer.final_score = result_item["final_score"]
+        question_answer.feedback = result_item["feedback"]
+        question_answer.rubric_pemahaman = result_item["rubric_scores"]["pemahaman"]
+        question_answer.rubric_kelengkapan = result_item["rubric_scores"]["kelengkapan"]
+        question_answer.rubric_kejelasan = result_item["rubric_scores"]["kejelasan"]
+        question_answer.rubric_analisis = result_item["rubric_scores"]["analisis"]
+        question_answer.rubric_rata_rata = result_item["rubric_scores"]["rata_rata"]
+        question_answer.embedding_similarity = result_item["embedding_similarity"]
+        question_answer.llm_time = result_item["llm_time"]
+        question_answer.similarity_time = result_item["similarity_time"]
+        await db.commit()
+    return result_item
+
+
+async def save_nilai(submission_id: int, grading_result: Dict):
+    async with SessionLocal() as db:
+        result = await db.execute(select(Nilai).where(Nilai.submission_id == submission_id))
+        if result.scalar_one_or_none() is not None:
+            return
+        db.add(Nilai(
+            submission_id=submission_id,
+            total_score=grading_result["total_score"],
+            max_score=grading_result["total_points"],
+            percentage=grading_result["percentage"],
+            avg_pemahaman=grading_result["aggregate_rubrics"]["pemahaman"],
+            avg_kelengkapan=grading_result["aggregate_rubrics"]["kelengkapan"],
+            avg_kejelasan=grading_result["aggregate_rubrics"]["kejelasan"],
+            avg_analisis=grading_result["aggregate_rubrics"]["analisis"],
+            avg_embedding_similarity=grading_result["aggregate_rubrics"]["avg_embedding_similarity"],
+            total_llm_time=grading_result["total_llm_time"],
+            total_similarity_time=grading_result["total_similarity_time"]
+        ))
+        await db.commit()
+
+
+async def grade_ocr_submission(submission_id: int, job_id: str, questions: List[Dict]):
+    """
+    Mengikuti progres job OCR sebuah submission: setiap kotak jawaban yang
+    selesai (event box_done) langsung disimpan sebagai QuestionAnswer untuk
+    soal ke-n (urut `question_order`) dan dinilai, sementara kotak lain masih
+    di-OCR. Kotak yang tidak sempat datang lewat event (mis. hasil PDF
+    diambil dari cache OCR, sehingga stream hanya berisi "done") diambil
+    dari hasil terstruktur di event "done". Setelah itu, soal tanpa kotak
+    disimpan sebagai jawaban kosong dan Nilai dihitung seperti penilaian
+    batch; jika job gagal, Nilai tidak dibuat.
+
+    Mengembalikan pesan error job OCR yang gagal, atau None jika selesai.
+    """
+    ordinals = BoxOrdinals()
+    grading = {}
+    failed: Optional[str] = None
+
+    async def answer_question(question: Dict, answer_text: str) -> Dict:
+        answer_id = await save_answer(submission_id, question, answer_text)
+        return await grade_answer(answer_id, question, answer_text)
+
+    def start_answer(ordinal: int, box: Dict):
+        if ordinal in grading:
+            return
+        if ordinal >= len(questions):
+            print(f"[WARN] Submission {submission_id}: kotak ke-{ordinal + 1} tidak punya soal; dilewati.")
+            return
+        print(f"[INFO] Submission {submission_id}: jawaban soal {ordinal + 1} siap dinilai "
+              f"(kotak {box['box']}, confidence {box['confidence']})")
+        grading[ordinal] = asyncio.create_task(answer_question(questions[ordinal], box["text"]))
+
+    async for event in stream_ocr_events(job_id):
+        if event is None:
+            continue
+        if event["type"] == "boxes_detected":
+            ordinals.add_page(event["page"], event["boxes"])
+        elif event["type"] == "box_done":
+            for ordinal, box in ordinals.add_box(event):
+                start_answer(ordinal, box)
+        elif event["type"] == "failed":
+            failed = event.get("error")
+            break
+        elif event["type"] == "done":
+            for ordinal, box in result_boxes(event.get("result") or {}):
+                start_answer(ordinal, box)
+            break
+
+    if failed is not None:
+        # Jawaban yang sudah terbaca tetap dinilai, tetapi Nilai tidak dibuat
+        await asyncio.gather(*grading.values())
+        print(f"[ERROR] OCR job {job_id} (submission {submission_id}) failed: {failed}")
+        return failed
+
+    for ordinal, question in enumerate(questions):
+        if ordinal not in grading:
+            print(f"[WARN] Submission {submission_id}: soal {ordinal + 1} tidak punya kotak jawaban; dinilai kosong.")
+            grading[ordinal] = asyncio.create_task(answer_question(question, ""))
+
+    results = list(await asyncio.gather(*(grading[ordinal] for ordinal in range(len(questions)))))
+    await save_nilai(submission_id, summarize_grading(questions, results))
+    print(f"[INFO] Submission {submission_id} (OCR job {job_id}) selesai dinilai.")
+    return None
+
+
+async def set_grading_status(submission_id: int, status: OCRGradingStatus, error: Optional[str] = None):
+    async with SessionLocal() as db:
+        result = await db.execute(select(OCRGrading).where(OCRGrading.submission_id == submission_id))
+        grading = result.scalar_one_or_none()
+        if grading is None:
+            return
+        grading.status = status
+        grading.error = error
+        await db.commit()
+
+
+async def run_ocr_grading(submission_id: int, job_id: str, questions: List[Dict]):
+    """
+    `grade_ocr_submission` plus pencatatan status di tabel ocr_gradings.
+    Task yang dibatalkan (backend berhenti) dibiarkan RUNNING supaya
+    dilanjutkan `resume_ocr_gradings` saat startup berikutnya.
+    """
+    try:
+        failed = await grade_ocr_submission(submission_id, job_id, questions)
+    except Exception as e:
+        await set_grading_status(submission_id, OCRGradingStatus.FAILED, str(e))
+        raise
+    if failed is None:
+        await set_grading_status(submission_id, OCRGradingStatus.DONE)
+    else:
+        await set_grading_status(submission_id, OCRGradingStatus.FAILED, failed)
+
+
+def start_ocr_grading(submission_id: int, job_id: str, questions: List[Dict]):
+    """Menjalankan `run_ocr_grading` di background event loop backend."""
+    task = asyncio.create_task(run_ocr_grading(submission_id, job_id, questions))
+    RUNNING_TASKS.add(task)
+    task.add_done_callback(on_grading_done)
+    return task
+
+
+async def resume_ocr_gradings():
+    """
+    Dipanggil saat startup backend: penilaian OCR yang masih RUNNING (task
+    hilang karena backend restart/crash) diulang dari awal dengan job OCR
+    baru. Jawaban parsial dihapus lebih dulu. Submission yang file PDF-nya
+    hilang atau sudah mencapai OCR_GRADING_MAX_ATTEMPTS ditandai FAILED.
+    """
+    async with SessionLocal() as db:
+        result = await db.execute(
+            select(OCRGrading)
+            .options(selectinload(OCRGrading.submission))
+            .where(OCRGrading.status == OCRGradingStatus.RUNNING)
+        )
+        gradings = result.scalars().all()
+        resumed = []
+
+        for grading in gradings:
+            submission = grading.submission
+            if not submission.file_path or not os.path.exists(submission.file_path):
+                grading.status = OCRGradingStatus.FAILED
+                grading.error = "File PDF submission tidak ditemukan"
+            elif grading.attempts >= OCR_GRADING_MAX_ATTEMPTS:
+                grading.status = OCRGradingStatus.FAILED
+                grading.error = f"Penilaian terhenti setelah {grading.attempts} percobaan"
+            else:
+                await db.execute(delete(QuestionAnswer).where(QuestionAnswer.submission_id == submission.id))
+                await db.execute(delete(Nilai).where(Nilai.submission_id == submission.id))
+
+                result = await db.execute(
+                    select(AnswerSheetTemplate.file_path)
+                    .where(AnswerSheetTemplate.assignment_id == submission.assignment_id)
+                )
+                template_path = result.scalar_one_or_none()
+                if template_path and not os.path.exists(template_path):
+                    template_path = None
+
+                result = await db.execute(
+                    select(Question)
+                    .where(Question.assignment_id == submission.assignment_id)
+                    .order_by(Question.question_order)
+                )
+                questions = [question_payload(q) for q in result.scalars().all()]
+
+                grading.job_id = submit_ocr_job(submission.file_path, template_path=template_path)
+                grading.attempts += 1
+                resumed.append((submission.id, grading.job_id, questions))
+
+            if grading.status == OCRGradingStatus.FAILED:
+                print(f"[WARN] Penilaian OCR submission {submission.id} ditandai gagal: {grading.error}")
+
+        await db.commit()
+
+    for submission_id, job_id, questions in resumed:
+        print(f"[INFO] Melanjutkan penilaian OCR submission {submission_id} (OCR job {job_id})")
+        start_ocr_grading(submission_id, job_id, questions)
+
+
+def on_grading_done(task):
+    RUNNING_TASKS.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"[ERROR] Penilaian OCR gagal: {task.exception()}")
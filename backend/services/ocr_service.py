@@ -1,30 +1,68 @@
-# from typing import Dict
-# from fastapi import UploadFile
-
-# async def extract_text_from_pdf(file: UploadFile) -> Dict[str, any]:
-#     return {
-#         "text": "This is extracted text from PDF. Implement OCR logic here.",
-#         "pages": 1,
-#         "confidence": 0.95,
-#         "status": "success"
-#     }
-
-# async def extract_text_from_image(file: UploadFile) -> Dict[str, any]:
-#     return {
-#         "text": "This is extracted text from image. Implement OCR logic here.",
-#         "confidence": 0.95,
-#         "status": "success"
-#     }
-
-# async def process_uploaded_file(file: UploadFile) -> str:
-#     file_extension = file.filename.split(".")[-1].lower()
-
-#     if file_extension == "pdf":
-#         result = await extract_text_from_pdf(file)
-#     elif file_extension in ["jpg", "jpeg", "png"]:
-#         result = await extract_text_from_image(file)
-#     else:
-#         return "Unsupported file format"
-
-#     return result.get("text", "")
+from typing import AsyncIterator, Dict, List, Optional
+import os
+import sys
 
+AI_DIR = os.path.abspath(os.getenv(
+    "AI_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "ai")
+))
+# 0 = dari hasil auto-tuner ai/inference_profile.py (atau 1 worker)
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "0"))
+OCR_TIMEOUT = int(os.getenv("OCR_TIMEOUT", "300"))
+OCR_METRICS = os.getenv("OCR_METRICS", "0") == "1"
+# Token Bearer untuk /api/ocr/metrics; kosong = endpoint metrik selalu ditolak
+OCR_METRICS_TOKEN = os.getenv("OCR_METRICS_TOKEN", "")
+
+OCR_POOL = None
+
+def get_ocr_pool():
+    """Pool worker OCR dibuat sekali (saat startup lewat `start_ocr_pool`) dan dipakai ulang oleh semua request."""
+    global OCR_POOL
+    if OCR_POOL is None:
+        if AI_DIR not in sys.path:
+            sys.path.insert(0, AI_DIR)
+        from ocr_worker import OCRWorkerPool
+
+        OCR_POOL = OCRWorkerPool(num_workers=OCR_WORKERS)
+        profile = OCR_POOL.profile
+        print(f"\n🧠 Menyalakan {OCR_POOL.num_workers} OCR worker x {profile['torch_threads']} thread dari {AI_DIR}...")
+    return OCR_POOL
+
+def start_ocr_pool():
+    """Dipanggil saat startup backend: pool dan model OCR disiapkan sebelum request pertama."""
+    get_ocr_pool().start()
+
+def submit_ocr_job(pdf_path: str, template_path: Optional[str] = None, delete_pdf: bool = False) -> str:
+    """Mengirim job OCR; dengan `delete_pdf`, file PDF dihapus setelah job selesai/gagal."""
+    return get_ocr_pool().submit(pdf_path, template_path=template_path, delete_pdf=delete_pdf)
+
+def get_ocr_job(job_id: str) -> Optional[Dict]:
+    return get_ocr_pool().get_job(job_id)
+
+def template_path_for(assignment_id: int) -> str:
+    """Lokasi file template lembar jawaban (.npz) untuk sebuah Assignment."""
+    return os.path.join(AI_DIR, "templates", f"assignment-{assignment_id}.npz")
+
+async def build_sheet_template(pdf_path: str, out_path: str, boxes: Optional[List] = None) -> Dict:
+    """Membangun template lembar jawaban di worker OCR; mengembalikan ringkasan layout."""
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    return await get_ocr_pool().build_template(pdf_path, out_path, boxes=boxes)
+
+async def wait_ocr_job(job_id: str, timeout: int = OCR_TIMEOUT) -> Dict:
+    return await get_ocr_pool().wait(job_id, timeout=timeout)
+
+def stream_ocr_events(job_id: str, since: int = 0) -> AsyncIterator[Optional[Dict]]:
+    """Event progres job OCR (None = keepalive); lihat `OCRWorkerPool.stream_events`."""
+    return get_ocr_pool().stream_events(job_id, since=since)
+
+def ocr_metrics_text() -> str:
+    """Metrik OCR (format Prometheus); kosong selama pool belum pernah dipakai."""
+    if OCR_POOL is None:
+        return ""
+    return OCR_POOL.metrics_text()
+
+def shutdown_ocr_pool():
+    global OCR_POOL
+    if OCR_POOL is not None:
+        OCR_POOL.shutdown(wait=False)
+        OCR_POOL = None
@@ -345,6 +345,7 @@ export interface OCRResultRead {
     result_text?: string;
     filename?: string;
     processed_at?: string;
+    job_id?: string;
 }
 
 // ==================== DASHBOARD TYPES ====================